@@ -16,22 +16,223 @@
 # You should have received a copy of the GNU General Public License
 # along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, send_file, abort, g
 from flask_cors import CORS
 import requests
 import json
 import time
 import os
+import sys
+import socket
 import subprocess
 import threading
+import logging
+import queue
 from datetime import datetime
+from ollama_client import OllamaClient
+from conversation_store import ConversationStore
+from context_manager import ContextManager, estimate_tokens, parse_model_contexts
+from response_cache import ResponseCache
+import shared_state as state_backends
+from download_manager import DownloadManager, ACTIVE_STATUSES
+from event_bus import EventBus
+from model_catalog import ModelCatalog
+from model_search import SearchIndex
+import http_cache
+from assets import AssetPipeline
+from scheduler import ChatScheduler, SchedulerFull
+from residency import ResidencyManager
+from backend_pool import BackendPool
+from batch_jobs import BatchManager, BatchInputError
+from document_index import DocumentIndex, EmbeddingError, EMBED_BATCH, numpy_available
+from generations import GenerationRegistry, new_generation_id
+from metrics import MetricsRegistry, FAST_BUCKETS, RATE_BUCKETS
+from log_config import configure_logging
 
 app = Flask(__name__)
 app.secret_key = 'ollamagui-secret-key-2024'
-CORS(app)
+CORS(app, expose_headers=['X-Conversation-Id', 'X-Cache', 'X-Generation-Id'])
 
-OLLAMA_URL = "http://localhost:11434"
+# Logs: nível em OLLAMAGUI_LOG_LEVEL, formato em OLLAMAGUI_LOG_FORMAT (text ou json)
+configure_logging()
+logger = logging.getLogger('ollamagui')
+
+OLLAMA_URL = os.environ.get('OLLAMA_URL', "http://localhost:11434")
+# Vários servidores Ollama: OLLAMA_URLS="http://gpu1:11434,http://gpu2:11434"
+OLLAMA_URLS = [url.strip() for url in os.environ.get('OLLAMA_URLS', OLLAMA_URL).split(',') if url.strip()]
+OLLAMA_URL = OLLAMA_URLS[0]
 OLLAMA_LIBRARY_URL = "https://ollama.com/library"
+OLLAMA_WEB_URL = "https://ollama.com"
+
+# Dados persistentes (conversas, caches)
+DATA_DIR = os.environ.get('OLLAMAGUI_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+STATE_PATH = os.path.join(DATA_DIR, 'state.db')
+
+# Estado compartilhado (downloads, catálogo, conexão): 'memory' para um único
+# processo, 'sqlite' quando há vários workers
+shared_state = state_backends.create_backend(os.environ.get('OLLAMAGUI_STATE_BACKEND', 'memory'), STATE_PATH)
+
+def configure_shared_state(kind):
+    """Troca o backend de estado (chamado antes de iniciar os workers)"""
+    global shared_state
+    shared_state = state_backends.create_backend(kind, STATE_PATH)
+    download_manager.state = shared_state
+    event_bus.state = shared_state
+    model_catalog.state = shared_state
+    residency.state = shared_state
+    ollama.state = shared_state
+    metrics.state = shared_state
+    batch_manager.state = shared_state
+    generations.state = shared_state
+    if document_index:
+        document_index.state = shared_state
+
+# Namespaces que só descrevem processos em execução; descartados ao iniciar
+RUNTIME_NAMESPACES = ('connection', 'generations', 'chat_cancel', 'download_cancel', 'residency_loading')
+
+def reset_runtime_state():
+    """Limpa concessões e estado deixados por uma execução anterior (antes dos workers)"""
+    shared_state.clear_runtime(RUNTIME_NAMESPACES)
+    download_manager.fail_interrupted()
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def ollama_client(url):
+    return OllamaClient(
+        url,
+        pool_size=int(os.environ.get('OLLAMA_POOL_SIZE', 32)),
+        connect_timeout=float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.environ.get('OLLAMA_READ_TIMEOUT', 120)),
+        retries=int(os.environ.get('OLLAMA_RETRIES', 2))
+    )
+
+# Clientes HTTP compartilhados (pool de conexões keep-alive). `ollama` reparte
+# as requisições entre os servidores de OLLAMA_URLS pelo modelo pedido
+ollama = BackendPool(OLLAMA_URLS, shared_state, ollama_client)
+ollama_web = OllamaClient(OLLAMA_WEB_URL, pool_size=4, read_timeout=10)
+
+# Eventos em tempo real (downloads, conexão, modelos instalados) para /api/events
+event_bus = EventBus(shared_state)
+conversation_store = ConversationStore(os.path.join(DATA_DIR, 'conversations.db'))
+
+# Orçamento de contexto por modelo (OLLAMA_MODEL_NUM_CTX="modelo=8192,outro=32768")
+context_manager = ContextManager(
+    conversation_store,
+    ollama,
+    default_num_ctx=int(os.environ.get('OLLAMA_NUM_CTX', 4096)),
+    model_contexts=parse_model_contexts(os.environ.get('OLLAMA_MODEL_NUM_CTX')),
+    summary_model=os.environ.get('OLLAMA_SUMMARY_MODEL')
+)
+
+# Cache de respostas determinísticas (opt-in por requisição com "cache": true)
+response_cache = ResponseCache(
+    os.path.join(DATA_DIR, 'response_cache.db'),
+    max_memory_bytes=int(os.environ.get('RESPONSE_CACHE_MEMORY_MB', 32)) * 1024 * 1024,
+    max_disk_entries=int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+)
+
+# Fila de gerações entre as rotas e o Ollama: OLLAMA_NUM_PARALLEL deve refletir
+# os slots paralelos do servidor Ollama
+chat_scheduler = ChatScheduler(
+    max_concurrent=int(os.environ.get('OLLAMAGUI_MAX_CONCURRENT', 8)),
+    per_model=int(os.environ.get('OLLAMA_NUM_PARALLEL', 4)),
+    max_queue=int(os.environ.get('OLLAMAGUI_MAX_QUEUE', 32))
+)
+# Gerações em andamento, canceláveis por POST /api/chat/<id>/cancel
+generations = GenerationRegistry(shared_state, owner=worker_id)
+QUEUE_TIMEOUT = int(os.environ.get('OLLAMAGUI_QUEUE_TIMEOUT', 300))  # espera máxima na fila (s)
+QUEUE_UPDATE_INTERVAL = 1  # intervalo entre avisos de posição na fila (s)
+
+def configure_scheduler(workers):
+    """Divide os limites entre os workers (chamado antes do fork).
+
+    Cada worker tem o próprio agendador e fica com pelo menos um slot: com mais
+    workers que OLLAMA_NUM_PARALLEL (ou OLLAMAGUI_MAX_CONCURRENT), o total
+    efetivo é de um slot por worker, acima do configurado.
+    """
+    for name, limit in (('OLLAMA_NUM_PARALLEL', chat_scheduler.per_model),
+                        ('OLLAMAGUI_MAX_CONCURRENT', chat_scheduler.max_concurrent)):
+        if workers > limit:
+            logger.warning("⚠️  %s=%d é menor que o número de workers (%d): o limite vale por worker, "
+                           "até %d gerações simultâneas no total", name, limit, workers, workers)
+    chat_scheduler.max_concurrent = max(1, chat_scheduler.max_concurrent // workers)
+    chat_scheduler.per_model = max(1, chat_scheduler.per_model // workers)
+    chat_scheduler.max_queue = max(1, chat_scheduler.max_queue // workers)
+
+def client_key(forwarded_for, remote_addr):
+    """Identifica o usuário para o rodízio da fila (IP do cliente)"""
+    if forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'anonymous'
+
+def queue_full_payload(error):
+    return {'error': f'{error} - tente novamente em {error.retry_after}s', 'retry_after': error.retry_after}
+
+def queue_event(position):
+    return sse_event({'queued': True, 'position': position, 'done': False})
+
+# Métricas no formato do Prometheus (GET /metrics), somadas entre os workers
+metrics = MetricsRegistry(shared_state, owner=worker_id)
+chat_requests = metrics.counter(
+    'ollamagui_chat_requests_total', 'Pedidos de chat por modelo e resultado', ('model', 'status'))
+chat_queue_wait = metrics.histogram(
+    'ollamagui_chat_queue_wait_seconds', 'Espera na fila do agendador antes de chamar o Ollama', ('model',))
+chat_ttft = metrics.histogram(
+    'ollamagui_chat_ttft_seconds', 'Tempo do envio ao Ollama até o primeiro token', ('model',))
+chat_latency = metrics.histogram(
+    'ollamagui_chat_duration_seconds', 'Tempo do envio ao Ollama até o último token', ('model',))
+chat_load = metrics.histogram(
+    'ollamagui_chat_load_seconds', 'Carregamento do modelo informado pelo Ollama (load_duration)', ('model',))
+chat_prompt_eval = metrics.histogram(
+    'ollamagui_chat_prompt_eval_seconds', 'Processamento do prompt informado pelo Ollama (prompt_eval_duration)',
+    ('model',))
+chat_tokens_per_second = metrics.histogram(
+    'ollamagui_chat_tokens_per_second', 'Velocidade de geração (eval_count / eval_duration)', ('model',),
+    buckets=RATE_BUCKETS)
+chat_tokens = metrics.counter(
+    'ollamagui_chat_tokens_total', 'Tokens processados pelo Ollama (prompt ou resposta)', ('model', 'kind'))
+chat_cancelled = metrics.counter(
+    'ollamagui_chat_cancelled_total', 'Gerações interrompidas, por motivo (user ou disconnect)', ('model', 'reason'))
+chat_wasted_tokens = metrics.counter(
+    'ollamagui_chat_wasted_tokens_total', 'Tokens gerados em respostas interrompidas antes do fim',
+    ('model', 'reason'))
+upstream_errors = metrics.counter(
+    'ollamagui_upstream_errors_total', 'Erros nas chamadas de chat ao Ollama, por tipo', ('kind',))
+http_requests = metrics.counter(
+    'ollamagui_http_requests_total', 'Requisições HTTP por rota e status', ('method', 'endpoint', 'status'))
+http_latency = metrics.histogram(
+    'ollamagui_http_request_duration_seconds', 'Duração das requisições HTTP (exceto streams SSE)', ('endpoint',))
+metrics.gauge(
+    'ollamagui_chat_queue_depth', 'Pedidos aguardando na fila do agendador, por modelo', ('model',),
+    collect=lambda: {(model,): entry['queued'] for model, entry in chat_scheduler.stats()['models'].items()})
+metrics.gauge(
+    'ollamagui_chat_active', 'Gerações em andamento, por modelo', ('model',),
+    collect=lambda: {(model,): entry['active'] for model, entry in chat_scheduler.stats()['models'].items()})
+
+def record_chat_error(model, kind):
+    """Conta uma falha na chamada ao Ollama (timeout, conexão, HTTP, stream...)"""
+    upstream_errors.inc(kind=kind)
+    chat_requests.inc(model=model, status='error')
+
+def record_ticket(ticket):
+    """Tempo de fila de cada pedido, registrado quando o agendador o libera"""
+    if ticket.background:
+        return  # Itens de jobs em lote têm métricas próprias
+    if ticket.granted:
+        chat_queue_wait.observe(ticket.started_at - ticket.enqueued_at, model=ticket.model)
+    else:
+        chat_requests.inc(model=ticket.model, status='abandoned')
+
+chat_scheduler.on_release = record_ticket
+# Resumos de conversas longas só ocupam slots ociosos, como os jobs em lote
+context_manager.scheduler = chat_scheduler
+
+# Opções de amostragem aceitas do cliente e repassadas ao Ollama
+SAMPLING_OPTIONS = ('temperature', 'seed', 'top_p', 'top_k', 'min_p', 'num_predict', 'repeat_penalty', 'stop')
+
+# Modelos por pedido de /api/compare
+MAX_COMPARE_MODELS = int(os.environ.get('OLLAMAGUI_MAX_COMPARE_MODELS', 4))
 
 # Sistema de Internacionalização
 LANGUAGES = {
@@ -60,17 +261,39 @@ LANGUAGES = {
         'error_loading': 'Erro ao carregar',
         'download_model': 'Baixar Modelo',
         'available_models': 'Modelos Disponíveis',
+        'download_queued': 'Na fila para download',
+        'queued': 'Na fila',
+        'compare_text': 'Comparar',
+        'compare_pick': 'Escolha ao menos dois modelos para comparar',
+        'fastest': 'mais rápido',
+        'stop_generation': 'Parar geração',
+        'generation_stopped': 'Geração interrompida',
+        'attach_document': 'Adicionar documento',
+        'use_documents': 'Usar documentos',
+        'document_indexed': 'Documento indexado',
+        'document_error': 'Erro ao indexar documento',
+        'sources': 'Fontes',
+        'documents_prefix': 'Trechos dos documentos do usuário. Use-os quando forem relevantes para a pergunta e cite o nome do documento; se não bastarem, diga isso.',
+        'model_loading': 'Carregando modelo na memória...',
+        'model_warm': 'Modelo pronto',
         'download_started': 'Download iniciado',
+        'download_cancelled': 'Download cancelado',
         'download_complete': 'Download completo',
         'download_error': 'Erro no download',
+        'download_interrupted': 'interrompido pelo reinício do servidor',
         'search_models': 'Buscar Modelos',
         'popular_models': 'Modelos Populares',
         'new_models': 'Novos Modelos',
         'model_size': 'Tamanho',
         'model_pulls': 'Downloads',
         'install': 'Instalar',
+        'cancel': 'Cancelar',
         'installing': 'Instalando...',
         'installed': 'Instalado',
+        'role_user': 'Usuário',
+        'role_assistant': 'Assistente',
+        'summary_prompt': 'Resuma a conversa abaixo de forma concisa, preservando fatos, decisões, nomes, código e pedidos do usuário que ainda sejam relevantes. Responda apenas com o resumo.',
+        'summary_prefix': 'Resumo da conversa até aqui:',
         'system_prompt': """Você é um assistente de IA útil e inteligente. 
 Responda de forma clara e precisa no idioma do usuário."""
     },
@@ -99,17 +322,39 @@ Responda de forma clara e precisa no idioma do usuário."""
         'error_loading': 'Error loading',
         'download_model': 'Download Model',
         'available_models': 'Available Models',
+        'download_queued': 'Queued for download',
+        'queued': 'Queued',
+        'compare_text': 'Compare',
+        'compare_pick': 'Pick at least two models to compare',
+        'fastest': 'fastest',
+        'stop_generation': 'Stop generating',
+        'generation_stopped': 'Generation stopped',
+        'attach_document': 'Add document',
+        'use_documents': 'Use documents',
+        'document_indexed': 'Document indexed',
+        'document_error': 'Error indexing document',
+        'sources': 'Sources',
+        'documents_prefix': "Excerpts from the user's documents. Use them when they are relevant to the question and cite the document name; if they are not enough, say so.",
+        'model_loading': 'Loading model into memory...',
+        'model_warm': 'Model ready',
         'download_started': 'Download started',
+        'download_cancelled': 'Download cancelled',
         'download_complete': 'Download complete',
         'download_error': 'Download error',
+        'download_interrupted': 'interrupted by a server restart',
         'search_models': 'Search Models',
         'popular_models': 'Popular Models',
         'new_models': 'New Models',
         'model_size': 'Size',
         'model_pulls': 'Pulls',
         'install': 'Install',
+        'cancel': 'Cancel',
         'installing': 'Installing...',
         'installed': 'Installed',
+        'role_user': 'User',
+        'role_assistant': 'Assistant',
+        'summary_prompt': 'Summarize the conversation below concisely, keeping facts, decisions, names, code and user requests that are still relevant. Reply with the summary only.',
+        'summary_prefix': 'Summary of the conversation so far:',
         'system_prompt': """You are a helpful and intelligent AI assistant.
 Respond clearly and accurately in the user's language."""
     },
@@ -138,31 +383,47 @@ Respond clearly and accurately in the user's language."""
         'error_loading': 'Error al cargar',
         'download_model': 'Descargar Modelo',
         'available_models': 'Modelos Disponibles',
+        'download_queued': 'En cola para descarga',
+        'queued': 'En cola',
+        'compare_text': 'Comparar',
+        'compare_pick': 'Elige al menos dos modelos para comparar',
+        'fastest': 'más rápido',
+        'stop_generation': 'Detener generación',
+        'generation_stopped': 'Generación detenida',
+        'attach_document': 'Añadir documento',
+        'use_documents': 'Usar documentos',
+        'document_indexed': 'Documento indexado',
+        'document_error': 'Error al indexar documento',
+        'sources': 'Fuentes',
+        'documents_prefix': 'Fragmentos de los documentos del usuario. Úsalos cuando sean relevantes para la pregunta y cita el nombre del documento; si no bastan, dilo.',
+        'model_loading': 'Cargando modelo en memoria...',
+        'model_warm': 'Modelo listo',
         'download_started': 'Descarga iniciada',
+        'download_cancelled': 'Descarga cancelada',
         'download_complete': 'Descarga completada',
         'download_error': 'Error en descarga',
+        'download_interrupted': 'interrumpida por el reinicio del servidor',
         'search_models': 'Buscar Modelos',
         'popular_models': 'Modelos Populares',
         'new_models': 'Modelos Nuevos',
         'model_size': 'Tamaño',
         'model_pulls': 'Descargas',
         'install': 'Instalar',
+        'cancel': 'Cancelar',
         'installing': 'Instalando...',
         'installed': 'Instalado',
+        'role_user': 'Usuario',
+        'role_assistant': 'Asistente',
+        'summary_prompt': 'Resume la conversación de abajo de forma concisa, conservando hechos, decisiones, nombres, código y peticiones del usuario que sigan siendo relevantes. Responde solo con el resumen.',
+        'summary_prefix': 'Resumen de la conversación hasta ahora:',
         'system_prompt': """Eres un asistente de IA útil e inteligente.
 Responde de forma clara y precisa en el idioma del usuario."""
     }
 }
 
-# Cache para modelos da web
-web_models_cache = {
-    'data': [],
-    'timestamp': 0,
-    'cache_duration': 3600  # 1 hora em segundos
-}
+# Catálogo de modelos da web: revalidado em segundo plano após este intervalo
+WEB_MODELS_CACHE_DURATION = 3600  # 1 hora em segundos
 
-# Variável global para armazenar progresso dos downloads
-download_progress = {}
 
 def get_translation(key, language='pt'):
     return LANGUAGES.get(language, LANGUAGES['pt']).get(key, key)
@@ -170,7 +431,7 @@ def get_translation(key, language='pt'):
 def get_ollama_models_direct():
     """Tenta obter modelos diretamente via comando ollama list"""
     try:
-        print("🔍 Tentando obter modelos via comando ollama...")
+        logger.debug("🔍 Tentando obter modelos via comando ollama...")
         result = subprocess.run(['ollama', 'list'], capture_output=True, text=True, timeout=10)
         
         if result.returncode == 0:
@@ -183,116 +444,219 @@ def get_ollama_models_direct():
                         model_name = parts[0]
                         if ':' in model_name:  # Garante que tem tag
                             models.append(model_name)
-            print(f"✅ {len(models)} modelos encontrados via comando")
+            logger.debug("✅ %d modelos encontrados via comando", len(models))
             return models
         else:
-            print(f"❌ Comando falhou: {result.stderr}")
+            logger.debug("❌ Comando falhou: %s", result.stderr)
             return []
     except Exception as e:
-        print(f"❌ Erro no comando ollama: {e}")
+        logger.debug("❌ Erro no comando ollama: %s", e)
         return []
 
 def test_ollama_connection():
     """Testa a conexão com o Ollama de múltiplas formas"""
-    print("🔍 Testando conexão com Ollama...")
+    logger.debug("🔍 Testando conexão com Ollama...")
     
-    # Método 1: API REST
+    # Método 1: API REST (todos os servidores de OLLAMA_URLS)
     try:
-        response = requests.get(f"{OLLAMA_URL}/api/tags", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            models = [model['name'] for model in data.get('models', [])]
-            print(f"✅ API REST - {len(models)} modelos")
+        backends = ollama.check()
+        healthy = [entry for entry in backends.values() if entry['healthy']]
+        if healthy:
+            models = sorted({model for entry in healthy for model in entry['models']})
+            digests = {}
+            for entry in healthy:
+                digests.update(entry['digests'])
+            message = f'Ollama conectado - {len(models)} modelos disponíveis'
+            if len(backends) > 1:
+                message += f' em {len(healthy)}/{len(backends)} servidores'
+            logger.debug("✅ API REST - %d modelos", len(models))
             return {
                 'connected': True,
                 'models': models,
+                'digests': digests,
                 'method': 'api',
-                'message': f'Ollama conectado - {len(models)} modelos disponíveis'
+                'message': message
             }
-    except requests.exceptions.ConnectionError:
-        print("❌ API REST: ConnectionError")
-    except requests.exceptions.Timeout:
-        print("❌ API REST: Timeout")
+        for url, entry in backends.items():
+            logger.warning("❌ API REST (%s): %s", url, entry['error'], extra={'backend': url})
     except Exception as e:
-        print(f"❌ API REST: {e}")
+        logger.warning("❌ API REST: %s", e)
     
     # Método 2: Comando direto
     direct_models = get_ollama_models_direct()
     if direct_models:
-        print(f"✅ Comando direto - {len(direct_models)} modelos")
+        logger.debug("✅ Comando direto - %d modelos", len(direct_models))
         return {
             'connected': True,
             'models': direct_models,
+            'digests': {},
             'method': 'command',
             'message': f'Ollama conectado - {len(direct_models)} modelos disponíveis'
         }
     
     # Fallback final
-    print("❌ Ollama não encontrado")
+    logger.warning("❌ Ollama não encontrado")
     return {
         'connected': False,
         'models': [],
+        'digests': {},
         'method': 'fallback',
         'message': 'Ollama não está disponível'
     }
 
-def fetch_models_from_web():
-    """Busca modelos da web usando a API pública do Ollama"""
-    try:
-        # Verifica se temos cache válido
-        current_time = time.time()
-        if (web_models_cache['data'] and 
-            current_time - web_models_cache['timestamp'] < web_models_cache['cache_duration']):
-            print("📦 Retornando modelos do cache")
-            return web_models_cache['data']
-        
-        print("🌐 Buscando modelos da web...")
-        
-        # Usa a API pública do Ollama para obter modelos
-        response = requests.get('https://ollama.com/api/tags', timeout=10)
+# Estado da conexão com o Ollama, mantido pelo monitor em segundo plano e
+# guardado no estado compartilhado. As rotas leem este cache e nunca consultam
+# o Ollama diretamente. Com vários workers, só o dono da concessão
+# 'connection-monitor' verifica o Ollama; os demais apenas leem o resultado.
+PENDING_CONNECTION_STATE = {
+    'connected': False,
+    'models': [],
+    'digests': {},
+    'method': 'pending',
+    'message': 'Verificando conexão com o Ollama...',
+    'last_check': None,
+    'failures': 0
+}
+connection_lock = threading.Lock()
+connection_ready = threading.Event()    # Sinalizado quando já existe um estado verificado
+connection_refresh = threading.Event()  # Sinalizado para forçar nova verificação
+connection_monitor = {'thread': None, 'pid': None}
+
+MONITOR_TTL = int(os.environ.get('OLLAMA_MONITOR_TTL', 30))  # segundos entre verificações
+MONITOR_RETRY_MIN = 2    # primeira nova tentativa com o Ollama fora do ar
+MONITOR_RETRY_MAX = 60   # teto do backoff exponencial
+MONITOR_LEASE_TTL = max(MONITOR_TTL, MONITOR_RETRY_MAX) * 2 + 5
+
+def publish_connection_changes(previous, info):
+    """Publica mudanças de conexão e a diferença da lista de modelos instalados"""
+    if previous['method'] == 'pending' or previous['connected'] != info['connected']:
+        event_bus.publish('connection', health_payload(info))
+    
+    before, after = set(previous['models']), set(info['models'])
+    if before != after or previous['method'] == 'pending':
+        event_bus.publish('models', {
+            'models': info['models'],
+            'added': sorted(after - before),
+            'removed': sorted(before - after)
+        })
+
+def wait_for_refresh(delay, since):
+    """Espera `delay` segundos ou até alguém (de qualquer worker) pedir nova verificação"""
+    deadline = time.time() + delay
+    while time.time() < deadline:
+        if connection_refresh.wait(min(1, max(deadline - time.time(), 0))):
+            return
+        if shared_state.get('connection', 'refresh_requested', 0) > since:
+            return
+
+def connection_monitor_loop():
+    """Verifica o Ollama periodicamente e atualiza o estado em cache"""
+    while True:
+        connection_refresh.clear()
+        checked_at = time.time()
         
-        if response.status_code == 200:
-            data = response.json()
-            models = []
-            
-            for model_data in data.get('models', []):
-                model = model_data.get('model', '')
-                if model:
-                    # Extrai informações do modelo
-                    parts = model.split(':')
-                    name = parts[0] if len(parts) > 0 else model
-                    tag = parts[1] if len(parts) > 1 else 'latest'
-                    
-                    models.append({
-                        'name': model,
-                        'short_name': name,
-                        'tag': tag,
-                        'pulls': model_data.get('pulls', 0),
-                        'size': model_data.get('size', 0),
-                        'modified': model_data.get('modified_at', '')
-                    })
-            
-            # Ordena por popularidade (pulls)
-            models.sort(key=lambda x: x['pulls'], reverse=True)
-            
-            # Atualiza cache
-            web_models_cache['data'] = models
-            web_models_cache['timestamp'] = current_time
+        if shared_state.acquire_lease('connection-monitor', worker_id(), MONITOR_LEASE_TTL):
+            info = test_ollama_connection()
+            previous = shared_state.get('connection', 'state') or PENDING_CONNECTION_STATE
+            failures = 0 if info['connected'] else previous['failures'] + 1
+            info['failures'] = failures
+            info['last_check'] = datetime.now().isoformat()
+            shared_state.set('connection', 'state', info)
+            publish_connection_changes(previous, info)
+            if info['connected']:
+                try:
+                    residency.refresh()
+                except Exception as e:
+                    logger.warning("❌ Erro ao consultar /api/ps: %s", e)
             
-            print(f"✅ {len(models)} modelos encontrados na web")
-            return models
+            if failures:
+                # Backoff exponencial enquanto o Ollama estiver inacessível
+                delay = min(MONITOR_RETRY_MIN * 2 ** (failures - 1), MONITOR_RETRY_MAX)
+                logger.warning("⏳ Ollama inacessível, nova tentativa em %ss", delay)
+            else:
+                delay = MONITOR_TTL
         else:
-            print(f"❌ Erro na API web: {response.status_code}")
-            return []
-            
-    except Exception as e:
-        print(f"❌ Erro ao buscar modelos da web: {e}")
-        return []
+            # Outro worker verifica; este só confere se a concessão expirou
+            delay = MONITOR_TTL
+        
+        if shared_state.get('connection', 'state') is not None:
+            connection_ready.set()
+        wait_for_refresh(delay, checked_at)
+
+def start_connection_monitor():
+    """Inicia o monitor de conexão (uma única vez por processo)"""
+    with connection_lock:
+        if connection_monitor['pid'] == os.getpid():
+            return
+        thread = threading.Thread(target=connection_monitor_loop, name='ollama-monitor')
+        thread.daemon = True
+        connection_monitor['thread'] = thread
+        connection_monitor['pid'] = os.getpid()
+    thread.start()
+
+def invalidate_connection_state():
+    """Pede ao monitor uma nova verificação imediata (ex.: após um download)"""
+    shared_state.set('connection', 'refresh_requested', time.time())
+    connection_refresh.set()
+
+def on_backend_failure(url):
+    """Uma requisição derrubou um servidor: conta o erro e antecipa a próxima verificação"""
+    upstream_errors.inc(kind='backend_down')
+    invalidate_connection_state()
+
+ollama.on_failure = on_backend_failure
+
+def get_connection_info(wait=5):
+    """Retorna uma cópia do estado de conexão em cache"""
+    start_connection_monitor()
+    # Só a primeira requisição após a inicialização espera a verificação inicial
+    if not connection_ready.is_set():
+        deadline = time.time() + wait
+        while time.time() < deadline and shared_state.get('connection', 'state') is None:
+            connection_ready.wait(0.1)
+    return shared_state.get('connection', 'state') or dict(PENDING_CONNECTION_STATE)
+
+def on_catalog_updated(catalog):
+    event_bus.publish('catalog', {'version': catalog['version'], 'count': len(catalog['models'])})
+
+# Persistido em DATA_DIR/catalog.json: servido na hora, mesmo offline
+model_catalog = ModelCatalog(
+    ollama_web,
+    os.path.join(DATA_DIR, 'catalog.json'),
+    shared_state,
+    owner=worker_id,
+    ttl=WEB_MODELS_CACHE_DURATION,
+    on_update=on_catalog_updated
+)
+
+def fetch_models_from_web():
+    """Modelos da web do catálogo em disco (a atualização ocorre em segundo plano)"""
+    return model_catalog.models()
+
+# Visões do catálogo (categorias e índice de busca), recalculadas apenas
+# quando a versão do catálogo muda
+catalog_views = {'version': None, 'categories': None, 'index': None}
+catalog_views_lock = threading.Lock()
+
+def get_catalog_views():
+    models = fetch_models_from_web()
+    version = model_catalog.version()
+    with catalog_views_lock:
+        if catalog_views['index'] is None or catalog_views['version'] != version:
+            catalog_views['categories'] = categorize_models(models)
+            catalog_views['index'] = SearchIndex(models)
+            catalog_views['version'] = version
+        return catalog_views
+
+def get_search_index():
+    return get_catalog_views()['index']
 
 def get_popular_models_from_web():
-    """Retorna os modelos mais populares da web"""
-    all_models = fetch_models_from_web()
-    
+    """Retorna os modelos mais populares da web, por categoria"""
+    return get_catalog_views()['categories']
+
+def categorize_models(all_models):
+    """Separa os modelos em popular/new/code/chat"""
     # Filtra e categoriza modelos
     popular_models = []
     new_models = []
@@ -322,66 +686,131 @@ def get_popular_models_from_web():
         'chat': chat_models[:15]
     }
 
-def download_model_thread(model_name, language='pt'):
-    """Função para baixar modelo em thread separada"""
+def on_model_pulled(model_name):
+    """Chamado pelo gerenciador de downloads quando um pull termina com sucesso"""
+    # Só a lista de modelos locais muda; o catálogo da web continua válido
+    invalidate_connection_state()
+
+# Downloads via /api/pull, com fila FIFO e no máximo OLLAMA_MAX_PULLS simultâneos;
+# o progresso fica no namespace 'downloads' do estado compartilhado
+download_manager = DownloadManager(
+    ollama,
+    shared_state,
+    owner=worker_id,
+    max_workers=int(os.environ.get('OLLAMA_MAX_PULLS', 2)),
+    translate=get_translation,
+    on_complete=on_model_pulled,
+    publish=event_bus.publish
+)
+
+def active_downloads():
+    return [job for job in download_manager.jobs().values() if job['status'] in ACTIVE_STATUSES]
+
+metrics.counter(
+    'ollamagui_download_bytes_total', 'Bytes recebidos pelos downloads de modelos',
+    collect=lambda: {(): download_manager.bytes_downloaded})
+# Gauges lidos do estado compartilhado: o valor é o mesmo em todos os workers
+metrics.gauge(
+    'ollamagui_downloads', 'Downloads na fila ou em andamento', ('status',), merge='max',
+    collect=lambda: {(status,): sum(1 for job in active_downloads() if job['status'] == status)
+                     for status in ACTIVE_STATUSES})
+metrics.gauge(
+    'ollamagui_download_rate_bytes', 'Vazão somada dos downloads em andamento (bytes/s)', merge='max',
+    collect=lambda: {(): sum(job.get('rate', 0) for job in active_downloads())})
+
+def cache_samples():
+    """Acertos e falhas dos caches deste processo"""
+    http = http_cache.stats()
+    return {
+        ('response', 'hit'): response_cache.hits,
+        ('response', 'miss'): response_cache.misses,
+        ('http_etag', 'hit'): http['not_modified'],
+        ('http_etag', 'miss'): http['full'],
+        ('compression', 'hit'): http['compress_hits'],
+        ('compression', 'miss'): http['compress_misses']
+    }
+
+metrics.counter(
+    'ollamagui_cache_requests_total', 'Consultas aos caches (respostas, ETag/304, compressão) por resultado',
+    ('cache', 'result'), collect=cache_samples)
+
+def model_is_busy(model):
+    """Chat ou lote usando o modelo neste processo, ou geração registrada por qualquer worker"""
+    if chat_scheduler.stats()['models'].get(model, {}).get('active', 0) > 0:
+        return True
+    return model in generations.models_in_use()
+
+# Modelos carregados na memória do Ollama (/api/ps), pré-carregamento e despejo
+# LRU quando OLLAMA_MEMORY_BUDGET_GB é definido
+residency = ResidencyManager(
+    ollama,
+    shared_state,
+    owner=worker_id,
+    memory_budget=int(float(os.environ.get('OLLAMA_MEMORY_BUDGET_GB', 0)) * 1024 ** 3),
+    keep_alive=os.environ.get('OLLAMA_KEEP_ALIVE', '30m'),
+    publish=event_bus.publish,
+    is_busy=model_is_busy
+)
+
+def make_room_for(model):
+    """Aplica OLLAMA_MEMORY_BUDGET_GB antes de mandar um pedido a um modelo frio"""
     try:
-        print(f"📥 Iniciando download do modelo: {model_name}")
-        download_progress[model_name] = {
-            'status': 'downloading',
-            'progress': 0,
-            'message': get_translation('download_started', language)
-        }
-        
-        # Executa o comando ollama pull
-        process = subprocess.Popen(
-            ['ollama', 'pull', model_name],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
-        )
-        
-        # Monitora o progresso
-        for line in process.stdout:
-            print(f"📦 {model_name}: {line.strip()}")
-            # Parseia progresso se disponível
-            if 'downloading' in line.lower() or 'pulling' in line.lower():
-                download_progress[model_name]['progress'] = min(
-                    download_progress[model_name]['progress'] + 5, 90
-                )
-            elif 'verifying' in line.lower():
-                download_progress[model_name]['progress'] = 95
-            elif 'success' in line.lower():
-                download_progress[model_name]['progress'] = 100
-        
-        process.wait()
-        
-        if process.returncode == 0:
-            download_progress[model_name] = {
-                'status': 'completed',
-                'progress': 100,
-                'message': get_translation('download_complete', language)
-            }
-            print(f"✅ Download completo: {model_name}")
-            
-            # Limpa cache de modelos locais
-            global web_models_cache
-            web_models_cache['data'] = []
-            
-        else:
-            download_progress[model_name] = {
-                'status': 'error',
-                'progress': 0,
-                'message': get_translation('download_error', language)
-            }
-            print(f"❌ Erro no download: {model_name}")
-            
+        residency.ensure_room(model)
     except Exception as e:
-        download_progress[model_name] = {
-            'status': 'error',
-            'progress': 0,
-            'message': f"{get_translation('download_error', language)}: {str(e)}"
-        }
-        print(f"❌ Erro no download thread: {e}")
+        # Sem despejo o Ollama ainda decide sozinho; o pedido segue
+        logger.warning("❌ Erro ao liberar memória para %s: %s", model, e, extra={'model': model})
+
+batch_items = metrics.counter(
+    'ollamagui_batch_items_total', 'Itens de jobs em lote processados, por modelo e resultado', ('model', 'status'))
+metrics.gauge(
+    'ollamagui_batch_active', 'Gerações de jobs em lote em andamento (segundo plano)',
+    collect=lambda: {(): chat_scheduler.stats()['background']})
+
+def record_batch_item(model, result):
+    batch_items.inc(model=model, status=result['status'])
+
+# Jobs em lote (POST /api/batches): prompts de um JSONL processados em segundo
+# plano, até OLLAMAGUI_BATCH_CONCURRENCY por vez, com prioridade menor que o chat
+batch_manager = BatchManager(
+    ollama,
+    chat_scheduler,
+    shared_state,
+    os.path.join(DATA_DIR, 'batches'),
+    owner=worker_id,
+    concurrency=int(os.environ.get('OLLAMAGUI_BATCH_CONCURRENCY', 2)),
+    keep_alive=residency.keep_alive,
+    publish=event_bus.publish,
+    on_item=record_batch_item,
+    before_generate=make_room_for
+)
+
+document_embeddings = metrics.counter(
+    'ollamagui_document_chunks_total', 'Trechos de documentos indexados, por resultado (embedded|reused)',
+    ('result',))
+document_retrieval = metrics.histogram(
+    'ollamagui_document_retrieval_seconds', 'Tempo da busca de trechos (embedding da pergunta + top-k)',
+    buckets=FAST_BUCKETS)
+
+# Documentos para respostas com contexto (RAG): vetores de OLLAMAGUI_EMBED_MODEL
+# em DATA_DIR/documents, consultados quando o chat pede "documents"
+DOCUMENTS_TOP_K = int(os.environ.get('OLLAMAGUI_DOCUMENTS_TOP_K', 4))
+MAX_DOCUMENTS_TOP_K = 50        # trechos por busca em /api/documents/search
+DOCUMENTS_MIN_SCORE = float(os.environ.get('OLLAMAGUI_DOCUMENTS_MIN_SCORE', 0.3))
+DOCUMENTS_CONTEXT_SHARE = 0.25  # fração máxima do num_ctx ocupada pelos trechos
+MAX_DOCUMENT_BYTES = int(os.environ.get('OLLAMAGUI_MAX_DOCUMENT_MB', 20)) * 1024 * 1024
+document_index = DocumentIndex(
+    os.path.join(DATA_DIR, 'documents'),
+    ollama,
+    os.environ.get('OLLAMAGUI_EMBED_MODEL', 'nomic-embed-text'),
+    shared_state,
+    owner=worker_id,
+    batch_size=int(os.environ.get('OLLAMAGUI_EMBED_BATCH', EMBED_BATCH))
+) if numpy_available() else None
+
+def start_background_tasks():
+    """Threads de segundo plano deste processo (uma vez por processo, após o fork)"""
+    metrics.start()
+    batch_manager.start()
 
 def format_file_size(size_bytes):
     """Formata tamanho de arquivo para legibilidade"""
@@ -396,25 +825,78 @@ def format_file_size(size_bytes):
     
     return f"{size_bytes:.1f} {size_names[i]}"
 
+def cached_json(payload, max_age=0):
+    """Como jsonify, com ETag forte, 304 e compressão gzip/br negociada"""
+    status, headers, body = http_cache.json_response_parts(
+        payload,
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match'),
+        max_age
+    )
+    return Response(body, status=status, headers=headers)
+
+# CSS/JS minificados e versionados pelo hash do conteúdo (static/dist)
+assets = AssetPipeline(app.static_folder, os.path.join(app.static_folder, 'dist'))
+ASSET_MAX_AGE = 31536000  # 1 ano: o nome do arquivo muda junto com o conteúdo
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.time()
+    start_background_tasks()
+
+@app.after_request
+def record_request_metrics(response):
+    """Conta a requisição por rota e status; streams SSE ficam fora do histograma de duração"""
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    http_requests.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+    if response.mimetype != 'text/event-stream' and 'request_started' in g:
+        http_latency.observe(time.time() - g.request_started, endpoint=endpoint)
+    return response
+
 @app.route('/')
 def home():
-    return render_template('index.html')
+    # A página é só o esqueleto HTML; a interface vem dos arquivos versionados
+    html = render_template('index.html', asset_url=assets.url)
+    status, headers, body = http_cache.response_parts(
+        html.encode('utf-8'),
+        'text/html; charset=utf-8',
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match')
+    )
+    return Response(body, status=status, headers=headers)
 
-@app.route('/api/models')
-def get_models():
-    connection_info = test_ollama_connection()
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    asset = assets.lookup(filename, request.headers.get('Accept-Encoding'))
+    if asset is None:
+        abort(404)
     
+    path, encoding = asset
+    mimetype = 'text/css' if filename.endswith('.css') else 'application/javascript'
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def models_payload(connection_info):
     # Sempre retorna modelos, mesmo que seja fallback
     all_models = connection_info['models']
     
-    print(f"📦 Retornando {len(all_models)} modelos (método: {connection_info['method']})")
+    logger.debug("📦 Retornando %d modelos (método: %s)", len(all_models), connection_info['method'])
     
-    return jsonify({
+    return {
         'models': all_models,
+        'residency': residency.model_states(all_models),
         'connected': connection_info['connected'],
         'message': connection_info['message'],
         'method': connection_info['method']
-    })
+    }
+
+@app.route('/api/models')
+def get_models():
+    return cached_json(models_payload(get_connection_info()))
 
 @app.route('/api/web-models')
 def get_web_models():
@@ -423,13 +905,14 @@ def get_web_models():
         categorized_models = get_popular_models_from_web()
         
         # Obtém modelos instalados localmente
-        connection_info = test_ollama_connection()
+        connection_info = get_connection_info()
         installed_models = connection_info['models'] if connection_info['connected'] else []
         
-        return jsonify({
+        return cached_json({
             'categories': categorized_models,
             'installed_models': installed_models,
-            'total_models': sum(len(cat) for cat in categorized_models.values())
+            'total_models': sum(len(cat) for cat in categorized_models.values()),
+            'catalog': model_catalog.info()
         })
         
     except Exception as e:
@@ -437,159 +920,1139 @@ def get_web_models():
 
 @app.route('/api/search-models')
 def search_models():
-    """Busca modelos por termo"""
+    """Busca modelos por termo, com ranking e paginação (offset/limit)"""
     try:
-        query = request.args.get('q', '').lower()
+        query = request.args.get('q', '').strip()
         if not query:
             return jsonify({'error': 'Termo de busca não fornecido'}), 400
         
-        all_models = fetch_models_from_web()
-        filtered_models = [
-            model for model in all_models 
-            if query in model['name'].lower() or query in model['short_name'].lower()
-        ]
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 100)
+        results, total = get_search_index().search(query, offset, limit)
         
-        # Obtém modelos instalados localmente
-        connection_info = test_ollama_connection()
+        # Modelos instalados vêm do estado em cache do monitor
+        connection_info = get_connection_info()
         installed_models = connection_info['models'] if connection_info['connected'] else []
         
-        return jsonify({
-            'results': filtered_models[:50],  # Limita resultados
+        next_offset = offset + len(results)
+        return cached_json({
+            'results': results,
             'installed_models': installed_models,
-            'count': len(filtered_models)
+            'count': total,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': next_offset if next_offset < total else None
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/model', methods=['POST'])
+def select_model():
+    """Pré-carrega o modelo escolhido na interface para a próxima mensagem"""
+    data = request.json or {}
+    model_name = data.get('model')
+    language = data.get('language', 'pt')
+    if not model_name:
+        return jsonify({'error': 'Nome do modelo não fornecido'}), 400
+    
+    connection_info = get_connection_info()
+    if not connection_info['connected']:
+        return jsonify({'error': 'Ollama não está rodando'}), 503
+    if model_name not in connection_info['models']:
+        return jsonify({'error': 'Modelo não instalado'}), 404
+    
+    status = residency.preload(model_name)
+    return jsonify({
+        'success': True,
+        'model': model_name,
+        'status': status,
+        'message': get_translation('model_warm' if status == 'warm' else 'model_loading', language)
+    })
+
 @app.route('/api/download-model', methods=['POST'])
 def download_model():
-    """Inicia o download de um modelo"""
+    """Inicia (ou enfileira) o download de um modelo"""
     try:
         data = request.json
         model_name = data.get('model')
         language = data.get('language', 'pt')
+        backend = data.get('backend')  # servidor de destino (opcional, ver /api/backends)
         
         if not model_name:
             return jsonify({'error': 'Nome do modelo não fornecido'}), 400
+        if backend and backend.rstrip('/') not in ollama.urls:
+            return jsonify({'error': 'Servidor Ollama desconhecido'}), 400
         
-        # Verifica se o modelo já está instalado
-        connection_info = test_ollama_connection()
-        if model_name in connection_info['models']:
+        # Verifica se o modelo já está instalado (no servidor escolhido, se houver)
+        if backend:
+            backend = backend.rstrip('/')
+            installed = ollama.status()[backend]['models']
+        else:
+            installed = get_connection_info()['models']
+        if model_name in installed:
             return jsonify({'error': 'Modelo já está instalado'}), 400
         
-        # Verifica se já está baixando
-        if model_name in download_progress and download_progress[model_name]['status'] == 'downloading':
-            return jsonify({'error': 'Download já em andamento'}), 400
-        
-        # Inicia download em thread separada
-        thread = threading.Thread(
-            target=download_model_thread,
-            args=(model_name, language)
-        )
-        thread.daemon = True
-        thread.start()
+        # Pedidos repetidos do mesmo modelo reaproveitam o job em andamento
+        job, created = download_manager.submit(model_name, language, backend)
         
         return jsonify({
             'success': True,
-            'message': get_translation('download_started', language),
-            'model': model_name
+            'message': job['message'],
+            'model': model_name,
+            'status': job['status'],
+            'position': job.get('position', 0),
+            'deduplicated': not created
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/download-progress/<model_name>')
+@app.route('/api/download-progress/<path:model_name>')
 def get_download_progress(model_name):
     """Retorna o progresso do download de um modelo"""
-    progress = download_progress.get(model_name, {
+    progress = download_manager.get(model_name) or {
         'status': 'unknown',
         'progress': 0,
         'message': 'Download não encontrado'
-    })
+    }
     
-    return jsonify(progress)
+    return cached_json(progress)
 
-# ... (mantenha as outras rotas como chat, health, translations, etc.)
+@app.route('/api/download-cancel/<path:model_name>', methods=['POST'])
+def cancel_download(model_name):
+    """Cancela um download na fila ou em andamento"""
+    if not download_manager.cancel(model_name):
+        return jsonify({'error': 'Nenhum download ativo para este modelo'}), 404
+    return jsonify({'success': True, 'model': model_name})
 
-@app.route('/api/chat', methods=['POST'])
-def chat():
+@app.route('/api/backends')
+def list_backends():
+    """Servidores Ollama configurados: saúde, modelos, carregados e carga atual"""
+    return cached_json({'backends': [
+        {
+            'url': url,
+            'healthy': entry['healthy'],
+            'ejected_until': entry['ejected_until'],
+            'inflight': entry['inflight'],
+            'models': entry['models'],
+            'loaded': sorted(entry['loaded']),
+            'error': entry.get('error')
+        }
+        for url, entry in ollama.status().items()
+    ]})
+
+@app.route('/api/downloads')
+def list_downloads():
+    """Lista todos os downloads conhecidos (ativos e concluídos)"""
+    return cached_json({'downloads': download_manager.jobs()})
+
+@app.route('/api/batches', methods=['POST'])
+def create_batch():
+    """Cria um job em lote a partir de um JSONL (campo 'file' em multipart ou o próprio corpo).
+
+    Cada linha: {"id", "prompt" ou "messages", "model", "options", "system"};
+    model, system, options e name também podem vir como padrão do job.
+    """
+    upload = request.files.get('file')
     try:
-        data = request.json
-        message = data.get('message', 'Hello')
-        model = data.get('model', 'llama3:8b-instruct')
-        language = data.get('language', 'pt')
+        options = json.loads(request.values.get('options') or '{}')
+    except ValueError:
+        options = None
+    if not isinstance(options, dict):
+        return jsonify({'error': 'options deve ser um objeto JSON'}), 400
+    
+    defaults = {
+        'model': request.values.get('model'),
+        'system': request.values.get('system'),
+        'options': options,
+        'name': request.values.get('name') or (upload.filename if upload else None)
+    }
+    try:
+        job = batch_manager.create(upload.stream if upload else request.stream, defaults)
+    except (BatchInputError, UnicodeDecodeError) as e:
+        return jsonify({'error': f'JSONL inválido: {e}'}), 400
+    return jsonify({'success': True, 'job': job}), 201
+
+@app.route('/api/batches')
+def list_batches():
+    return cached_json({'jobs': batch_manager.jobs()})
+
+@app.route('/api/batches/<job_id>')
+def get_batch(job_id):
+    """Progresso do job: completed, failed, total, rate (itens/s) e eta (s)"""
+    job = batch_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return cached_json(job)
+
+@app.route('/api/batches/<job_id>/results')
+def get_batch_results(job_id):
+    """Resultados já prontos (JSONL, ordem de conclusão); aceita Range para leitura incremental"""
+    job = batch_manager.get(job_id)
+    if not job or not os.path.exists(batch_manager.output_path(job_id)):
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return send_file(
+        batch_manager.output_path(job_id),
+        mimetype='application/x-ndjson',
+        as_attachment=True,
+        download_name=f"{os.path.splitext(job['name'])[0]}-resultados.jsonl",
+        conditional=True,
+        max_age=0
+    )
+
+@app.route('/api/batches/<job_id>/cancel', methods=['POST'])
+def cancel_batch(job_id):
+    if not batch_manager.cancel(job_id):
+        return jsonify({'error': 'Job não encontrado ou já finalizado'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/batches/<job_id>', methods=['DELETE'])
+def delete_batch(job_id):
+    if not batch_manager.delete(job_id):
+        return jsonify({'error': 'Job não encontrado'}), 404
+    return jsonify({'success': True})
+
+def documents_unavailable():
+    return jsonify({'error': 'Índice de documentos indisponível (instale numpy)'}), 503
+
+@app.route('/api/documents', methods=['POST'])
+def add_document():
+    """Indexa um documento de texto (campo 'file' em multipart ou JSON {name, text}).
+
+    Reenviar um documento com o mesmo nome substitui o anterior, gerando
+    embeddings apenas para os trechos alterados.
+    """
+    if document_index is None:
+        return documents_unavailable()
+
+    upload = request.files.get('file')
+    if upload:
+        name = request.values.get('name') or upload.filename
+        content = upload.stream.read(MAX_DOCUMENT_BYTES + 1)
+    else:
+        data = request.get_json(silent=True) or {}
+        name = data.get('name')
+        content = (data.get('text') or '').encode('utf-8')
+    if not name or not content.strip():
+        return jsonify({'error': 'Informe o nome e o conteúdo do documento'}), 400
+    if len(content) > MAX_DOCUMENT_BYTES:
+        return jsonify({'error': 'Documento grande demais'}), 413
+    try:
+        text = content.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Apenas documentos de texto (UTF-8) são suportados'}), 415
+
+    try:
+        document, stats = document_index.add(name, text)
+    except EmbeddingError as e:
+        logger.error("❌ Erro ao indexar %s: %s", name, e, extra={'document': name})
+        return jsonify({'error': f'Erro ao gerar embeddings com {document_index.embed_model}: {e}'}), 502
+    document_embeddings.inc(stats['embedded'], result='embedded')
+    document_embeddings.inc(stats['reused'], result='reused')
+    return jsonify({'success': True, 'document': document, 'stats': stats}), 200 if stats['unchanged'] else 201
+
+@app.route('/api/documents')
+def list_documents():
+    if document_index is None:
+        return documents_unavailable()
+    return jsonify({'documents': document_index.documents(), 'index': document_index.stats()})
+
+@app.route('/api/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    if document_index is None:
+        return documents_unavailable()
+    if not document_index.delete(document_id):
+        return jsonify({'error': 'Documento não encontrado'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/documents/search', methods=['POST'])
+def search_documents():
+    """Trechos mais parecidos com {"query"}; opcionais "k" e "documents" (ids)"""
+    if document_index is None:
+        return documents_unavailable()
+    data = request.get_json(silent=True) or {}
+    if not data.get('query'):
+        return jsonify({'error': 'Informe a consulta'}), 400
+    try:
+        k = int(data.get('k', DOCUMENTS_TOP_K))
+    except (TypeError, ValueError):
+        k = 0
+    if k < 1:
+        return jsonify({'error': 'k deve ser um inteiro positivo'}), 400
+    try:
+        results = retrieve_documents(data['query'], data.get('documents'), min(k, MAX_DOCUMENTS_TOP_K))
+    except EmbeddingError as e:
+        return jsonify({'error': str(e)}), 502
+    return jsonify({'results': results})
+
+def retrieve_documents(query, document_ids=None, k=DOCUMENTS_TOP_K):
+    """Busca os trechos relevantes; `document_ids` restringe a busca a alguns documentos"""
+    start = time.time()
+    results = document_index.search(
+        query, k,
+        document_ids=document_ids if isinstance(document_ids, list) and document_ids else None,
+        min_score=DOCUMENTS_MIN_SCORE
+    )
+    document_retrieval.observe(time.time() - start)
+    return results
+
+def documents_system_prompt(system_prompt, results, num_ctx, language):
+    """Acrescenta os trechos ao prompt de sistema, até DOCUMENTS_CONTEXT_SHARE do contexto"""
+    budget = int(num_ctx * DOCUMENTS_CONTEXT_SHARE)
+    used = 0
+    sections = []
+    sources = []
+    for result in results:
+        tokens = estimate_tokens(result['text'])
+        if used + tokens > budget:
+            break
+        used += tokens
+        sections.append(f"[{result['name']}]\n{result['text']}")
+        sources.append({key: result[key] for key in ('document_id', 'name', 'position', 'score')})
+    if not sections:
+        return system_prompt, []
+    prompt = '\n\n'.join([system_prompt, get_translation('documents_prefix', language)] + sections)
+    return prompt, sources
+
+# ... (mantenha as outras rotas como chat, health, translations, etc.)
+
+def sse_event(data):
+    """Formata um dicionário como evento Server-Sent Events"""
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+EVENTS_KEEPALIVE = 15  # segundos entre comentários que mantêm a conexão aberta
+
+def named_sse_event(event_type, data, event_id=None):
+    """Evento SSE nomeado (tratado com addEventListener no navegador)"""
+    prefix = f"id: {event_id}\n" if event_id is not None else ''
+    return f"{prefix}event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def events_snapshot():
+    """Estado atual enviado a cada nova conexão em /api/events"""
+    info = get_connection_info()
+    snapshot = [
+        named_sse_event('connection', health_payload(info)),
+        named_sse_event('models', {'models': info['models'], 'added': [], 'removed': []})
+    ]
+    snapshot.append(named_sse_event('residency', residency.status()))
+    for job in active_downloads():
+        snapshot.append(named_sse_event('download', job))
+    return snapshot
+
+@app.route('/api/events')
+def events_stream():
+    """Canal único de eventos: progresso de downloads, conexão e modelos instalados"""
+    # Assina antes do snapshot para não perder eventos publicados nesse intervalo
+    subscription = event_bus.subscribe()
+    snapshot = events_snapshot()
+    
+    def generate():
+        try:
+            for event in snapshot:
+                yield event
+            while not subscription.closed:
+                event = subscription.get(EVENTS_KEEPALIVE)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield named_sse_event(event['type'], event['data'], event['id'])
+        finally:
+            subscription.close()
+    
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def cancelled_event(extra, tokens=0):
+    return sse_event({**extra, 'content': '', 'done': True, 'cancelled': True, 'eval_count': tokens})
+
+class ChatRelay:
+    """Converte as linhas NDJSON do /api/chat do Ollama em eventos SSE.
+
+    Compartilhado pelo servidor Flask e pelo modo asyncio: quem lê o stream
+    entrega cada linha a `feed()` e envia os eventos retornados.
+    """
+
+    def __init__(self, model, start_time, extra=None):
+        self.model = model
+        self.start_time = start_time
+        self.extra = extra or {}
+        self.parts = []
+        self.stats = None
+        self.first_token_time = None
+        self.finished = False
+
+    def feed(self, line):
+        """Processa uma linha do Ollama e retorna a lista de eventos SSE"""
+        return [sse_event(data) for data in self.parse(line)]
+
+    def parse(self, line):
+        """Processa uma linha do Ollama e retorna os dados dos eventos (sem o formato SSE)"""
+        if not line:
+            return []
+        try:
+            chunk = json.loads(line)
+        except ValueError:
+            return []
         
-        print(f"💬 [{language}] Tentando enviar para {model}: {message}")
+        if 'error' in chunk:
+            self.finished = True
+            record_chat_error(self.model, 'ollama')
+            return [{'error': chunk['error'], 'done': True}]
         
-        # Verifica se podemos usar o Ollama
-        connection_info = test_ollama_connection()
+        events = []
+        content = chunk.get('message', {}).get('content', '')
+        if content:
+            if self.first_token_time is None:
+                self.first_token_time = time.time()
+                chat_ttft.observe(self.first_token_time - self.start_time, model=self.model)
+            self.parts.append(content)
+            events.append({'content': content, 'done': False})
         
-        if not connection_info['connected']:
-            return jsonify({
-                'response': f"⚠️ Ollama não está disponível. \n\nMensagem que seria enviada para {model}: {message}\n\nPara usar modelos reais, execute: ollama serve"
+        if chunk.get('done'):
+            self.finished = True
+            self.stats = {
+                'eval_count': chunk.get('eval_count', 0),
+                'eval_duration': chunk.get('eval_duration', 0),
+                'prompt_eval_count': chunk.get('prompt_eval_count', 0),
+                'prompt_eval_duration': chunk.get('prompt_eval_duration', 0),
+                'load_duration': chunk.get('load_duration', 0),
+                'total_duration': chunk.get('total_duration', 0)
+            }
+            self.record(time.time() - self.start_time)
+            ttft = self.first_token_time - self.start_time if self.first_token_time else None
+            events.append({
+                **self.extra,
+                'content': '',
+                'done': True,
+                **self.stats,
+                'ttft': round(ttft, 3) if ttft is not None else None
             })
+        return events
+
+    def record(self, duration):
+        """Métricas da geração concluída, a partir das durações informadas pelo Ollama (ns)"""
+        stats = self.stats
+        chat_requests.inc(model=self.model, status='completed')
+        chat_latency.observe(duration, model=self.model)
+        chat_prompt_eval.observe(stats['prompt_eval_duration'] / 1e9, model=self.model)
+        if stats['load_duration']:
+            chat_load.observe(stats['load_duration'] / 1e9, model=self.model)
+        tokens_per_second = stats['eval_count'] / (stats['eval_duration'] / 1e9) if stats['eval_duration'] else 0
+        if tokens_per_second:
+            chat_tokens_per_second.observe(tokens_per_second, model=self.model)
+        chat_tokens.inc(stats['prompt_eval_count'], model=self.model, kind='prompt')
+        chat_tokens.inc(stats['eval_count'], model=self.model, kind='completion')
         
-        # System prompt com idioma
-        system_prompt = get_translation('system_prompt', language)
-        
-        payload = {
-            "model": model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            "stream": False
+        ttft = self.first_token_time - self.start_time if self.first_token_time else None
+        logger.debug("⏱️  %s respondeu em %.2fs", self.model, duration, extra={
+            'model': self.model,
+            'duration': round(duration, 3),
+            'ttft': round(ttft, 3) if ttft is not None else None,
+            'load': round(stats['load_duration'] / 1e9, 3),
+            'prompt_eval': round(stats['prompt_eval_duration'] / 1e9, 3),
+            'tokens': stats['eval_count'],
+            'tokens_per_second': round(tokens_per_second, 1)
+        })
+
+    def cancel(self, reason):
+        """Registra a interrupção ('user' ou 'disconnect') e retorna o evento final"""
+        self.finished = True
+        # O Ollama manda um token por linha: os pedaços recebidos são os tokens gerados
+        tokens = len(self.parts)
+        chat_requests.inc(model=self.model, status='cancelled')
+        chat_cancelled.inc(model=self.model, reason=reason)
+        chat_wasted_tokens.inc(tokens, model=self.model, reason=reason)
+        logger.info("🛑 Geração de %s interrompida (%s) após %d tokens", self.model, reason, tokens,
+                    extra={'model': self.model, 'reason': reason, 'tokens': tokens})
+        return cancelled_event(self.extra, tokens)
+
+    def error(self, message, kind=None):
+        """Evento de erro; `kind` conta a falha do Ollama nas métricas"""
+        self.finished = True
+        if kind:
+            record_chat_error(self.model, kind)
+        return sse_event({'error': message, 'done': True})
+
+def prepare_chat(data, user):
+    """Valida o pedido de chat e monta o plano de execução.
+
+    Retorna {'error', 'status'} em caso de erro, {'warning'} com o Ollama fora
+    do ar, ou o plano com payload, cabeçalhos, entrada de cache, callbacks e o
+    ticket do agendador (None para respostas do cache). A admissão vem antes
+    de criar a conversa e de consultar documentos: levanta SchedulerFull sem
+    efeitos colaterais. Faz E/S local (SQLite) e, com "documents", o embedding
+    da pergunta; é usado pelos modos Flask e asyncio (numa thread).
+    """
+    message = data.get('message', 'Hello')
+    model = data.get('model', 'llama3:8b-instruct')
+    language = data.get('language', 'pt')
+    conversation_id = data.get('conversation_id')
+    request_options = data.get('options') or {}
+    
+    logger.debug("💬 [%s] Enviando para %s: %s", language, model, message[:200],
+                 extra={'model': model, 'language': language})
+    
+    if conversation_id and not conversation_store.get_conversation(conversation_id):
+        return {'error': 'Conversa não encontrada', 'status': 404}
+    
+    # Verifica se podemos usar o Ollama
+    connection_info = get_connection_info()
+    
+    if not connection_info['connected']:
+        chat_requests.inc(model=model, status='unavailable')
+        return {
+            'warning': f"⚠️ Ollama não está disponível. \n\nMensagem que seria enviada para {model}: {message}\n\nPara usar modelos reais, execute: ollama serve"
         }
+    
+    ticket = chat_scheduler.submit(model, user)
+    try:
+        plan = build_chat_plan(data, model, message, language, conversation_id, request_options, connection_info)
+    except Exception:
+        chat_scheduler.release(ticket)
+        raise
+    if 'error' in plan or plan['cached']:
+        # Respostas do cache não ocupam slot
+        chat_scheduler.release(ticket)
+        ticket = None
+    plan['ticket'] = ticket
+    return plan
+
+def build_chat_plan(data, model, message, language, conversation_id, request_options, connection_info):
+    """Conversa, contexto, documentos e cache de um pedido de chat já admitido"""
+    # "documents": true (todos) ou lista de ids: trechos relevantes entram no prompt de sistema
+    system_prompt = get_translation('system_prompt', language)
+    sources = []
+    if data.get('documents') and document_index is not None:
+        try:
+            results = retrieve_documents(message, data['documents'])
+        except EmbeddingError as e:
+            return {'error': f'Erro ao consultar documentos: {e}', 'status': 502}
+        system_prompt, sources = documents_system_prompt(
+            system_prompt, results, context_manager.num_ctx(model), language)
+    
+    if not conversation_id:
+        conversation_id = conversation_store.create_conversation(message[:60], model, language)
+    
+    # O contexto é reconstruído a partir do histórico salvo no servidor,
+    # dentro do orçamento de tokens do modelo
+    messages, options, context_info = context_manager.build_messages(
+        conversation_id, model,
+        system_prompt,
+        message,
+        get_translation('summary_prompt', language),
+        get_translation('summary_prefix', language)
+    )
+    
+    for key in SAMPLING_OPTIONS:
+        if key in request_options:
+            options[key] = request_options[key]
+    
+    payload = {
+        "model": model,
+        "messages": messages,
+        "options": options,
+        "keep_alive": residency.keep_alive,
+        "stream": True
+    }
+    residency.touch(model)
+    
+    # Cache só para pedidos determinísticos de modelos com digest conhecido
+    cache_key = None
+    cached = None
+    cache_status = 'BYPASS'
+    digest = connection_info['digests'].get(model)
+    if data.get('cache') and digest and ResponseCache.is_deterministic(options):
+        cache_key = ResponseCache.make_key(model, digest, messages, options)
+        cached = response_cache.get(cache_key)
+        cache_status = 'HIT' if cached else 'MISS'
+    
+    def record_user():
+        conversation_store.append_message(conversation_id, 'user', message, tokens=estimate_tokens(message))
+    
+    def on_complete(parts, stats):
+        text = ''.join(parts)
+        conversation_store.append_message(conversation_id, 'assistant', text, model, estimate_tokens(text))
+        if cache_status == 'MISS':
+            response_cache.put(cache_key, model, parts, stats)
+    
+    def on_cancel(parts):
+        # Guarda o trecho já gerado (sem cache: a resposta está incompleta)
+        text = ''.join(parts)
+        if text:
+            conversation_store.append_message(conversation_id, 'assistant', text, model, estimate_tokens(text))
+    
+    generation_id = new_generation_id()
+    return {
+        'model': model,
+        'payload': payload,
+        'cached': cached,
+        'generation_id': generation_id,
+        'extra': {'conversation_id': conversation_id, 'generation_id': generation_id, 'context': context_info,
+                  'sources': sources},
+        'headers': {
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'X-Conversation-Id': conversation_id,
+            'X-Generation-Id': generation_id,
+            'X-Cache': cache_status
+        },
+        'record_user': record_user,
+        'on_complete': on_complete,
+        'on_cancel': on_cancel
+    }
+
+def warning_events(warning):
+    return sse_event({'content': warning, 'done': False}) + sse_event({'content': '', 'done': True})
+
+def stream_ollama_chat(response, plan, start_time, generation):
+    """Repassa o NDJSON do Ollama como eventos SSE, token a token.
+
+    Cancelamento pelo id ou desconexão do cliente fecham a conexão com o
+    Ollama (no `finally`), o que interrompe a geração no servidor.
+    """
+    relay = ChatRelay(plan['model'], start_time, plan['extra'])
+    try:
+        for line in response.iter_lines():
+            if relay.finished:
+                continue  # Lê até o fim do corpo para a conexão voltar ao pool
+            if generation.cancelled:
+                plan['on_cancel'](relay.parts)
+                yield relay.cancel(generation.reason)
+                return
+            events = relay.feed(line)
+            if relay.stats is not None:
+                # Salva antes do último evento: o cliente pode fechar logo em seguida
+                plan['on_complete'](relay.parts, relay.stats)
+            for event in events:
+                yield event
+    except requests.exceptions.Timeout:
+        yield relay.error('Timeout - Modelo muito lento', 'timeout')
+    except requests.exceptions.RequestException as e:
+        yield relay.error(f'Conexão com o Ollama interrompida: {e}', 'stream')
+    except GeneratorExit:
+        # O servidor WSGI fecha o gerador quando a escrita para o cliente falha
+        if not relay.finished:
+            relay.cancel('disconnect')
+            plan['on_cancel'](relay.parts)
+        raise
+    finally:
+        response.close()
+
+def queued_chat(ticket, plan, generation):
+    """Avisa a posição na fila até o slot ser liberado e então gera a resposta"""
+    relay = ChatRelay(plan['model'], time.time(), plan['extra'])
+    yield queue_event(chat_scheduler.position(ticket))
+    while not ticket.wait(QUEUE_UPDATE_INTERVAL):
+        if generation.cancelled:
+            # Ainda na fila: nada foi gerado e o agendador conta a desistência
+            yield cancelled_event(plan['extra'])
+            return
+        if time.time() - ticket.enqueued_at > QUEUE_TIMEOUT:
+            yield relay.error('Tempo de espera na fila esgotado')
+            return
+        yield queue_event(chat_scheduler.position(ticket))
+    if generation.cancelled:
+        yield cancelled_event(plan['extra'])
+        return
+    
+    make_room_for(plan['model'])
+    start_time = time.time()
+    try:
+        response = ollama.post('/api/chat', json=plan['payload'], stream=True)
+    except requests.exceptions.Timeout:
+        yield relay.error('Timeout - Modelo muito lento', 'timeout')
+        return
+    except requests.exceptions.ConnectionError:
+        invalidate_connection_state()
+        yield relay.error('Ollama não está rodando', 'connection')
+        return
+    
+    if response.status_code != 200:
+        error_msg = f'Erro do Ollama: {response.status_code}'
+        try:
+            error_msg = response.json().get('error', error_msg)
+        except ValueError:
+            pass
+        response.close()
+        yield relay.error(error_msg, 'http')
+        return
+    
+    plan['record_user']()
+    yield from stream_ollama_chat(response, plan, start_time, generation)
+
+def replay_cached_chat(plan):
+    """Reproduz uma resposta em cache pelo mesmo formato SSE do streaming"""
+    entry = plan['cached']
+    chat_requests.inc(model=plan['model'], status='cached')
+    for part in entry['parts']:
+        yield sse_event({'content': part, 'done': False})
+    plan['on_complete'](entry['parts'], entry['stats'])
+    yield sse_event({
+        **plan['extra'],
+        'content': '',
+        'done': True,
+        **entry['stats'],
+        'ttft': 0,
+        'cached': True
+    })
+
+@app.route('/api/chat', methods=['POST'])
+def chat():
+    try:
+        try:
+            plan = prepare_chat(
+                request.json or {}, client_key(request.headers.get('X-Forwarded-For'), request.remote_addr)
+            )
+        except SchedulerFull as e:
+            chat_requests.inc(model=e.model, status='rejected')
+            return jsonify(queue_full_payload(e)), 429, {'Retry-After': str(e.retry_after)}
         
-        start_time = time.time()
-        response = requests.post(f"{OLLAMA_URL}/api/chat", json=payload, timeout=120)
-        end_time = time.time()
+        if 'error' in plan:
+            return jsonify({'error': plan['error']}), plan['status']
+        if 'warning' in plan:
+            return Response(warning_events(plan['warning']), mimetype='text/event-stream')
         
-        print(f"⏱️  Tempo de resposta: {end_time - start_time:.2f}s")
+        if plan['cached']:
+            logger.debug("📦 Resposta de %s servida do cache", plan['model'], extra={'model': plan['model']})
+            plan['record_user']()
+            return Response(
+                stream_with_context(replay_cached_chat(plan)),
+                mimetype='text/event-stream',
+                headers=plan['headers']
+            )
         
-        if response.status_code == 200:
-            data = response.json()
-            response_text = data['message']['content']
-            print(f"✅ Resposta recebida de {model}")
-            return jsonify({'response': response_text})
-        else:
-            error_msg = f'Erro do Ollama: {response.status_code}'
-            try:
-                error_data = response.json()
-                error_msg = error_data.get('error', error_msg)
-            except:
-                pass
-            return jsonify({'error': error_msg}), 500
+        ticket = plan['ticket']
+        generation = generations.begin(plan['generation_id'], plan['model'])
+        
+        def finish():
+            chat_scheduler.release(ticket)
+            generations.finish(generation)
+        
+        try:
+            if not ticket.granted:
+                # Na fila: responde já com o stream, que informa a posição até começar
+                events = queued_chat(ticket, plan, generation)
+            else:
+                make_room_for(plan['model'])
+                start_time = time.time()
+                # O timeout de leitura vale entre tokens, não para a resposta inteira
+                response = ollama.post('/api/chat', json=plan['payload'], stream=True)
+                
+                if response.status_code != 200:
+                    error_msg = f'Erro do Ollama: {response.status_code}'
+                    try:
+                        error_data = response.json()
+                        error_msg = error_data.get('error', error_msg)
+                    except:
+                        pass
+                    response.close()
+                    finish()
+                    record_chat_error(plan['model'], 'http')
+                    return jsonify({'error': error_msg}), 500
+                
+                plan['record_user']()
+                events = stream_ollama_chat(response, plan, start_time, generation)
+        except Exception:
+            finish()
+            raise
+        
+        result = Response(
+            stream_with_context(events),
+            mimetype='text/event-stream',
+            headers=plan['headers']
+        )
+        # Libera o slot quando a resposta termina ou o cliente desconecta
+        result.call_on_close(finish)
+        return result
             
     except requests.exceptions.Timeout:
+        upstream_errors.inc(kind='timeout')
         return jsonify({'error': 'Timeout - Modelo muito lento'}), 408
     except requests.exceptions.ConnectionError:
+        upstream_errors.inc(kind='connection')
+        invalidate_connection_state()
         return jsonify({'error': 'Ollama não está rodando'}), 503
     except Exception as e:
+        logger.exception("❌ Erro no chat")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health')
-def health_check():
-    connection_info = test_ollama_connection()
+@app.route('/api/chat/<generation_id>/cancel', methods=['POST'])
+def cancel_chat(generation_id):
+    """Interrompe uma geração em andamento (botão de parar da interface)"""
+    if not generations.cancel(generation_id):
+        return jsonify({'error': 'Geração não encontrada ou já concluída'}), 404
+    return jsonify({'success': True, 'generation_id': generation_id})
+
+def prepare_compare(data):
+    """Valida o pedido de comparação e monta o payload de cada modelo.
+
+    Retorna {'error', 'status'} ou o plano; usado pelos modos Flask e asyncio.
+    A comparação não grava conversa nem usa o cache de respostas.
+    """
+    message = (data.get('message') or '').strip()
+    models = data.get('models')
+    language = data.get('language', 'pt')
+    request_options = data.get('options') or {}
     
-    return jsonify({
+    if not message:
+        return {'error': 'Mensagem vazia', 'status': 400}
+    if not isinstance(models, list) or len(set(models)) < 2:
+        return {'error': 'Informe ao menos dois modelos para comparar', 'status': 400}
+    models = list(dict.fromkeys(models))
+    if len(models) > MAX_COMPARE_MODELS:
+        return {'error': f'No máximo {MAX_COMPARE_MODELS} modelos por comparação', 'status': 400}
+    
+    connection_info = get_connection_info()
+    if not connection_info['connected']:
+        return {'error': 'Ollama não está rodando', 'status': 503}
+    missing = [model for model in models if model not in connection_info['models']]
+    if missing:
+        return {'error': f"Modelos não instalados: {', '.join(missing)}", 'status': 400}
+    
+    messages = [
+        {'role': 'system', 'content': data.get('system') or get_translation('system_prompt', language)},
+        {'role': 'user', 'content': message}
+    ]
+    payloads = {}
+    for model in models:
+        options = {'num_ctx': context_manager.num_ctx(model)}
+        for key in SAMPLING_OPTIONS:
+            if key in request_options:
+                options[key] = request_options[key]
+        payloads[model] = {
+            'model': model,
+            'messages': messages,
+            'options': options,
+            'keep_alive': residency.keep_alive,
+            'stream': True
+        }
+        residency.touch(model)
+    
+    logger.debug("⚖️  Comparando %s", ', '.join(models), extra={'models': models})
+    generation_id = new_generation_id()
+    return {
+        'models': models,
+        'payloads': payloads,
+        'generation_id': generation_id,
+        'headers': {
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+            'X-Generation-Id': generation_id
+        }
+    }
+
+def compare_event(event_type, model, data):
+    """Evento SSE nomeado ('queued', 'token', 'done' ou 'error') de um dos modelos"""
+    return named_sse_event(event_type, {'model': model, **data})
+
+def compare_entry(relay, status, started_at):
+    """Resumo de um modelo: espera na fila, TTFT, tokens/s e tempo total"""
+    stats = relay.stats or {}
+    ttft = relay.first_token_time - relay.start_time if relay.first_token_time else None
+    eval_duration = stats.get('eval_duration', 0)
+    eval_count = stats.get('eval_count', len(relay.parts))
+    return {
+        'status': status,
+        'queue_wait': round(relay.start_time - started_at, 3),
+        'ttft': round(ttft, 3) if ttft is not None else None,
+        'tokens_per_second': round(eval_count / (eval_duration / 1e9), 1) if eval_duration else None,
+        'eval_count': eval_count,
+        'load_duration': round(stats.get('load_duration', 0) / 1e9, 3),
+        'total_time': round(time.time() - started_at, 3)
+    }
+
+def compare_summary(plan, entries, started_at):
+    return {
+        'generation_id': plan['generation_id'],
+        'total_time': round(time.time() - started_at, 3),
+        'models': {model: entries[model] for model in plan['models']}
+    }
+
+def run_compare_model(model, plan, generation, user, emit):
+    """Gera a resposta de um modelo da comparação, entregando cada evento SSE a `emit`.
+
+    Passa pelo agendador como um chat comum (respeita o limite do modelo) e
+    retorna o resumo do modelo.
+    """
+    relay = ChatRelay(model, time.time())
+    started_at = relay.start_time
+    try:
+        ticket = chat_scheduler.submit(model, user)
+    except SchedulerFull as e:
+        chat_requests.inc(model=model, status='rejected')
+        emit(compare_event('error', model, {'error': str(e), 'retry_after': e.retry_after}))
+        return compare_entry(relay, 'rejected', started_at)
+    
+    try:
+        if not ticket.granted:
+            emit(compare_event('queued', model, {'position': chat_scheduler.position(ticket)}))
+        while not ticket.wait(QUEUE_UPDATE_INTERVAL):
+            if generation.cancelled:
+                return compare_entry(relay, 'cancelled', started_at)
+            if time.time() - ticket.enqueued_at > QUEUE_TIMEOUT:
+                emit(compare_event('error', model, {'error': 'Tempo de espera na fila esgotado'}))
+                return compare_entry(relay, 'error', started_at)
+            emit(compare_event('queued', model, {'position': chat_scheduler.position(ticket)}))
+        if generation.cancelled:
+            return compare_entry(relay, 'cancelled', started_at)
+        
+        make_room_for(model)
+        relay.start_time = time.time()
+        try:
+            response = ollama.post('/api/chat', json=plan['payloads'][model], stream=True)
+        except requests.exceptions.RequestException as e:
+            record_chat_error(model, 'timeout' if isinstance(e, requests.exceptions.Timeout) else 'connection')
+            emit(compare_event('error', model, {'error': f'Ollama não respondeu: {e}'}))
+            return compare_entry(relay, 'error', started_at)
+        
+        with response:
+            if response.status_code != 200:
+                error_msg = f'Erro do Ollama: {response.status_code}'
+                try:
+                    error_msg = response.json().get('error', error_msg)
+                except ValueError:
+                    pass
+                record_chat_error(model, 'http')
+                emit(compare_event('error', model, {'error': error_msg}))
+                return compare_entry(relay, 'error', started_at)
+            
+            try:
+                for line in response.iter_lines():
+                    if relay.finished:
+                        continue  # Lê até o fim do corpo para a conexão voltar ao pool
+                    if generation.cancelled:
+                        relay.cancel(generation.reason)
+                        return compare_entry(relay, 'cancelled', started_at)
+                    for data in relay.parse(line):
+                        if 'error' in data:
+                            emit(compare_event('error', model, data))
+                            return compare_entry(relay, 'error', started_at)
+                        emit(compare_event('done' if data['done'] else 'token', model, data))
+            except requests.exceptions.RequestException as e:
+                relay.error(str(e), 'stream')
+                emit(compare_event('error', model, {'error': f'Conexão com o Ollama interrompida: {e}'}))
+                return compare_entry(relay, 'error', started_at)
+        
+        if relay.stats is None:
+            record_chat_error(model, 'stream')
+            emit(compare_event('error', model, {'error': 'Resposta do Ollama incompleta'}))
+            return compare_entry(relay, 'error', started_at)
+        return compare_entry(relay, 'completed', started_at)
+    finally:
+        chat_scheduler.release(ticket)
+
+@app.route('/api/compare', methods=['POST'])
+def compare():
+    """Envia o mesmo prompt a vários modelos ao mesmo tempo.
+
+    Um único stream SSE intercala os eventos de todos ('queued', 'token',
+    'done', 'error', cada um com o campo `model`) e termina com 'summary':
+    TTFT, tokens/s e tempo total de cada modelo.
+    """
+    plan = prepare_compare(request.json or {})
+    if 'error' in plan:
+        return jsonify({'error': plan['error']}), plan['status']
+    
+    user = client_key(request.headers.get('X-Forwarded-For'), request.remote_addr)
+    generation = generations.begin(plan['generation_id'], ','.join(plan['models']))
+    events = queue.Queue()
+    started_at = time.time()
+    
+    def run(model):
+        entry = run_compare_model(model, plan, generation, user, events.put)
+        events.put((model, entry))
+    
+    for model in plan['models']:
+        threading.Thread(target=run, args=(model,), name=f'compare-{model}', daemon=True).start()
+    
+    def generate():
+        entries = {}
+        try:
+            while len(entries) < len(plan['models']):
+                item = events.get()
+                if isinstance(item, tuple):
+                    entries[item[0]] = item[1]
+                else:
+                    yield item
+            yield named_sse_event('summary', compare_summary(plan, entries, started_at))
+        except GeneratorExit:
+            # Cliente desconectou: as threads param na próxima linha do Ollama
+            if not generation.cancelled:
+                generation.reason = 'disconnect'
+            raise
+    
+    result = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=plan['headers'])
+    result.call_on_close(lambda: generations.finish(generation))
+    return result
+
+@app.route('/api/conversations', methods=['GET'])
+def list_conversations():
+    """Lista conversas, mais recentes primeiro (paginação por cursor)"""
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    conversations, next_cursor = conversation_store.list_conversations(limit, request.args.get('before'))
+    return cached_json({'conversations': conversations, 'next_cursor': next_cursor})
+
+@app.route('/api/conversations', methods=['POST'])
+def create_conversation():
+    data = request.json or {}
+    conversation_id = conversation_store.create_conversation(
+        data.get('title', ''), data.get('model'), data.get('language', 'pt')
+    )
+    return jsonify({'conversation': conversation_store.get_conversation(conversation_id)}), 201
+
+@app.route('/api/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    if not conversation_store.delete_conversation(conversation_id):
+        return jsonify({'error': 'Conversa não encontrada'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/conversations/<conversation_id>/messages')
+def get_conversation_messages(conversation_id):
+    """Página de mensagens; `before` é o id da mensagem mais antiga já carregada"""
+    conversation = conversation_store.get_conversation(conversation_id)
+    if not conversation:
+        return jsonify({'error': 'Conversa não encontrada'}), 404
+    
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    messages, next_cursor = conversation_store.get_messages(
+        conversation_id, limit, request.args.get('before', type=int)
+    )
+    return cached_json({
+        'conversation': conversation,
+        'messages': messages,
+        'next_cursor': next_cursor
+    })
+
+def export_conversation_lines(conversation, export_format, language='pt'):
+    """Gera o conteúdo exportado linha a linha direto do banco"""
+    messages = conversation_store.iter_messages(conversation['id'])
+    
+    if export_format == 'json':
+        yield '{"conversation": ' + json.dumps(conversation, ensure_ascii=False) + ', "messages": ['
+        for i, message in enumerate(messages):
+            yield (',' if i else '') + '\n' + json.dumps(message, ensure_ascii=False)
+        yield '\n]}\n'
+        return
+    
+    roles = {
+        'user': get_translation('role_user', language),
+        'assistant': get_translation('role_assistant', language)
+    }
+    exported_at = datetime.now().strftime('%Y-%m-%d %H:%M')
+    
+    if export_format == 'md':
+        yield f"# {conversation['title'] or 'OllamaGUI'}\n\n"
+        yield f"_{conversation['model'] or ''} · {exported_at}_\n\n"
+        for message in messages:
+            yield f"**{roles.get(message['role'], message['role'])}:**\n\n{message['content']}\n\n"
+    else:
+        yield f"OllamaGUI - {conversation['title']}\n"
+        yield f"{conversation['model'] or ''} - {exported_at}\n\n"
+        for message in messages:
+            yield f"{roles.get(message['role'], message['role'])}: {message['content']}\n\n"
+
+EXPORT_MIMETYPES = {
+    'txt': 'text/plain',
+    'md': 'text/markdown',
+    'json': 'application/json'
+}
+
+def conversation_export_response(conversation_id, export_format, language):
+    if export_format not in EXPORT_MIMETYPES:
+        return jsonify({'error': 'Formato de exportação inválido'}), 400
+    
+    conversation = conversation_store.get_conversation(conversation_id)
+    if not conversation:
+        return jsonify({'error': 'Conversa não encontrada'}), 404
+    
+    filename = f"ollamagui-{datetime.fromtimestamp(conversation['created_at']).strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(export_conversation_lines(conversation, export_format, language)),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+@app.route('/api/conversations/<conversation_id>/export')
+def export_conversation(conversation_id):
+    """Exporta uma conversa em txt, md ou json, em streaming"""
+    return conversation_export_response(
+        conversation_id,
+        request.args.get('format', 'txt'),
+        request.args.get('language', 'pt')
+    )
+
+@app.route('/api/export', methods=['POST'])
+def export_conversation_post():
+    data = request.json or {}
+    if not data.get('conversation_id'):
+        return jsonify({'error': 'Conversa não informada'}), 400
+    return conversation_export_response(
+        data['conversation_id'],
+        data.get('format', 'txt'),
+        data.get('language', 'pt')
+    )
+
+def health_payload(connection_info):
+    return {
         'status': 'healthy' if connection_info['connected'] else 'error',
         'ollama': 'connected' if connection_info['connected'] else 'disconnected',
         'message': connection_info['message'],
         'method': connection_info['method'],
+        'last_check': connection_info['last_check'],
+        'loaded_models': sorted(residency.status()['loaded']),
+        'backends': {
+            'total': len(ollama.urls),
+            'healthy': sum(1 for entry in ollama.status().values() if entry['healthy'])
+        },
         'timestamp': datetime.now().isoformat()
-    })
+    }
+
+@app.route('/api/health')
+def health_check():
+    payload = health_payload(get_connection_info())
+    payload['scheduler'] = chat_scheduler.stats()
+    # Sem ETag: o timestamp e os contadores mudam a cada requisição
+    return jsonify(payload)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Métricas no formato de texto do Prometheus, somadas entre os workers"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/api/translations/<lang>')
 def get_translations(lang):
     translations = LANGUAGES.get(lang, LANGUAGES['pt'])
-    return jsonify({
+    return cached_json({
         'language': lang,
         'translations': translations
-    })
+    }, max_age=3600)
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='OllamaGUI - interface web para o Ollama')
+    parser.add_argument('--mode', choices=['dev', 'async', 'production'],
+                        default=os.environ.get('OLLAMAGUI_MODE', 'dev'),
+                        help='dev: servidor Flask com debug; async: servidor asyncio (aiohttp); '
+                             'production: vários workers gunicorn com estado compartilhado')
+    parser.add_argument('--host', default=os.environ.get('OLLAMAGUI_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('OLLAMAGUI_PORT', 5000)))
+    parser.add_argument('--threads', type=int, default=32,
+                        help='threads por worker (production) ou para E/S local (async)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('OLLAMAGUI_WORKERS', 0)),
+                        help='número de workers no modo production (padrão: núcleos da CPU)')
+    parser.add_argument('--worker-class', choices=['gthread', 'aiohttp'], default='gthread',
+                        help='tipo de worker no modo production')
+    parser.add_argument('--log-level', default=os.environ.get('OLLAMAGUI_LOG_LEVEL', 'INFO'),
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], type=str.upper,
+                        help='nível dos logs (DEBUG inclui uma linha por requisição)')
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+    
     print("=" * 60)
     print("🚀 OllamaGUI - Interface Completa com Loja de Modelos")
     print("=" * 60)
@@ -609,12 +2072,25 @@ if __name__ == '__main__':
         print("💡 Para conectar ao Ollama, execute em outro terminal:")
         print("   ollama serve")
     
-    print("📡 Servidor: http://localhost:5000")
-    print("🔗 Ollama: http://localhost:11434")
+    print(f"📡 Servidor: http://localhost:{args.port} (modo {args.mode})")
+    print(f"🔗 Ollama: {OLLAMA_URL}")
     print("🌐 Idiomas: pt, en, es")
     print("🛒 Loja de modelos online: ✅ Ativa")
     print("🔍 Busca por modelos: ✅ Ativa")
     print("📊 Categorização: Popular, Novos, Code, Chat")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    if args.mode != 'production' and shared_state.shared:
+        reset_runtime_state()
+    
+    if args.mode == 'async':
+        import async_server
+        async_server.run(sys.modules[__name__], host=args.host, port=args.port, threads=args.threads)
+    elif args.mode == 'production':
+        import production_server
+        production_server.run(
+            sys.modules[__name__], host=args.host, port=args.port,
+            workers=args.workers or None, threads=args.threads, worker_class=args.worker_class
+        )
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
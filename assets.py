@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Pipeline de arquivos estáticos da interface.
+
+Minifica os arquivos de static/, nomeia cada um pelo hash do conteúdo
+(script.3f2a9c1b04de.js), grava as versões pré-comprimidas (.gz e, com o
+pacote Brotli, .br) em static/dist e mantém o manifesto nome lógico -> arquivo.
+Como o nome muda com o conteúdo, os arquivos podem ser servidos como imutáveis.
+
+Uso direto: python assets.py (gera static/dist antes do deploy)
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+from http_cache import accepted_encodings, brotli
+
+SOURCES = ('css/style.css', 'js/script.js')
+VERSIONED_NAME = re.compile(r'^[\w-]+\.[0-9a-f]{12}\.(css|js)$')
+
+logger = logging.getLogger(__name__)
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+def minify_js(source):
+    """Remove indentação, linhas vazias e linhas só de comentário.
+
+    Conservador de propósito: mantém as quebras de linha (inserção automática
+    de ponto e vírgula) e não toca em comentários no fim de linhas de código.
+    """
+    lines = []
+    for line in source.splitlines():
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+class AssetPipeline:
+    """Gera e localiza os arquivos versionados servidos em `url_prefix`"""
+
+    def __init__(self, source_dir, build_dir, url_prefix='/assets'):
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+        self._manifest = {}     # nome lógico -> arquivo versionado
+        self._mtimes = {}       # nome lógico -> mtime do fonte usado no build
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Gera todos os arquivos e grava o manifesto"""
+        for name in SOURCES:
+            self._build(name)
+        with open(os.path.join(self.build_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(self._manifest, f, indent=2)
+        return dict(self._manifest)
+
+    def url(self, name):
+        """URL versionada de um arquivo (refeita se o fonte mudou, útil no modo dev)"""
+        mtime = os.stat(os.path.join(self.source_dir, name)).st_mtime_ns
+        if self._mtimes.get(name) != mtime:
+            self._build(name)
+        return f"{self.url_prefix}/{self._manifest[name]}"
+
+    def lookup(self, filename, accept_encoding=''):
+        """Caminho e codificação da melhor variante de `filename`, ou None"""
+        # Qualquer versão gerada, não só a atual: outro worker (ou o deploy
+        # anterior) pode ter entregue uma página que ainda aponta para ela
+        if not VERSIONED_NAME.match(filename):
+            return None
+        path = os.path.join(self.build_dir, filename)
+        if not os.path.exists(path):
+            return None
+        
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in accepted and os.path.exists(path + suffix):
+                return path + suffix, encoding
+        return path, None
+
+    def _build(self, name):
+        with self._lock:
+            source_path = os.path.join(self.source_dir, name)
+            mtime = os.stat(source_path).st_mtime_ns
+            with open(source_path, encoding='utf-8') as f:
+                source = f.read()
+            
+            base, ext = os.path.splitext(os.path.basename(name))
+            content = MINIFIERS.get(ext, lambda text: text)(source).encode('utf-8')
+            filename = f"{base}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+            
+            path = os.path.join(self.build_dir, filename)
+            if not os.path.exists(path):
+                os.makedirs(self.build_dir, exist_ok=True)
+                # Arquivos temporários + rename: vários workers podem gerar o mesmo build
+                self._write(path + '.gz', gzip.compress(content, compresslevel=9))
+                if brotli is not None:
+                    self._write(path + '.br', brotli.compress(content, quality=11))
+                self._write(path, content)
+                logger.info("📦 %s -> %s (%d -> %d bytes)", name, filename, len(source), len(content))
+            
+            self._manifest[name] = filename
+            self._mtimes[name] = mtime
+
+    @staticmethod
+    def _write(path, data):
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+if __name__ == '__main__':
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    pipeline = AssetPipeline(root, os.path.join(root, 'dist'))
+    for name, filename in pipeline.build().items():
+        print(f"{name} -> {filename}")
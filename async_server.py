@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Modo de servidor asyncio (aiohttp) para chats em streaming com alta concorrência.
+
+As rotas de chat, saúde e modelos rodam no event loop, com E/S não bloqueante
+para o Ollama: cada chat em andamento é uma corrotina, não uma thread. As demais
+rotas continuam sendo atendidas pelo app Flask através de uma ponte WSGI.
+
+Uso: python app.py --mode async
+"""
+
+import asyncio
+import io
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aiohttp import web, ClientConnectorError, ClientError, ClientSession, ClientTimeout, TCPConnector
+from multidict import CIMultiDict
+
+import http_cache
+from event_bus import SUBSCRIBER_BUFFER
+
+# Cabeçalhos que o aiohttp recalcula ao montar a resposta da ponte WSGI
+HOP_BY_HOP_HEADERS = {'content-length', 'transfer-encoding', 'connection'}
+WSGI_BUFFER_LIMIT = 1024 * 1024   # respostas maiores (ou sem Content-Length) vão em streaming
+WSGI_QUEUE_SIZE = 64              # partes do iterável WSGI aguardando envio
+
+logger = logging.getLogger(__name__)
+
+async def run_blocking(func, *args):
+    """Executa E/S local (SQLite, estado em cache) fora do event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args))
+
+async def chat(request):
+    gui = request.app['gui']
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    
+    user = gui.client_key(request.headers.get('X-Forwarded-For'), request.remote)
+    try:
+        plan = await run_blocking(gui.prepare_chat, data or {}, user)
+    except gui.SchedulerFull as e:
+        gui.chat_requests.inc(model=e.model, status='rejected')
+        return web.json_response(gui.queue_full_payload(e), status=429,
+                                 headers={'Retry-After': str(e.retry_after)})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+    
+    if 'error' in plan:
+        return web.json_response({'error': plan['error']}, status=plan['status'])
+    if 'warning' in plan:
+        return web.Response(text=gui.warning_events(plan['warning']), content_type='text/event-stream')
+    
+    response = web.StreamResponse(headers=plan['headers'])
+    response.content_type = 'text/event-stream'
+    
+    if plan['cached']:
+        logger.debug("📦 Resposta de %s servida do cache", plan['model'], extra={'model': plan['model']})
+        await run_blocking(plan['record_user'])
+        events = await run_blocking(lambda: list(gui.replay_cached_chat(plan)))
+        await response.prepare(request)
+        for event in events:
+            await response.write(event.encode('utf-8'))
+        await response.write_eof()
+        return response
+    
+    ticket = plan['ticket']
+    generation = gui.generations.begin(plan['generation_id'], plan['model'])
+    try:
+        if not ticket.granted:
+            # Na fila: responde já com o stream, que informa a posição até começar
+            await response.prepare(request)
+            if not await wait_for_slot(gui, ticket, plan, response, generation):
+                await response.write_eof()
+                return response
+        return await stream_upstream(request, gui, plan, response, generation)
+    finally:
+        gui.chat_scheduler.release(ticket)
+        gui.generations.finish(generation)
+
+async def wait_for_slot(gui, ticket, plan, response, generation):
+    """Envia a posição na fila até o ticket receber um slot (False se desistiu)"""
+    loop = asyncio.get_running_loop()
+    granted = asyncio.Event()
+    gui.chat_scheduler.on_grant(ticket, lambda: loop.call_soon_threadsafe(granted.set))
+    await response.write(gui.queue_event(gui.chat_scheduler.position(ticket)).encode('utf-8'))
+    
+    while not granted.is_set():
+        try:
+            await asyncio.wait_for(granted.wait(), gui.QUEUE_UPDATE_INTERVAL)
+        except asyncio.TimeoutError:
+            if generation.cancelled:
+                # Ainda na fila: nada foi gerado e o agendador conta a desistência
+                await response.write(gui.cancelled_event(plan['extra']).encode('utf-8'))
+                return False
+            if time.time() - ticket.enqueued_at > gui.QUEUE_TIMEOUT:
+                relay = gui.ChatRelay(plan['model'], time.time(), plan['extra'])
+                await response.write(relay.error('Tempo de espera na fila esgotado').encode('utf-8'))
+                return False
+            event = gui.queue_event(gui.chat_scheduler.position(ticket))
+            await response.write(event.encode('utf-8'))
+    if generation.cancelled:
+        await response.write(gui.cancelled_event(plan['extra']).encode('utf-8'))
+        return False
+    return True
+
+async def open_upstream(session, gui, payload):
+    """Envia o /api/chat ao servidor com o modelo, passando ao próximo se ele estiver fora do ar.
+
+    Retorna (servidor, resposta, None) com o servidor ocupado no pool (quem
+    chama o libera) ou (None, None, (mensagem, status, tipo)) em caso de erro.
+    """
+    pool = gui.ollama
+    # Orçamento de memória: descarrega modelos ociosos antes de carregar um frio
+    await run_blocking(gui.make_room_for, payload['model'])
+    tried = []
+    while True:
+        # Servidor com o modelo (carregado, de preferência) e menos ocupado
+        backend = pool.choose(payload['model'], exclude=tried)
+        if backend is None:
+            gui.invalidate_connection_state()
+            return None, None, ('Ollama não está rodando', 503, 'connection')
+        
+        pool.acquire(backend)
+        try:
+            return backend, await session.post(f"{backend}/api/chat", json=payload), None
+        except asyncio.TimeoutError:
+            pool.release(backend)
+            return None, None, ('Timeout - Modelo muito lento', 408, 'timeout')
+        except ClientConnectorError as e:
+            # Servidor fora do ar: sai do rodízio e o pedido vai para outro
+            pool.release(backend)
+            pool.eject(backend, e)
+            gui.on_backend_failure(backend)
+            tried.append(backend)
+        except ClientError:
+            pool.release(backend)
+            gui.invalidate_connection_state()
+            return None, None, ('Ollama não está rodando', 503, 'connection')
+
+async def stream_upstream(request, gui, plan, response, generation):
+    """Chama o /api/chat do Ollama e repassa o stream (com o slot já reservado).
+
+    Cancelamento pelo id ou desconexão do cliente fecham a conexão com o
+    Ollama, o que interrompe a geração no servidor.
+    """
+    session = request.app['ollama_session']
+    start_time = time.time()
+    relay = gui.ChatRelay(plan['model'], start_time, plan['extra'])
+    
+    async def fail(message, status, kind):
+        # Antes do stream começar, erro HTTP; depois (cliente na fila), evento SSE
+        gui.record_chat_error(plan['model'], kind)
+        if not response.prepared:
+            return web.json_response({'error': message}, status=status)
+        await response.write(relay.error(message).encode('utf-8'))
+        await response.write_eof()
+        return response
+    
+    pool = gui.ollama
+    backend, upstream, error = await open_upstream(session, gui, plan['payload'])
+    if error:
+        return await fail(*error)
+    
+    try:
+        async with upstream:
+            if upstream.status != 200:
+                error_msg = f'Erro do Ollama: {upstream.status}'
+                try:
+                    error_msg = (await upstream.json(content_type=None)).get('error', error_msg)
+                except Exception:
+                    pass
+                return await fail(error_msg, 500, 'http')
+            
+            await run_blocking(plan['record_user'])
+            if not response.prepared:
+                await response.prepare(request)
+            
+            try:
+                async for line in upstream.content:
+                    if relay.finished:
+                        continue  # Lê até o fim do corpo para a conexão voltar ao pool
+                    if generation.cancelled:
+                        upstream.close()
+                        await run_blocking(plan['on_cancel'], relay.parts)
+                        await response.write(relay.cancel(generation.reason).encode('utf-8'))
+                        break
+                    events = relay.feed(line.strip())
+                    if relay.stats is not None:
+                        # Salva antes do último evento: o cliente pode fechar logo em seguida
+                        await run_blocking(plan['on_complete'], relay.parts, relay.stats)
+                    for event in events:
+                        await response.write(event.encode('utf-8'))
+            except (ConnectionResetError, asyncio.CancelledError) as e:
+                # Cliente desconectou: não há mais para quem escrever (vem antes de
+                # ClientError, que também cobre o ClientConnectionResetError da escrita)
+                upstream.close()
+                if not relay.finished:
+                    relay.cancel('disconnect')
+                    await run_blocking(plan['on_cancel'], relay.parts)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return response
+            except asyncio.TimeoutError:
+                await response.write(relay.error('Timeout - Modelo muito lento', 'timeout').encode('utf-8'))
+            except ClientError as e:
+                await response.write(relay.error(f'Conexão com o Ollama interrompida: {e}', 'stream').encode('utf-8'))
+    finally:
+        pool.release(backend)
+    
+    await response.write_eof()
+    return response
+
+async def compare(request):
+    """Versão asyncio de /api/compare: uma tarefa por modelo, eventos intercalados num só stream"""
+    gui = request.app['gui']
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    
+    try:
+        plan = await run_blocking(gui.prepare_compare, data or {})
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+    if 'error' in plan:
+        return web.json_response({'error': plan['error']}, status=plan['status'])
+    
+    response = web.StreamResponse(headers=plan['headers'])
+    response.content_type = 'text/event-stream'
+    await response.prepare(request)
+    
+    user = gui.client_key(request.headers.get('X-Forwarded-For'), request.remote)
+    generation = gui.generations.begin(plan['generation_id'], ','.join(plan['models']))
+    events = asyncio.Queue()
+    started_at = time.time()
+    
+    async def run(model):
+        entry = await compare_model(request, gui, plan, model, generation, user, events.put_nowait)
+        events.put_nowait((model, entry))
+    
+    tasks = [asyncio.create_task(run(model)) for model in plan['models']]
+    entries = {}
+    try:
+        while len(entries) < len(plan['models']):
+            item = await events.get()
+            if isinstance(item, tuple):
+                entries[item[0]] = item[1]
+            else:
+                await response.write(item.encode('utf-8'))
+        summary = gui.compare_summary(plan, entries, started_at)
+        await response.write(gui.named_sse_event('summary', summary).encode('utf-8'))
+    except (ConnectionResetError, asyncio.CancelledError) as e:
+        # Cliente desconectou: as tarefas fecham as conexões com o Ollama
+        if not generation.cancelled:
+            generation.reason = 'disconnect'
+        for task in tasks:
+            task.cancel()
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        return response
+    finally:
+        gui.generations.finish(generation)
+    
+    await response.write_eof()
+    return response
+
+async def compare_model(request, gui, plan, model, generation, user, emit):
+    """Gera a resposta de um modelo da comparação (mesmo fluxo de run_compare_model)"""
+    relay = gui.ChatRelay(model, time.time())
+    started_at = relay.start_time
+    try:
+        ticket = gui.chat_scheduler.submit(model, user)
+    except gui.SchedulerFull as e:
+        gui.chat_requests.inc(model=model, status='rejected')
+        emit(gui.compare_event('error', model, {'error': str(e), 'retry_after': e.retry_after}))
+        return gui.compare_entry(relay, 'rejected', started_at)
+    
+    def failed(message, kind=None):
+        if kind:
+            gui.record_chat_error(model, kind)
+        emit(gui.compare_event('error', model, {'error': message}))
+        return gui.compare_entry(relay, 'error', started_at)
+    
+    backend = None
+    sent = False
+    try:
+        if not ticket.granted:
+            loop = asyncio.get_running_loop()
+            granted = asyncio.Event()
+            gui.chat_scheduler.on_grant(ticket, lambda: loop.call_soon_threadsafe(granted.set))
+            while not granted.is_set():
+                emit(gui.compare_event('queued', model, {'position': gui.chat_scheduler.position(ticket)}))
+                try:
+                    await asyncio.wait_for(granted.wait(), gui.QUEUE_UPDATE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if generation.cancelled:
+                        return gui.compare_entry(relay, 'cancelled', started_at)
+                    if time.time() - ticket.enqueued_at > gui.QUEUE_TIMEOUT:
+                        return failed('Tempo de espera na fila esgotado')
+        if generation.cancelled:
+            return gui.compare_entry(relay, 'cancelled', started_at)
+        
+        relay.start_time = time.time()
+        sent = True
+        backend, upstream, error = await open_upstream(request.app['ollama_session'], gui, plan['payloads'][model])
+        if error:
+            message, _, kind = error
+            return failed(message, kind)
+        
+        async with upstream:
+            if upstream.status != 200:
+                error_msg = f'Erro do Ollama: {upstream.status}'
+                try:
+                    error_msg = (await upstream.json(content_type=None)).get('error', error_msg)
+                except Exception:
+                    pass
+                return failed(error_msg, 'http')
+            
+            async for line in upstream.content:
+                if relay.finished:
+                    continue  # Lê até o fim do corpo para a conexão voltar ao pool
+                if generation.cancelled:
+                    upstream.close()
+                    relay.cancel(generation.reason)
+                    return gui.compare_entry(relay, 'cancelled', started_at)
+                for data in relay.parse(line.strip()):
+                    if 'error' in data:
+                        emit(gui.compare_event('error', model, data))
+                        return gui.compare_entry(relay, 'error', started_at)
+                    emit(gui.compare_event('done' if data['done'] else 'token', model, data))
+        
+        if relay.stats is None:
+            return failed('Resposta do Ollama incompleta', 'stream')
+        return gui.compare_entry(relay, 'completed', started_at)
+    except asyncio.TimeoutError:
+        return failed('Timeout - Modelo muito lento', 'timeout')
+    except ClientError as e:
+        return failed(f'Conexão com o Ollama interrompida: {e}', 'stream')
+    except asyncio.CancelledError:
+        if sent and not relay.finished:
+            relay.cancel(generation.reason or 'disconnect')
+        raise
+    finally:
+        if backend:
+            gui.ollama.release(backend)
+        gui.chat_scheduler.release(ticket)
+
+def cached_json(request, payload):
+    """Resposta JSON com ETag/304 e compressão (mesma regra das rotas Flask)"""
+    status, headers, body = http_cache.json_response_parts(
+        payload,
+        request.headers.get('Accept-Encoding'),
+        request.headers.get('If-None-Match')
+    )
+    return web.Response(status=status, headers=headers, body=body)
+
+async def health_check(request):
+    gui = request.app['gui']
+    info = await run_blocking(gui.get_connection_info)
+    payload = gui.health_payload(info)
+    payload['scheduler'] = gui.chat_scheduler.stats()
+    # Sem ETag: o timestamp e os contadores mudam a cada requisição
+    return web.json_response(payload)
+
+async def get_models(request):
+    gui = request.app['gui']
+    info = await run_blocking(gui.get_connection_info)
+    return cached_json(request, gui.models_payload(info))
+
+async def events(request):
+    """/api/events sem ocupar uma thread por aba aberta"""
+    gui = request.app['gui']
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+    overflow = asyncio.Event()
+    
+    def enqueue(event):
+        try:
+            pending.put_nowait(event)
+        except asyncio.QueueFull:
+            overflow.set()  # Cliente lento: encerra para ele reconectar
+    
+    def deliver(event):
+        loop.call_soon_threadsafe(enqueue, event)
+    
+    response = web.StreamResponse(headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.content_type = 'text/event-stream'
+    
+    gui.event_bus.subscribe(deliver)
+    try:
+        snapshot = await run_blocking(gui.events_snapshot)
+        await response.prepare(request)
+        for event in snapshot:
+            await response.write(event.encode('utf-8'))
+        
+        while not overflow.is_set():
+            try:
+                event = await asyncio.wait_for(pending.get(), gui.EVENTS_KEEPALIVE)
+                chunk = gui.named_sse_event(event['type'], event['data'], event['id'])
+            except asyncio.TimeoutError:
+                chunk = ': keep-alive\n\n'
+            await response.write(chunk.encode('utf-8'))
+    except ConnectionResetError:
+        pass  # Aba fechada
+    finally:
+        gui.event_bus.unsubscribe(deliver)
+    return response
+
+def build_environ(request, body):
+    """Monta o environ WSGI a partir de uma requisição aiohttp"""
+    host, _, port = (request.host or 'localhost').partition(':')
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': request.path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': request.query_string,
+        'SERVER_NAME': host,
+        'SERVER_PORT': port or ('443' if request.secure else '80'),
+        'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in request.headers.items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+            continue
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def wsgi_fallback(request):
+    """Encaminha as demais rotas para o app Flask numa thread do pool.
+
+    Respostas pequenas com Content-Length vão de uma vez; as demais (exportações
+    em streaming, arquivos grandes) são repassadas em blocos conforme o
+    iterável WSGI os produz, sem juntar o corpo inteiro na memória.
+    """
+    flask_app = request.app['gui'].app
+    body = await request.read()
+    environ = build_environ(request, body)
+    started = {}
+    
+    def start_response(status, headers, exc_info=None):
+        started['status'] = status
+        started['headers'] = headers
+    
+    def call():
+        result = flask_app(environ, start_response)
+        length = next((value for name, value in started['headers'] if name.lower() == 'content-length'), None)
+        if length is None or int(length) > WSGI_BUFFER_LIMIT:
+            return result, None
+        try:
+            return None, b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    
+    result, content = await run_blocking(call)
+    status = int(started['status'].split()[0])
+    headers = CIMultiDict(
+        (name, value) for name, value in started['headers']
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    )
+    if result is None:
+        return web.Response(body=content, status=status, headers=headers)
+    
+    # O iterável WSGI (ex.: stream_with_context) precisa ser percorrido e
+    # fechado numa mesma thread: ela produz, o event loop consome
+    chunks = queue.Queue(maxsize=WSGI_QUEUE_SIZE)
+    stopped = threading.Event()
+    producer = asyncio.get_running_loop().run_in_executor(None, produce_wsgi_chunks, result, chunks, stopped)
+    response = web.StreamResponse(status=status, headers=headers)
+    try:
+        await response.prepare(request)
+        while True:
+            parts = [await run_blocking(chunks.get)]
+            # Junta o que já estiver pronto, sem esperar por mais
+            while parts[-1] is not None and len(parts) < WSGI_QUEUE_SIZE:
+                try:
+                    parts.append(chunks.get_nowait())
+                except queue.Empty:
+                    break
+            finished = parts[-1] is None
+            data = b''.join(part for part in parts if part)
+            if data:
+                await response.write(data)
+            if finished:
+                break
+        await response.write_eof()
+    except ConnectionResetError:
+        pass  # Cliente desconectou: o produtor para na próxima parte
+    finally:
+        stopped.set()
+        await producer
+    return response
+
+def produce_wsgi_chunks(result, chunks, stopped):
+    """Percorre o iterável WSGI enfileirando as partes; None marca o fim"""
+    def put(item):
+        # Espera por espaço na fila enquanto o cliente continuar conectado
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    try:
+        for part in result:
+            if not put(part):
+                return  # Cliente desconectou
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+        put(None)
+
+@web.middleware
+async def record_metrics(request, handler):
+    """Métricas HTTP das rotas nativas (as da ponte WSGI são contadas pelo Flask)"""
+    route = request.match_info.route
+    if route.handler is wsgi_fallback:
+        return await handler(request)
+    
+    gui = request.app['gui']
+    endpoint = route.resource.canonical if route.resource else 'unmatched'
+    start_time = time.time()
+    status = 500
+    streamed = False
+    try:
+        response = await handler(request)
+        status = response.status
+        streamed = response.content_type == 'text/event-stream'
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    except asyncio.CancelledError:
+        status = 499  # Cliente desconectou
+        raise
+    finally:
+        gui.http_requests.inc(method=request.method, endpoint=endpoint, status=status)
+        if not streamed and status != 499:
+            gui.http_latency.observe(time.time() - start_time, endpoint=endpoint)
+
+async def on_startup(application):
+    gui = application['gui']
+    gui.start_background_tasks()
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=application['threads'], thread_name_prefix='async-io')
+    )
+    application['ollama_session'] = ClientSession(
+        connector=TCPConnector(limit=gui.ollama.pool_size, keepalive_timeout=60),
+        timeout=ClientTimeout(
+            total=None,
+            sock_connect=gui.ollama.connect_timeout,
+            sock_read=gui.ollama.read_timeout
+        )
+    )
+    await run_blocking(gui.start_connection_monitor)
+
+async def on_cleanup(application):
+    await application['ollama_session'].close()
+
+def create_app(gui, threads=32):
+    """Cria a aplicação aiohttp a partir do módulo principal (app.py)"""
+    application = web.Application(client_max_size=32 * 1024 * 1024, middlewares=[record_metrics])
+    application['gui'] = gui
+    application['threads'] = threads
+    application.router.add_post('/api/chat', chat)
+    application.router.add_post('/api/compare', compare)
+    application.router.add_get('/api/health', health_check)
+    application.router.add_get('/api/models', get_models)
+    application.router.add_get('/api/events', events)
+    application.router.add_route('*', '/{tail:.*}', wsgi_fallback)
+    application.on_startup.append(on_startup)
+    application.on_cleanup.append(on_cleanup)
+    return application
+
+def run(gui, host='0.0.0.0', port=5000, threads=32):
+    web.run_app(create_app(gui, threads), host=host, port=port, print=None)
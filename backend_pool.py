@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Vários servidores Ollama atrás da mesma interface.
+
+`BackendPool` tem a mesma interface do OllamaClient (get/post/request), então
+o restante do app não precisa saber quantos servidores existem:
+
+- /api/tags e /api/ps devolvem a lista combinada de todos os servidores
+  saudáveis (cada modelo traz a lista de 'backends' onde está);
+- requisições com "model" no corpo vão para um servidor que tem o modelo,
+  preferindo um onde ele já está carregado e, entre esses, o com menos
+  requisições em andamento;
+- falha de conexão tira o servidor do rodízio por um tempo crescente e a
+  requisição é repetida em outro; a verificação periódica o traz de volta.
+
+O estado de saúde fica no estado compartilhado, visível a todos os workers.
+"""
+
+import logging
+import threading
+import time
+
+import requests
+
+EJECT_MIN = 5       # primeira exclusão após uma falha (s)
+EJECT_MAX = 300     # teto da exclusão exponencial (s)
+MERGED_PATHS = ('/api/tags', '/api/ps')
+
+logger = logging.getLogger(__name__)
+
+class MergedResponse:
+    """Resposta combinada de vários servidores (mesma API usada do requests.Response)"""
+
+    def __init__(self, payload, status_code=200):
+        self._payload = payload
+        self.status_code = status_code
+        self.ok = status_code < 400
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.exceptions.HTTPError(f"{self.status_code} em todos os servidores")
+
+class BackendPool:
+    """Roteia as chamadas ao Ollama entre vários servidores"""
+
+    def __init__(self, urls, state, client_factory, on_failure=None):
+        self.clients = {url.rstrip('/'): client_factory(url) for url in urls}
+        self.urls = list(self.clients)
+        self.state = state
+        self.on_failure = on_failure      # chamado quando uma requisição derruba um servidor
+        self._inflight = {url: 0 for url in self.urls}
+        self._lock = threading.Lock()
+        
+        # Atributos do cliente principal (usados pelo modo asyncio)
+        primary = self.clients[self.urls[0]]
+        self.base_url = primary.base_url
+        self.pool_size = primary.pool_size
+        self.connect_timeout = primary.connect_timeout
+        self.read_timeout = primary.read_timeout
+        self.retries = primary.retries
+
+    # --- Saúde e roteamento ---
+
+    def check(self):
+        """Consulta /api/tags e /api/ps de cada servidor e grava o resultado"""
+        status = {}
+        for url, client in self.clients.items():
+            entry = {'healthy': False, 'models': [], 'digests': {}, 'sizes': {}, 'loaded': {},
+                     'error': None, 'checked_at': time.time()}
+            try:
+                tags = client.get('/api/tags', timeout=5)
+                tags.raise_for_status()
+                for model in tags.json().get('models', []):
+                    entry['models'].append(model['name'])
+                    entry['digests'][model['name']] = model.get('digest', '')
+                    entry['sizes'][model['name']] = model.get('size', 0)
+                
+                ps = client.get('/api/ps', timeout=5)
+                if ps.status_code == 200:
+                    entry['loaded'] = {
+                        model['name']: {
+                            'size': model.get('size', 0),
+                            'size_vram': model.get('size_vram', 0),
+                            'expires_at': model.get('expires_at')
+                        }
+                        for model in ps.json().get('models', [])
+                    }
+                entry['healthy'] = True
+                self.restore(url)
+            except requests.exceptions.RequestException as e:
+                entry['error'] = str(e)
+                self.eject(url, e)
+            status[url] = entry
+        
+        self.state.set('backends', 'status', status)
+        return status
+
+    def status(self):
+        """Último resultado de check(), com exclusões e requisições em andamento"""
+        status = self.state.get('backends', 'status') or {}
+        ejected = self._ejected()
+        with self._lock:
+            inflight = dict(self._inflight)
+        return {
+            url: dict(status.get(url, {'healthy': None, 'models': [], 'loaded': {}}),
+                      ejected_until=ejected.get(url), inflight=inflight[url])
+            for url in self.urls
+        }
+
+    def choose(self, model=None, exclude=()):
+        """Servidor para `model`: com o modelo, carregado de preferência, menos ocupado"""
+        status = self.state.get('backends', 'status') or {}
+        ejected = self._ejected()
+        candidates = [
+            url for url in self.urls
+            if url not in exclude and url not in ejected and status.get(url, {}).get('healthy', True)
+        ]
+        if not candidates:
+            # Todos fora do rodízio: tenta mesmo assim os que ainda não falharam agora
+            candidates = [url for url in self.urls if url not in exclude]
+        
+        if model:
+            # Sem verificação ainda, assume que o servidor pode ter o modelo
+            having = [url for url in candidates if url not in status or model in status[url]['models']]
+            candidates = having or candidates
+            warm = [url for url in candidates if model in status.get(url, {}).get('loaded', {})]
+            candidates = warm or candidates
+        
+        if not candidates:
+            return None
+        with self._lock:
+            return min(candidates, key=lambda url: self._inflight[url])
+
+    def eject(self, url, error=None):
+        """Tira o servidor do rodízio; o tempo dobra a cada falha seguida"""
+        failures = (self.state.get('backend_failures', url) or 0) + 1
+        self.state.set('backend_failures', url, failures)
+        delay = min(EJECT_MIN * 2 ** (failures - 1), EJECT_MAX)
+        self.state.set('backend_ejections', url, time.time() + delay)
+        logger.warning("⛔ Servidor %s fora do rodízio por %ss: %s", url, delay, error, extra={'backend': url})
+
+    def restore(self, url):
+        if self.state.get('backend_failures', url):
+            logger.info("✅ Servidor %s de volta ao rodízio", url, extra={'backend': url})
+        self.state.delete('backend_failures', url)
+        self.state.delete('backend_ejections', url)
+
+    def acquire(self, url):
+        with self._lock:
+            self._inflight[url] += 1
+
+    def release(self, url):
+        with self._lock:
+            self._inflight[url] -= 1
+
+    def _ejected(self):
+        now = time.time()
+        return {url: until for url, until in self.state.items('backend_ejections').items() if until > now}
+
+    # --- Interface do OllamaClient ---
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, backend=None, **kwargs):
+        """Envia ao servidor escolhido; `backend` fixa o servidor (ex.: pull direcionado)"""
+        if method == 'GET' and path in MERGED_PATHS and backend is None:
+            return self._merged(path, **kwargs)
+        
+        body = kwargs.get('json') or {}
+        model = body.get('model') or body.get('name')
+        tried = []
+        while True:
+            url = backend or self.choose(model, exclude=tried)
+            if url is None:
+                raise requests.exceptions.ConnectionError('Nenhum servidor Ollama disponível')
+            
+            self.acquire(url)
+            try:
+                response = self.clients[url].request(method, path, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                self.release(url)
+                self.eject(url, e)
+                if self.on_failure:
+                    self.on_failure(url)
+                tried.append(url)
+                if backend or len(tried) >= len(self.urls):
+                    raise
+                continue
+            except Exception:
+                self.release(url)
+                raise
+            
+            response.backend = url
+            if kwargs.get('stream'):
+                self._release_on_close(response, url)
+            else:
+                self.release(url)
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        for client in self.clients.values():
+            client.close()
+
+    def _release_on_close(self, response, url):
+        """Conta o stream como em andamento até a resposta ser fechada"""
+        close = response.close
+        released = []
+        
+        def close_and_release():
+            if not released:
+                released.append(True)
+                self.release(url)
+            close()
+        response.close = close_and_release
+
+    def _merged(self, path, **kwargs):
+        """/api/tags ou /api/ps de todos os servidores, sem repetir modelos"""
+        models = {}
+        errors = []
+        answered = 0
+        ejected = self._ejected()
+        urls = [url for url in self.urls if url not in ejected] or self.urls
+        for url in urls:
+            try:
+                response = self.clients[url].get(path, **kwargs)
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                errors.append(e)
+                continue
+            answered += 1
+            for model in response.json().get('models', []):
+                entry = models.setdefault(model['name'], dict(model, backends=[]))
+                entry['backends'].append(url)
+        
+        if not answered:
+            raise errors[0]
+        return MergedResponse({'models': list(models.values())})
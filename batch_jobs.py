@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Jobs em lote: milhares de prompts processados em segundo plano.
+
+O JSONL enviado fica em <pasta>/<id>/input.jsonl e cada resultado é
+acrescentado a output.jsonl assim que termina (uma linha por item, na ordem
+de conclusão). O progresso fica no estado compartilhado (namespace 'batches'),
+com cópia em job.json, e é publicado como evento 'batch'. Um job
+interrompido (reinício, worker que morreu) é retomado por qualquer processo
+quando a concessão 'batch:<id>' expira: os ids que já estão em output.jsonl
+são pulados.
+
+As gerações passam pelo ChatScheduler como tickets de segundo plano, então o
+chat interativo sempre tem prioridade.
+"""
+
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+import requests
+
+ACTIVE_STATUSES = ('queued', 'running')
+LEASE_TTL = 30          # concessão do job; renovada enquanto ele roda (s)
+SUPERVISOR_INTERVAL = 10  # busca por jobs pendentes ou abandonados (s)
+PROGRESS_INTERVAL = 1   # intervalo mínimo entre gravações de progresso (s)
+RETRY_MIN = 2           # espera antes de repetir um item com o Ollama fora do ar (s)
+RETRY_MAX = 60
+MAX_ID_LENGTH = 200
+
+logger = logging.getLogger(__name__)
+
+class BatchInputError(ValueError):
+    """Linha inválida no JSONL enviado"""
+
+    def __init__(self, line_number, message):
+        super().__init__(f"linha {line_number}: {message}")
+        self.line_number = line_number
+
+def parse_item(line, line_number, defaults):
+    """Valida uma linha do JSONL e aplica os padrões do job"""
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        raise BatchInputError(line_number, f'JSON inválido ({e})')
+    if not isinstance(item, dict):
+        raise BatchInputError(line_number, 'cada linha deve ser um objeto JSON')
+    
+    item_id = str(item.get('id', line_number))
+    if not item_id or len(item_id) > MAX_ID_LENGTH:
+        raise BatchInputError(line_number, 'id inválido')
+    model = item.get('model') or defaults.get('model')
+    if not model:
+        raise BatchInputError(line_number, 'modelo não informado (no item ou no job)')
+    
+    messages = item.get('messages')
+    if messages is None:
+        if not isinstance(item.get('prompt'), str) or not item['prompt']:
+            raise BatchInputError(line_number, 'informe "prompt" ou "messages"')
+        system = item.get('system', defaults.get('system'))
+        messages = ([{'role': 'system', 'content': system}] if system else []) + \
+                   [{'role': 'user', 'content': item['prompt']}]
+    elif not isinstance(messages, list) or not messages:
+        raise BatchInputError(line_number, '"messages" deve ser uma lista não vazia')
+    
+    options = dict(defaults.get('options') or {})
+    if not isinstance(item.get('options', {}), dict):
+        raise BatchInputError(line_number, '"options" deve ser um objeto')
+    options.update(item.get('options') or {})
+    return {'id': item_id, 'model': model, 'messages': messages, 'options': options}
+
+class BatchManager:
+    """Fila de jobs em lote com um pool limitado de workers por processo.
+
+    Cada processo roda um job por vez com até `concurrency` itens em paralelo;
+    com vários workers, jobs diferentes podem rodar em processos diferentes.
+    """
+
+    def __init__(self, client, scheduler, state, directory, owner, concurrency=2,
+                 keep_alive=None, read_timeout=600, publish=None, on_item=None, before_generate=None):
+        self.client = client
+        self.scheduler = scheduler
+        self.state = state
+        self.directory = directory
+        self.owner = owner                # função que identifica este processo
+        self.concurrency = concurrency
+        self.keep_alive = keep_alive
+        self.read_timeout = read_timeout
+        self.publish = publish            # publica ('batch', job) a cada mudança
+        self.on_item = on_item            # chamado com (modelo, resultado) por item concluído
+        self.before_generate = before_generate  # chamado com o modelo antes de cada geração (orçamento de memória)
+        self._wakeup = threading.Event()
+        self._supervisor_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    # API pública
+
+    def create(self, lines, defaults=None):
+        """Valida o JSONL (iterável de linhas) e cria o job; levanta BatchInputError"""
+        defaults = defaults or {}
+        job_id = uuid.uuid4().hex[:12]
+        path = self._path(job_id)
+        os.makedirs(path)
+        
+        seen = set()
+        models = set()
+        total = 0
+        try:
+            with open(os.path.join(path, 'input.jsonl'), 'w', encoding='utf-8') as f:
+                for line_number, line in enumerate(lines, start=1):
+                    if isinstance(line, bytes):
+                        line = line.decode('utf-8')
+                    if not line.strip():
+                        continue
+                    item = parse_item(line, line_number, defaults)
+                    if item['id'] in seen:
+                        raise BatchInputError(line_number, f"id repetido: {item['id']}")
+                    seen.add(item['id'])
+                    models.add(item['model'])
+                    f.write(json.dumps(item, ensure_ascii=False) + '\n')
+                    total += 1
+            if not total:
+                raise BatchInputError(0, 'arquivo vazio')
+        except (BatchInputError, UnicodeDecodeError):
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        open(os.path.join(path, 'output.jsonl'), 'w').close()
+        
+        job = {
+            'id': job_id,
+            'name': defaults.get('name') or job_id,
+            'status': 'queued',
+            'total': total,
+            'completed': 0,
+            'failed': 0,
+            'models': sorted(models),
+            'rate': 0,
+            'eta': None,
+            'error': None,
+            'owner': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'updated_at': time.time()
+        }
+        self._save(job)
+        logger.info("📋 Job em lote %s criado com %d itens", job_id, total, extra={'batch': job_id})
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id):
+        return self.state.get('batches', job_id)
+
+    def jobs(self):
+        return sorted(self.state.items('batches').values(), key=lambda job: job['created_at'], reverse=True)
+
+    def cancel(self, job_id):
+        """Cancela o job; o processo que o executa para após os itens em andamento"""
+        job = self.get(job_id)
+        if not job or job['status'] not in ACTIVE_STATUSES:
+            return False
+        job.update({'status': 'cancelled', 'finished_at': time.time(), 'updated_at': time.time()})
+        self._save(job)
+        return True
+
+    def delete(self, job_id):
+        job = self.get(job_id)
+        if not job:
+            return False
+        self.cancel(job_id)
+        self.state.delete('batches', job_id)
+        shutil.rmtree(self._path(job_id), ignore_errors=True)
+        return True
+
+    def output_path(self, job_id):
+        return os.path.join(self._path(job_id), 'output.jsonl')
+
+    def start(self):
+        """Inicia o supervisor deste processo (refeito após o fork dos workers)"""
+        if self._supervisor_pid == os.getpid():
+            return
+        with self._lock:
+            if self._supervisor_pid == os.getpid():
+                return
+            self._supervisor_pid = os.getpid()
+        self._restore()
+        thread = threading.Thread(target=self._supervise, name='batch-supervisor')
+        thread.daemon = True
+        thread.start()
+
+    # Execução
+
+    def _path(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def _lease(self, job_id):
+        return f'batch:{job_id}'
+
+    def _save(self, job):
+        self.state.set('batches', job['id'], job)
+        # Cópia em disco: o estado em memória (modo dev) não sobrevive a um reinício
+        path = os.path.join(self._path(job['id']), 'job.json')
+        if os.path.isdir(self._path(job['id'])):
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+        if self.publish:
+            self.publish('batch', job)
+
+    def _restore(self):
+        """Recarrega no estado os jobs gravados em disco que ele não conhece"""
+        for job_id in os.listdir(self.directory):
+            if self.get(job_id) is not None:
+                continue
+            try:
+                with open(os.path.join(self._path(job_id), 'job.json'), encoding='utf-8') as f:
+                    job = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self.state.set('batches', job_id, job)
+            logger.info("♻️  Job em lote %s recuperado do disco (%s)", job_id, job['status'], extra={'batch': job_id})
+
+    def _supervise(self):
+        """Pega o job pendente mais antigo cuja concessão esteja livre (ou expirada)"""
+        while True:
+            self._wakeup.clear()
+            try:
+                pending = [job for job in self.jobs() if job['status'] in ACTIVE_STATUSES]
+                for job in reversed(pending):
+                    if self.state.acquire_lease(self._lease(job['id']), self.owner(), LEASE_TTL):
+                        self._run(job['id'])
+                        break
+            except Exception as e:
+                logger.error("❌ Erro no supervisor de jobs em lote: %s", e)
+            self._wakeup.wait(SUPERVISOR_INTERVAL)
+
+    def _finished_ids(self, output_path):
+        """Ids já gravados; corta uma última linha incompleta (processo morto no meio da escrita)"""
+        done = set()
+        counts = {'ok': 0, 'error': 0}
+        valid_size = 0
+        with open(output_path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                valid_size += len(line)
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                done.add(result['id'])
+                counts['ok' if result.get('status') == 'ok' else 'error'] += 1
+        if os.path.getsize(output_path) != valid_size:
+            with open(output_path, 'r+b') as f:
+                f.truncate(valid_size)
+        return done, counts
+
+    def _run(self, job_id):
+        job = self.get(job_id)
+        if not job or job['status'] not in ACTIVE_STATUSES:
+            self.state.release_lease(self._lease(job_id), self.owner())
+            return
+        
+        path = self._path(job_id)
+        output_path = os.path.join(path, 'output.jsonl')
+        done, counts = self._finished_ids(output_path)
+        resumed = job['status'] == 'running'
+        job.update({
+            'status': 'running',
+            'completed': counts['ok'],
+            'failed': counts['error'],
+            'owner': self.owner(),
+            'started_at': job['started_at'] or time.time(),
+            'updated_at': time.time()
+        })
+        self._save(job)
+        if resumed:
+            logger.info("🔁 Retomando job em lote %s (%d de %d itens prontos)", job_id, len(done), job['total'],
+                        extra={'batch': job_id})
+        else:
+            logger.info("▶️  Iniciando job em lote %s (%d itens)", job_id, job['total'], extra={'batch': job_id})
+        
+        items = queue.Queue(maxsize=self.concurrency * 2)
+        stop = threading.Event()
+        finished = threading.Event()
+        write_lock = threading.Lock()
+        progress = {'job': job, 'last_save': 0, 'session_start': time.time(), 'session_done': 0}
+        
+        def worker():
+            while True:
+                item = items.get()
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue
+                result = self._process(job_id, item, stop)
+                if result is None:
+                    continue  # Cancelado: o item fica pendente
+                with write_lock:
+                    try:
+                        with open(output_path, 'a', encoding='utf-8') as f:
+                            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                    except OSError:
+                        stop.set()  # Job apagado durante a execução
+                        continue
+                    self._record(progress, result)
+                if self.on_item:
+                    self.on_item(item['model'], result)
+        
+        def heartbeat():
+            # Renova a concessão mesmo com itens parados (Ollama fora do ar) e percebe cancelamentos
+            while not finished.wait(LEASE_TTL / 3):
+                self.state.acquire_lease(self._lease(job_id), self.owner(), LEASE_TTL)
+                current = self.get(job_id)
+                if not current or current['status'] != 'running':
+                    stop.set()
+        
+        threads = [threading.Thread(target=worker, name=f'batch-{index}', daemon=True)
+                   for index in range(self.concurrency)]
+        threads.append(threading.Thread(target=heartbeat, name='batch-heartbeat', daemon=True))
+        for thread in threads:
+            thread.start()
+        try:
+            with open(os.path.join(path, 'input.jsonl'), encoding='utf-8') as f:
+                for line in f:
+                    if stop.is_set():
+                        break
+                    # Cancelado ou apagado: não manda mais itens ao Ollama
+                    current = self.get(job_id)
+                    if not current or current['status'] != 'running':
+                        stop.set()
+                        break
+                    item = json.loads(line)
+                    if item['id'] not in done:
+                        items.put(item)
+        finally:
+            for _ in range(self.concurrency):
+                items.put(None)
+            for thread in threads[:-1]:
+                thread.join()
+            finished.set()
+        
+        job = self.get(job_id)
+        if job is None:
+            # Apagado durante a execução: não recria o registro
+            logger.info("🗑️  Job em lote %s apagado durante a execução", job_id, extra={'batch': job_id})
+            self.state.release_lease(self._lease(job_id), self.owner())
+            return
+        if job['status'] == 'running':
+            job.update(progress['job'], status='completed', rate=0, eta=None, finished_at=time.time())
+            job['updated_at'] = time.time()
+            self._save(job)
+            logger.info("✅ Job em lote %s concluído: %d ok, %d com erro", job_id, job['completed'], job['failed'],
+                        extra={'batch': job_id})
+        self.state.release_lease(self._lease(job_id), self.owner())
+
+    def _record(self, progress, result):
+        """Atualiza contadores e, no máximo a cada PROGRESS_INTERVAL, o estado (chamar com o lock)"""
+        job = progress['job']
+        job['completed' if result['status'] == 'ok' else 'failed'] += 1
+        progress['session_done'] += 1
+        now = time.time()
+        if now - progress['last_save'] < PROGRESS_INTERVAL:
+            return
+        progress['last_save'] = now
+        
+        current = self.get(job['id'])
+        if not current or current['status'] != 'running':
+            return  # Cancelado: não sobrescreve o status
+        elapsed = now - progress['session_start']
+        rate = progress['session_done'] / elapsed if elapsed > 0 else 0
+        remaining = job['total'] - job['completed'] - job['failed']
+        job.update({
+            'rate': round(rate, 2),
+            'eta': int(remaining / rate) if rate > 0 else None,
+            'updated_at': now
+        })
+        self._save(job)
+
+    def _process(self, job_id, item, stop):
+        """Gera a resposta de um item; None se o job for cancelado antes de terminar.
+
+        Falhas de conexão não contam como resultado: o item é repetido com
+        espera crescente até o Ollama voltar (ou o job ser cancelado).
+        """
+        delay = RETRY_MIN
+        while not stop.is_set():
+            try:
+                return self._generate(job_id, item, stop)
+            except requests.exceptions.ConnectionError as e:
+                logger.warning("⏳ Job em lote %s: Ollama inacessível (%s), nova tentativa em %ss", job_id, e, delay,
+                               extra={'batch': job_id})
+                stop.wait(delay)
+                delay = min(delay * 2, RETRY_MAX)
+        return None
+
+    def _generate(self, job_id, item, stop):
+        ticket = self.scheduler.submit(item['model'], f'batch:{job_id}', background=True)
+        try:
+            while not ticket.wait(1):
+                if stop.is_set():
+                    return None
+            
+            if self.before_generate:
+                self.before_generate(item['model'])
+            payload = {'model': item['model'], 'messages': item['messages'], 'options': item['options'],
+                       'stream': False}
+            if self.keep_alive:
+                payload['keep_alive'] = self.keep_alive
+            response = self.client.post('/api/chat', json=payload, timeout=self.read_timeout)
+            if response.status_code != 200:
+                try:
+                    error = response.json().get('error', f'HTTP {response.status_code}')
+                except ValueError:
+                    error = f'HTTP {response.status_code}'
+                return {'id': item['id'], 'model': item['model'], 'status': 'error', 'error': error}
+            
+            data = response.json()
+            return {
+                'id': item['id'],
+                'model': item['model'],
+                'status': 'ok',
+                'response': data.get('message', {}).get('content', ''),
+                'prompt_eval_count': data.get('prompt_eval_count', 0),
+                'eval_count': data.get('eval_count', 0),
+                'total_duration': data.get('total_duration', 0),
+                'queue_wait': round(ticket.started_at - ticket.enqueued_at, 3),
+                'finished_at': time.time()
+            }
+        except requests.exceptions.ConnectionError:
+            raise
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return {'id': item['id'], 'model': item['model'], 'status': 'error', 'error': str(e)}
+        finally:
+            self.scheduler.release(ticket)
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Servidor falso compatível com a API do Ollama, para testes e benchmarks.
+
+Responde /api/tags, /api/ps, /api/show, /api/chat (streaming ou não),
+/api/generate (carregar/descarregar com keep_alive) e /api/pull com
+latências configuráveis, sem GPU nem modelos de verdade. Para simular vários
+servidores, rode uma instância por porta:
+
+    python benchmarks/fake_ollama.py --port 11435 --models llama3:8b,qwen2.5:7b
+    python benchmarks/fake_ollama.py --port 11436 --models llama3:8b
+    OLLAMA_URLS=http://localhost:11435,http://localhost:11436 python app.py
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeOllama:
+    """Estado de um servidor falso (modelos instalados e carregados)"""
+
+    def __init__(self, models, tokens=20, token_rate=50, first_token_delay=0.05, load_delay=1.0):
+        self.models = {name: 1024 ** 3 * (index + 1) for index, name in enumerate(models)}
+        self.loaded = {}
+        self.tokens = tokens
+        self.token_delay = 1 / token_rate if token_rate else 0
+        self.first_token_delay = first_token_delay
+        self.load_delay = load_delay
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def load(self, model):
+        """Simula o carregamento dos pesos na primeira requisição do modelo"""
+        with self.lock:
+            loaded = model in self.loaded
+            self.loaded[model] = time.time()
+        if not loaded:
+            time.sleep(self.load_delay)
+
+    def tags(self):
+        return {'models': [
+            {'name': name, 'model': name, 'size': size,
+             'digest': hashlib.sha256(name.encode('utf-8')).hexdigest(),
+             'modified_at': '2024-01-01T00:00:00Z'}
+            for name, size in self.models.items()
+        ]}
+
+    def ps(self):
+        with self.lock:
+            loaded = list(self.loaded)
+        return {'models': [
+            {'name': name, 'model': name, 'size': self.models.get(name, 0),
+             'size_vram': self.models.get(name, 0), 'expires_at': None}
+            for name in loaded
+        ]}
+
+def make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def start_stream(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-ndjson')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+        def write_line(self, payload):
+            data = (json.dumps(payload) + '\n').encode('utf-8')
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.flush()
+
+        def end_stream(self):
+            self.wfile.write(b'0\r\n\r\n')
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self.send_json(server.tags())
+            elif self.path == '/api/ps':
+                self.send_json(server.ps())
+            elif self.path == '/api/version':
+                self.send_json({'version': '0.0.0-fake'})
+            else:
+                self.send_json({'error': 'not found'}, 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+            model = body.get('model') or body.get('name')
+            with server.lock:
+                server.requests += 1
+            
+            if self.path == '/api/pull':
+                return self.pull(model)
+            if self.path in ('/api/chat', '/api/generate', '/api/show', '/api/embed') and model not in server.models:
+                return self.send_json({'error': f"model '{model}' not found"}, 404)
+            
+            if self.path == '/api/show':
+                self.send_json({'model_info': {'fake.context_length': 8192}, 'details': {'family': 'fake'}})
+            elif self.path == '/api/generate':
+                if body.get('keep_alive') == 0:
+                    with server.lock:
+                        server.loaded.pop(model, None)
+                else:
+                    server.load(model)
+                self.send_json({'model': model, 'response': '', 'done': True})
+            elif self.path == '/api/embed':
+                inputs = body.get('input')
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self.send_json({'model': model, 'embeddings': [self.embedding(text) for text in inputs]})
+            elif self.path == '/api/chat':
+                self.chat(model, body)
+            else:
+                self.send_json({'error': 'not found'}, 404)
+
+        @staticmethod
+        def embedding(text, dimensions=64):
+            digest = hashlib.sha256(text.encode('utf-8')).digest()
+            return [(digest[i % len(digest)] - 128) / 128 for i in range(dimensions)]
+
+        def chat(self, model, body):
+            start = time.time()
+            server.load(model)
+            prompt_tokens = sum(len(m.get('content', '')) // 4 + 1 for m in body.get('messages', []))
+            
+            if body.get('stream') is False:
+                time.sleep(server.first_token_delay + server.token_delay * server.tokens)
+                return self.send_json({
+                    'model': model,
+                    'message': {'role': 'assistant', 'content': 'token ' * server.tokens},
+                    'done': True,
+                    'eval_count': server.tokens,
+                    'eval_duration': int(server.token_delay * server.tokens * 1e9),
+                    'prompt_eval_count': prompt_tokens
+                })
+            
+            try:
+                self.start_stream()
+                time.sleep(server.first_token_delay)
+                for index in range(server.tokens):
+                    if index:
+                        time.sleep(server.token_delay)
+                    self.write_line({'model': model, 'message': {'role': 'assistant', 'content': f'token{index} '},
+                                     'done': False})
+                self.write_line({
+                    'model': model,
+                    'message': {'role': 'assistant', 'content': ''},
+                    'done': True,
+                    'total_duration': int((time.time() - start) * 1e9),
+                    'eval_count': server.tokens,
+                    'eval_duration': int(server.token_delay * server.tokens * 1e9),
+                    'prompt_eval_count': prompt_tokens,
+                    'prompt_eval_duration': 1000
+                })
+                self.end_stream()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # Cliente cancelou
+
+        def pull(self, model):
+            try:
+                self.start_stream()
+                self.write_line({'status': 'pulling manifest'})
+                total = 10 * 1024 * 1024
+                for completed in range(0, total + 1, total // 10):
+                    time.sleep(0.1)
+                    self.write_line({'status': 'pulling layer', 'digest': 'sha256:layer',
+                                     'total': total, 'completed': completed})
+                self.write_line({'status': 'success'})
+                self.end_stream()
+                with server.lock:
+                    server.models.setdefault(model, total)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
+
+def serve(port, state, host='127.0.0.1'):
+    httpd = ThreadingHTTPServer((host, port), make_handler(state))
+    httpd.daemon_threads = True
+    return httpd
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Servidor Ollama falso para testes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--models', default='llama3:8b,qwen2.5:7b')
+    parser.add_argument('--tokens', type=int, default=20, help='tokens por resposta')
+    parser.add_argument('--token-rate', type=float, default=50, help='tokens por segundo (0 = sem espera)')
+    parser.add_argument('--first-token-delay', type=float, default=0.05, help='latência até o primeiro token')
+    parser.add_argument('--load-delay', type=float, default=1.0, help='tempo de carregar um modelo frio')
+    args = parser.parse_args()
+    
+    state = FakeOllama(
+        [name for name in args.models.split(',') if name],
+        tokens=args.tokens,
+        token_rate=args.token_rate,
+        first_token_delay=args.first_token_delay,
+        load_delay=args.load_delay
+    )
+    print(f"🧪 Ollama falso em http://{args.host}:{args.port} ({', '.join(state.models)})")
+    serve(args.port, state, args.host).serve_forever()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Benchmark de carga do OllamaGUI contra um Ollama falso.
+
+Sobe o servidor falso (fake_ollama.py) numa porta livre, inicia o app com
+OLLAMA_URLS apontando para ele, dispara cada cenário com a concorrência
+pedida e grava o resultado em JSON: vazão, latência p50/p95/p99 e, no chat,
+tempo até o primeiro token (TTFT) e tokens/s.
+
+    python benchmarks/run.py --mode async --concurrency 16 --requests 200
+    python benchmarks/run.py --output novo.json --baseline antes.json
+
+O processo termina com código 1 se algum limite de benchmarks/thresholds.json
+for violado ou se, com --baseline, um cenário piorar mais que --tolerance em
+relação à execução anterior. O arquivo tem limites separados por modo
+(--mode): no production o limite por modelo do agendador é dividido entre
+os workers, e o chat espera mais na fila. Os limites valem para os
+parâmetros padrão do Ollama falso (--tokens/--token-rate) e para --workers 2;
+ao mudá-los, passe outro arquivo ou --thresholds "". Com --url, mede um app
+já em execução (o Ollama dele é que responde), com os limites de --mode.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_ollama import FakeOllama, serve
+
+DEFAULT_THRESHOLDS = os.path.join(BENCH_DIR, 'thresholds.json')
+STARTUP_TIMEOUT = 30   # espera máxima pelo app conectar ao Ollama falso (s)
+
+# Métricas comparadas com a execução anterior: (caminho, maior é melhor)
+COMPARED = (
+    (('throughput',), True),
+    (('latency', 'p95'), False),
+    (('ttft', 'p95'), False)
+)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    """Percentil pelo método do posto mais próximo (valores já ordenados)"""
+    if not values:
+        return None
+    rank = math.ceil(fraction * len(values))
+    return values[max(0, min(len(values), rank) - 1)]
+
+def summarize(values):
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 0.50), 4),
+        'p95': round(percentile(values, 0.95), 4),
+        'p99': round(percentile(values, 0.99), 4),
+        'mean': round(sum(values) / len(values), 4),
+        'max': round(values[-1], 4)
+    }
+
+# --- Cenários: cada função faz uma requisição e devolve um dicionário de amostras ---
+
+def chat_request(session, base_url, options, index):
+    """POST /api/chat em streaming; mede o primeiro conteúdo e o evento final"""
+    start = time.perf_counter()
+    response = session.post(
+        f'{base_url}/api/chat',
+        json={'message': f'benchmark {index}', 'model': options.model},
+        stream=True,
+        timeout=options.timeout
+    )
+    with response:
+        if response.status_code != 200:
+            return {'error': f'http_{response.status_code}'}
+        sample = {'ttft': None}
+        for line in response.iter_lines():
+            if not line.startswith(b'data: '):
+                continue
+            event = json.loads(line[6:])
+            if event.get('error'):
+                return {'error': 'stream_error'}
+            if event.get('content') and sample['ttft'] is None:
+                sample['ttft'] = time.perf_counter() - start
+            if event.get('done'):
+                sample['latency'] = time.perf_counter() - start
+                if event.get('eval_duration'):
+                    sample['tokens_per_second'] = event['eval_count'] / (event['eval_duration'] / 1e9)
+                return sample
+    return {'error': 'incomplete'}
+
+def get_request(path):
+    def request(session, base_url, options, index):
+        start = time.perf_counter()
+        response = session.get(f'{base_url}{path}', timeout=options.timeout)
+        if response.status_code != 200:
+            return {'error': f'http_{response.status_code}'}
+        return {'latency': time.perf_counter() - start}
+    return request
+
+SCENARIOS = {
+    'chat': chat_request,
+    'models': get_request('/api/models'),
+    'health': get_request('/api/health'),
+    'conversations': get_request('/api/conversations')
+}
+
+def run_scenario(name, base_url, options):
+    """Executa `options.requests` requisições com `options.concurrency` em paralelo"""
+    request = SCENARIOS[name]
+    local = threading.local()
+    
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        return local.session
+    
+    def call(index):
+        try:
+            return request(session(), base_url, options, index)
+        except requests.exceptions.RequestException as e:
+            return {'error': type(e).__name__}
+    
+    with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+        # Aquecimento: conexões abertas, modelo carregado, caches preenchidos
+        list(pool.map(call, range(options.warmup)))
+        start = time.perf_counter()
+        samples = list(pool.map(call, range(options.requests)))
+        duration = time.perf_counter() - start
+    
+    errors = {}
+    for sample in samples:
+        if 'error' in sample:
+            errors[sample['error']] = errors.get(sample['error'], 0) + 1
+    ok = [sample for sample in samples if 'error' not in sample]
+    
+    result = {
+        'requests': len(samples),
+        'ok': len(ok),
+        'errors': errors,
+        'error_rate': round(1 - len(ok) / len(samples), 4) if samples else 0,
+        'duration': round(duration, 3),
+        'throughput': round(len(ok) / duration, 3) if duration else 0,
+        'latency': summarize([sample['latency'] for sample in ok])
+    }
+    if name == 'chat':
+        result['ttft'] = summarize([sample['ttft'] for sample in ok if sample.get('ttft') is not None])
+        rates = [sample['tokens_per_second'] for sample in ok if sample.get('tokens_per_second')]
+        result['tokens_per_second'] = round(sum(rates) / len(rates), 2) if rates else None
+    return result
+
+# --- Ambiente: Ollama falso e app em subprocesso ---
+
+def start_app(options, ollama_url, data_dir):
+    port = free_port()
+    env = dict(os.environ, OLLAMA_URLS=ollama_url, OLLAMAGUI_DATA_DIR=data_dir,
+               OLLAMAGUI_LOG_LEVEL='WARNING', PYTHONUNBUFFERED='1')
+    for item in options.app_env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    
+    command = [sys.executable, os.path.join(ROOT_DIR, 'app.py'), '--mode', options.mode,
+               '--host', '127.0.0.1', '--port', str(port)]
+    if options.mode == 'production':
+        command += ['--workers', str(options.workers), '--worker-class', options.worker_class]
+    
+    log = open(os.path.join(data_dir, 'app.log'), 'wb')
+    # Sessão própria: o modo dev (reloader) e o gunicorn criam processos filhos
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    return process, f'http://127.0.0.1:{port}'
+
+def stop_app(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+def wait_until_ready(base_url, process=None):
+    deadline = time.time() + STARTUP_TIMEOUT
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError('o app terminou durante a inicialização')
+        try:
+            health = requests.get(f'{base_url}/api/health', timeout=2).json()
+            if health.get('ollama') == 'connected':
+                return
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'o app não conectou ao Ollama em {STARTUP_TIMEOUT}s')
+
+# --- Limites e comparação com a execução anterior ---
+
+def lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+def check_thresholds(results, thresholds):
+    """Limites absolutos por cenário: max_<métrica>_<percentil>, min_throughput, max_error_rate"""
+    failures = []
+    for name, limits in thresholds.items():
+        result = results.get(name)
+        if result is None:
+            continue
+        for key, limit in limits.items():
+            bound, _, metric = key.partition('_')
+            if metric in ('throughput', 'error_rate'):
+                value = result[metric]
+            else:
+                # ex.: max_latency_p95, max_ttft_p99
+                value = lookup(result, metric.rsplit('_', 1))
+            if value is None:
+                continue
+            if (bound == 'max' and value > limit) or (bound == 'min' and value < limit):
+                failures.append(f'{name}: {metric} = {value} (limite {bound} {limit})')
+    return failures
+
+def compare(results, baseline, tolerance):
+    """Regressões maiores que `tolerance` (fração) em relação a uma execução anterior"""
+    failures = []
+    for name, result in results.items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for path, higher_is_better in COMPARED:
+            value, before = lookup(result, path), lookup(previous, path)
+            if not value or not before:
+                continue
+            change = (value - before) / before
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                failures.append(f"{name}: {'.'.join(path)} {before} -> {value} ({change:+.1%})")
+    return failures
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de carga do OllamaGUI')
+    parser.add_argument('--scenarios', default='chat,models,health',
+                        help=f"cenários separados por vírgula ({', '.join(SCENARIOS)})")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='requisições medidas por cenário')
+    parser.add_argument('--warmup', type=int, default=None, help='requisições de aquecimento (padrão: concorrência)')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--mode', choices=['dev', 'async', 'production'], default='async')
+    parser.add_argument('--workers', type=int, default=2, help='workers no modo production')
+    parser.add_argument('--worker-class', choices=['gthread', 'aiohttp'], default='gthread')
+    parser.add_argument('--app-env', action='append', default=[], metavar='CHAVE=VALOR',
+                        help='variável de ambiente extra para o app (ex.: OLLAMAGUI_MAX_CONCURRENT=32)')
+    parser.add_argument('--url', help='mede um app já em execução em vez de iniciar um')
+    parser.add_argument('--model', default='bench:latest')
+    parser.add_argument('--tokens', type=int, default=20, help='tokens por resposta do Ollama falso')
+    parser.add_argument('--token-rate', type=float, default=50, help='tokens/s do Ollama falso')
+    parser.add_argument('--first-token-delay', type=float, default=0.05)
+    parser.add_argument('--output', help='arquivo JSON de saída (padrão: stdout)')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help='limites absolutos ("" desativa)')
+    parser.add_argument('--baseline', help='resultado anterior para detectar regressões')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='piora tolerada em relação ao baseline')
+    options = parser.parse_args()
+    if options.warmup is None:
+        options.warmup = options.concurrency
+    
+    names = [name.strip() for name in options.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"cenário desconhecido: {', '.join(unknown)}")
+    
+    fake = httpd = process = None
+    data_dir = tempfile.mkdtemp(prefix='ollamagui-bench-')
+    try:
+        base_url = options.url
+        if not base_url:
+            fake = FakeOllama([options.model], tokens=options.tokens, token_rate=options.token_rate,
+                              first_token_delay=options.first_token_delay, load_delay=0)
+            httpd = serve(free_port(), fake)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            process, base_url = start_app(options, f'http://127.0.0.1:{httpd.server_port}', data_dir)
+        wait_until_ready(base_url, process)
+        
+        results = {}
+        for name in names:
+            print(f"🏁 {name}: {options.requests} requisições, concorrência {options.concurrency}", file=sys.stderr)
+            results[name] = run_scenario(name, base_url, options)
+    except RuntimeError as e:
+        print(f"❌ {e} (log em {data_dir})", file=sys.stderr)
+        return 2
+    finally:
+        if process is not None:
+            stop_app(process)
+        if httpd is not None:
+            httpd.shutdown()
+    
+    report = {
+        'config': {key: value for key, value in vars(options).items()
+                   if key not in ('output', 'baseline', 'thresholds')},
+        'environment': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scenarios': results
+    }
+    
+    failures = []
+    if options.thresholds:
+        with open(options.thresholds, encoding='utf-8') as f:
+            failures += check_thresholds(results, json.load(f).get(options.mode, {}))
+    if options.baseline:
+        with open(options.baseline, encoding='utf-8') as f:
+            failures += compare(results, json.load(f), options.tolerance)
+    report['failures'] = failures
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    
+    for name, result in results.items():
+        latency = result['latency'] or {}
+        line = (f"📊 {name}: {result['throughput']} req/s, p50 {latency.get('p50')}s, "
+                f"p95 {latency.get('p95')}s, p99 {latency.get('p99')}s, erros {result['error_rate']:.1%}")
+        if result.get('ttft'):
+            line += f", TTFT p95 {result['ttft']['p95']}s"
+        print(line, file=sys.stderr)
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Orçamento da janela de contexto e compactação de conversas longas"""
+
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+MESSAGE_OVERHEAD = 4  # tokens de marcação por mensagem no template de chat
+SHOW_RETRY_INTERVAL = 30  # nova consulta ao /api/show após uma falha (s)
+SUMMARY_QUEUE_TIMEOUT = 600  # espera máxima por um slot ocioso para o resumo (s)
+WORD_PATTERN = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text):
+    """Estimativa rápida de tokens, sem tokenizador.
+
+    Usa o maior entre ~4 caracteres por token e ~1,3 token por palavra/pontuação,
+    o que fica próximo dos tokenizadores BPE para texto e código.
+    """
+    if not text:
+        return MESSAGE_OVERHEAD
+    by_chars = len(text) / 4
+    by_words = len(WORD_PATTERN.findall(text)) * 1.3
+    return int(max(by_chars, by_words)) + MESSAGE_OVERHEAD
+
+def message_tokens(message):
+    tokens = message.get('tokens')
+    return tokens if tokens else estimate_tokens(message['content'])
+
+def parse_model_contexts(value):
+    """Converte 'modelo=8192,outro=32768' em dicionário"""
+    contexts = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            name, size = item.split('=', 1)
+            contexts[name.strip()] = int(size)
+    return contexts
+
+class ContextManager:
+    """Monta o contexto enviado ao Ollama dentro do orçamento de tokens do modelo.
+
+    O prompt de sistema fica sempre fixo no início; as mensagens mais recentes
+    entram numa janela deslizante. Quando a conversa passa do limite de
+    compactação, as mensagens antigas são resumidas em segundo plano e o resumo
+    (guardado no banco) substitui esse trecho nos próximos turnos. Os resumos
+    passam pelo `scheduler` como pedidos de segundo plano, como os jobs em lote.
+    """
+
+    def __init__(self, store, client, default_num_ctx=4096, model_contexts=None,
+                 response_reserve=0.25, compact_threshold=0.75, keep_recent=0.5,
+                 summary_model=None, scheduler=None):
+        self.store = store
+        self.client = client
+        self.default_num_ctx = default_num_ctx
+        self.model_contexts = model_contexts or {}
+        self.response_reserve = response_reserve    # fração reservada para a resposta
+        self.compact_threshold = compact_threshold  # fração do orçamento que dispara o resumo
+        self.keep_recent = keep_recent              # fração do orçamento mantida literal após o resumo
+        self.summary_model = summary_model
+        self.scheduler = scheduler                  # ChatScheduler (opcional)
+        self._context_lengths = {}  # modelo -> (context_length, válido até; None = permanente)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='context-summary')
+
+    def num_ctx(self, model):
+        """Tamanho da janela a usar: o configurado, limitado ao máximo do modelo"""
+        if model in self.model_contexts:
+            return self.model_contexts[model]
+        
+        with self._lock:
+            cached = self._context_lengths.get(model)
+        if cached and (cached[1] is None or cached[1] > time.time()):
+            max_length = cached[0]
+        else:
+            max_length = self._fetch_context_length(model)
+            # Uma falha passageira não fixa o modelo no padrão: tenta de novo em breve
+            expires = time.time() + SHOW_RETRY_INTERVAL if max_length is None else None
+            with self._lock:
+                self._context_lengths[model] = (max_length, expires)
+        
+        return min(self.default_num_ctx, max_length) if max_length else self.default_num_ctx
+
+    def _fetch_context_length(self, model):
+        """Lê o context_length do modelo em /api/show.
+
+        Retorna 0 se o modelo não informa o tamanho e None se a consulta falhou.
+        """
+        try:
+            response = self.client.post('/api/show', json={'model': model}, timeout=5)
+            if response.status_code == 200:
+                model_info = response.json().get('model_info', {})
+                for key, value in model_info.items():
+                    if key.endswith('.context_length'):
+                        return int(value)
+                return 0
+        except (requests.exceptions.RequestException, ValueError):
+            pass
+        return None
+
+    def prompt_budget(self, model):
+        return int(self.num_ctx(model) * (1 - self.response_reserve))
+
+    def build_messages(self, conversation_id, model, system_prompt, new_message, summary_prompt,
+                       summary_prefix):
+        """Retorna (mensagens, opções, info) para o payload de /api/chat"""
+        num_ctx = self.num_ctx(model)
+        budget = int(num_ctx * (1 - self.response_reserve))
+        
+        summary = self.store.get_summary(conversation_id)
+        history = list(self.store.iter_messages(
+            conversation_id, after_id=summary['upto_message_id'] if summary else 0
+        ))
+        
+        pinned = [{'role': 'system', 'content': system_prompt}]
+        used = estimate_tokens(system_prompt) + estimate_tokens(new_message)
+        if summary:
+            pinned.append({'role': 'system', 'content': f"{summary_prefix}\n{summary['content']}"})
+            used += summary['tokens']
+        
+        # Janela deslizante: das mensagens mais novas para as mais antigas,
+        # parando na primeira que não cabe para não deixar buracos no diálogo
+        window = []
+        history_tokens = 0
+        fits = True
+        for message in reversed(history):
+            tokens = message_tokens(message)
+            history_tokens += tokens
+            if fits and used + tokens <= budget:
+                window.append(message)
+                used += tokens
+            else:
+                fits = False
+        window.reverse()
+        
+        total = used + history_tokens - sum(message_tokens(message) for message in window)
+        if total > budget * self.compact_threshold:
+            self.schedule_compaction(conversation_id, model, budget, summary_prompt)
+        
+        messages = pinned + [
+            {'role': message['role'], 'content': message['content']} for message in window
+        ] + [{'role': 'user', 'content': new_message}]
+        
+        info = {
+            'num_ctx': num_ctx,
+            'prompt_tokens': used,
+            'dropped_messages': len(history) - len(window),
+            'summarized': summary is not None
+        }
+        return messages, {'num_ctx': num_ctx}, info
+
+    def schedule_compaction(self, conversation_id, model, budget, summary_prompt):
+        """Agenda o resumo das mensagens antigas (uma tarefa por conversa)"""
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+        self._executor.submit(self._compact, conversation_id, model, budget, summary_prompt)
+
+    def _compact(self, conversation_id, model, budget, summary_prompt):
+        try:
+            summary = self.store.get_summary(conversation_id)
+            history = list(self.store.iter_messages(
+                conversation_id, after_id=summary['upto_message_id'] if summary else 0
+            ))
+            
+            # Mantém literais as mensagens mais recentes; resume o restante
+            keep = budget * self.keep_recent
+            kept = 0
+            cut = len(history)
+            for i in range(len(history) - 1, -1, -1):
+                tokens = message_tokens(history[i])
+                if kept + tokens > keep:
+                    break
+                kept += tokens
+                cut = i
+            old_messages = history[:cut]
+            if len(old_messages) < 2:
+                return
+            
+            # Resume em blocos que cabem na janela (do modelo de resumo também),
+            # acumulando o resumo anterior
+            budget = min(budget, self.prompt_budget(self.summary_model or model))
+            content = summary['content'] if summary else ''
+            chunk = []
+            chunk_tokens = 0
+            for message in old_messages:
+                tokens = message_tokens(message)
+                if chunk and estimate_tokens(content) + chunk_tokens + tokens > budget:
+                    content = self._summarize(model, summary_prompt, content, chunk)
+                    chunk, chunk_tokens = [], 0
+                chunk.append(message)
+                chunk_tokens += tokens
+            if chunk:
+                content = self._summarize(model, summary_prompt, content, chunk)
+            
+            self.store.save_summary(
+                conversation_id, old_messages[-1]['id'], content, estimate_tokens(content)
+            )
+            logger.info("🗜️  Conversa %s compactada: %d mensagens resumidas", conversation_id, len(old_messages))
+        except Exception as e:
+            logger.error("❌ Erro ao resumir conversa %s: %s", conversation_id, e)
+        finally:
+            with self._lock:
+                self._pending.discard(conversation_id)
+
+    def _summarize(self, model, summary_prompt, previous, messages):
+        transcript = '\n\n'.join(f"{message['role']}: {message['content']}" for message in messages)
+        if previous:
+            transcript = f"{previous}\n\n{transcript}"
+        
+        summary_model = self.summary_model or model
+        ticket = self.scheduler.submit(summary_model, 'context-summary', background=True) if self.scheduler else None
+        try:
+            # Só usa slots ociosos: o chat interativo tem prioridade
+            if ticket and not ticket.wait(SUMMARY_QUEUE_TIMEOUT):
+                raise TimeoutError(f'sem slot livre para {summary_model} em {SUMMARY_QUEUE_TIMEOUT}s')
+            response = self.client.post('/api/chat', json={
+                'model': summary_model,
+                'messages': [
+                    {'role': 'system', 'content': summary_prompt},
+                    {'role': 'user', 'content': transcript}
+                ],
+                'stream': False,
+                'options': {'temperature': 0, 'num_ctx': self.num_ctx(summary_model)}
+            }, timeout=300)
+            response.raise_for_status()
+            return response.json()['message']['content'].strip()
+        finally:
+            if ticket:
+                self.scheduler.release(ticket)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Armazenamento persistente de conversas em SQLite (modo WAL)"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    model TEXT,
+    language TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    model TEXT,
+    tokens INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    conversation_id TEXT PRIMARY KEY REFERENCES conversations(id) ON DELETE CASCADE,
+    upto_message_id INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation
+    ON messages (conversation_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated
+    ON conversations (updated_at, id);
+"""
+
+class ConversationStore:
+    """Conversas e mensagens com paginação por chave (keyset).
+
+    Cada thread usa sua própria conexão SQLite; o modo WAL permite leituras
+    concorrentes enquanto uma mensagem é gravada.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Conexão temporária: conexões não podem atravessar o fork dos workers
+        conn = sqlite3.connect(path, timeout=10)
+        with conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            # Bancos criados antes da contagem de tokens por mensagem
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(messages)')]
+            if 'tokens' not in columns:
+                conn.execute('ALTER TABLE messages ADD COLUMN tokens INTEGER')
+        conn.close()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # Conversas
+
+    def create_conversation(self, title='', model=None, language=None):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO conversations (id, title, model, language, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (conversation_id, title[:120], model, language, now, now)
+            )
+        return conversation_id
+
+    def get_conversation(self, conversation_id):
+        row = self._connect().execute(
+            'SELECT * FROM conversations WHERE id = ?', (conversation_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_conversations(self, limit=50, before=None):
+        """Conversas mais recentes primeiro; `before` é o cursor da página anterior"""
+        conn = self._connect()
+        if before:
+            rows = conn.execute(
+                'SELECT * FROM conversations '
+                'WHERE (updated_at, id) < (SELECT updated_at, id FROM conversations WHERE id = ?) '
+                'ORDER BY updated_at DESC, id DESC LIMIT ?',
+                (before, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT * FROM conversations ORDER BY updated_at DESC, id DESC LIMIT ?',
+                (limit,)
+            ).fetchall()
+        conversations = [dict(row) for row in rows]
+        next_cursor = conversations[-1]['id'] if len(conversations) == limit else None
+        return conversations, next_cursor
+
+    def delete_conversation(self, conversation_id):
+        with self._connect() as conn:
+            cursor = conn.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
+        return cursor.rowcount > 0
+
+    # Mensagens
+
+    def append_message(self, conversation_id, role, content, model=None, tokens=None):
+        """Grava uma única mensagem e atualiza a data da conversa"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                'INSERT INTO messages (conversation_id, role, content, model, tokens, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (conversation_id, role, content, model, tokens, now)
+            )
+            conn.execute(
+                'UPDATE conversations SET updated_at = ? WHERE id = ?',
+                (now, conversation_id)
+            )
+        return cursor.lastrowid
+
+    def get_messages(self, conversation_id, limit=50, before=None):
+        """Página de mensagens em ordem cronológica, terminando antes do cursor `before`"""
+        conn = self._connect()
+        if before:
+            rows = conn.execute(
+                'SELECT id, role, content, model, tokens, created_at FROM messages '
+                'WHERE conversation_id = ? '
+                'AND (created_at, id) < (SELECT created_at, id FROM messages WHERE id = ?) '
+                'ORDER BY created_at DESC, id DESC LIMIT ?',
+                (conversation_id, before, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT id, role, content, model, tokens, created_at FROM messages '
+                'WHERE conversation_id = ? '
+                'ORDER BY created_at DESC, id DESC LIMIT ?',
+                (conversation_id, limit)
+            ).fetchall()
+        messages = [dict(row) for row in reversed(rows)]
+        next_cursor = messages[0]['id'] if len(messages) == limit else None
+        return messages, next_cursor
+
+    def iter_messages(self, conversation_id, batch_size=500, after_id=0):
+        """Percorre as mensagens em ordem cronológica, em lotes, a partir de `after_id`"""
+        conn = self._connect()
+        last = (0, 0)
+        if after_id:
+            row = conn.execute('SELECT created_at, id FROM messages WHERE id = ?', (after_id,)).fetchone()
+            if row:
+                last = (row['created_at'], row['id'])
+        while True:
+            rows = conn.execute(
+                'SELECT id, role, content, model, tokens, created_at FROM messages '
+                'WHERE conversation_id = ? AND (created_at, id) > (?, ?) '
+                'ORDER BY created_at, id LIMIT ?',
+                (conversation_id, last[0], last[1], batch_size)
+            ).fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1]['created_at'], rows[-1]['id'])
+
+    def get_history(self, conversation_id):
+        """Histórico completo no formato de mensagens do Ollama"""
+        return [
+            {'role': message['role'], 'content': message['content']}
+            for message in self.iter_messages(conversation_id)
+        ]
+
+    # Resumos (compactação de conversas longas)
+
+    def get_summary(self, conversation_id):
+        row = self._connect().execute(
+            'SELECT * FROM summaries WHERE conversation_id = ?', (conversation_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def save_summary(self, conversation_id, upto_message_id, content, tokens):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO summaries '
+                '(conversation_id, upto_message_id, content, tokens, created_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (conversation_id, upto_message_id, content, tokens, time.time())
+            )
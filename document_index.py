@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Índice local de documentos para respostas com contexto (RAG).
+
+Os arquivos enviados são divididos em trechos (`chunk_text`) e os trechos
+viram vetores pelo /api/embed do Ollama, em lotes. Os vetores ficam num
+arquivo float32 bruto (<pasta>/<modelo>/vectors.f32, ou vectors.<versão>.f32
+depois de uma compactação), uma linha por trecho distinto, normalizados para que o produto escalar seja a similaridade de
+cosseno. Na consulta o arquivo é mapeado em memória (np.memmap) e os
+trechos mais parecidos saem de um único produto matriz-vetor seguido de
+argpartition, sem laço em Python.
+
+Textos, documentos e o mapa hash -> linha ficam em SQLite (index.db). O hash
+do trecho é a chave do reaproveitamento: reenviar um documento só gera
+embeddings para os trechos que mudaram, e linhas sem trecho ativo continuam
+no arquivo até a próxima compactação.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import numpy as np
+except ImportError:  # Opcional: sem numpy as rotas de documentos respondem 503
+    np = None
+
+CHUNK_SIZE = 1000          # caracteres por trecho (~250 tokens)
+CHUNK_OVERLAP = 150        # caracteres repetidos entre trechos vizinhos
+EMBED_BATCH = 32           # trechos por chamada ao /api/embed
+COMPACT_MIN_ORPHANS = 1000 # linhas órfãs que justificam reescrever o arquivo
+WRITE_LEASE_TTL = 300      # concessão de escrita entre workers (s)
+MAX_CACHED_FILTERS = 32    # máscaras de filtro por documento guardadas por versão
+SEARCH_ATTEMPTS = 3        # buscas refeitas quando o índice muda durante a consulta
+DEFAULT_VECTORS_FILE = 'vectors.f32'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    document_id TEXT NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (document_id, position)
+);
+CREATE TABLE IF NOT EXISTS vectors (
+    hash TEXT PRIMARY KEY,
+    row INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_hash ON chunks (hash);
+"""
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingError(Exception):
+    """Falha ao gerar embeddings no Ollama (modelo ausente, servidor fora do ar...)"""
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Divide o texto em trechos de até `size` caracteres.
+
+    Respeita parágrafos e, dentro de um parágrafo longo, frases; só corta no
+    meio de uma frase quando ela sozinha passa do limite. Cada trecho começa
+    com o final do anterior (`overlap`) para não perder o contexto da borda.
+    """
+    pieces = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= size:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            while len(sentence) > size:
+                pieces.append(sentence[:size])
+                sentence = sentence[size - overlap:]
+            if sentence:
+                pieces.append(sentence)
+    
+    chunks = []
+    current = ''
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > size:
+            chunks.append(current)
+            tail = current[-overlap:] if overlap else ''
+            # A sobreposição começa numa palavra inteira
+            current = tail[tail.find(' ') + 1:] if ' ' in tail else tail
+            if len(current) + len(piece) + 2 > size:
+                current = ''
+        current = f'{current}\n\n{piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def numpy_available():
+    return np is not None
+
+def model_directory_name(model):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', model)
+
+class DocumentIndex:
+    """Documentos, trechos e vetores de um modelo de embedding.
+
+    Leituras (busca) não bloqueiam: cada processo mantém o memmap e a máscara
+    de linhas ativas e só os recarrega quando a versão gravada em `meta` muda.
+    Escritas são serializadas por um lock local e, entre workers, pela
+    concessão 'documents:<modelo>' do estado compartilhado.
+    """
+
+    def __init__(self, directory, client, embed_model, state, owner, batch_size=EMBED_BATCH,
+                 read_timeout=300):
+        self.client = client
+        self.embed_model = embed_model
+        self.state = state
+        self.owner = owner                # função que identifica este processo
+        self.batch_size = batch_size
+        self.read_timeout = read_timeout
+        self.directory = os.path.join(directory, model_directory_name(embed_model))
+        self.db_path = os.path.join(self.directory, 'index.db')
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._view_lock = threading.Lock()
+        self._view = None                 # (versão, arquivo, memmap, máscara de linhas ativas, máscaras por filtro)
+        
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        with conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+        conn.close()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _meta(self, key, default=None):
+        row = self._connect().execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row['value'] if row else default
+
+    def _vectors_path(self):
+        """Arquivo de vetores atual; o nome muda a cada compactação, junto com as linhas"""
+        return os.path.join(self.directory, self._meta('vectors_file', DEFAULT_VECTORS_FILE))
+
+    # Documentos
+
+    def documents(self):
+        rows = self._connect().execute(
+            'SELECT id, name, size, chunk_count, created_at, updated_at FROM documents ORDER BY updated_at DESC'
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, document_id):
+        row = self._connect().execute(
+            'SELECT id, name, size, chunk_count, created_at, updated_at FROM documents WHERE id = ?',
+            (document_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def add(self, name, text):
+        """Indexa (ou reindexa) um documento; retorna (documento, estatísticas).
+
+        Só os trechos cujo hash ainda não tem vetor passam pelo /api/embed.
+        Levanta EmbeddingError se o Ollama falhar; o documento anterior
+        continua valendo nesse caso.
+        """
+        content_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        with self._writing():
+            conn = self._connect()
+            current = conn.execute('SELECT * FROM documents WHERE name = ?', (name,)).fetchone()
+            if current and current['content_hash'] == content_hash:
+                return self.get(current['id']), {'chunks': current['chunk_count'], 'embedded': 0, 'reused': 0,
+                                                 'unchanged': True}
+            
+            chunks = chunk_text(text)
+            hashes = [self._chunk_hash(chunk) for chunk in chunks]
+            known = self._known_hashes(set(hashes))
+            missing = {}
+            for chunk, chunk_hash in zip(chunks, hashes):
+                if chunk_hash not in known:
+                    missing.setdefault(chunk_hash, chunk)
+            
+            start = time.time()
+            self._embed_and_store(list(missing.items()))
+            
+            now = time.time()
+            document_id = current['id'] if current else uuid.uuid4().hex[:12]
+            with conn:
+                if current:
+                    conn.execute('DELETE FROM chunks WHERE document_id = ?', (document_id,))
+                    conn.execute(
+                        'UPDATE documents SET content_hash = ?, size = ?, chunk_count = ?, updated_at = ? '
+                        'WHERE id = ?', (content_hash, len(text), len(chunks), now, document_id)
+                    )
+                else:
+                    conn.execute(
+                        'INSERT INTO documents (id, name, content_hash, size, chunk_count, created_at, updated_at) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (document_id, name, content_hash, len(text), len(chunks), now, now)
+                    )
+                conn.executemany(
+                    'INSERT INTO chunks (document_id, position, hash, text) VALUES (?, ?, ?, ?)',
+                    [(document_id, position, chunk_hash, chunk)
+                     for position, (chunk, chunk_hash) in enumerate(zip(chunks, hashes))]
+                )
+                self._bump_version(conn)
+            self._compact_if_needed()
+        
+        stats = {'chunks': len(chunks), 'embedded': len(missing), 'reused': len(chunks) - len(missing),
+                 'unchanged': False}
+        logger.info("📚 Documento %s indexado: %d trechos (%d novos) em %.1fs", name, len(chunks), len(missing),
+                    time.time() - start, extra={'document': name, **stats})
+        return self.get(document_id), stats
+
+    def delete(self, document_id):
+        with self._writing():
+            conn = self._connect()
+            with conn:
+                deleted = conn.execute('DELETE FROM documents WHERE id = ?', (document_id,)).rowcount
+                if deleted:
+                    self._bump_version(conn)
+            if deleted:
+                self._compact_if_needed()
+        return bool(deleted)
+
+    # Busca
+
+    def search(self, query, k=4, document_ids=None, min_score=0.0):
+        """Os `k` trechos mais parecidos com a consulta: [{document_id, name, position, text, score}]"""
+        vector = None
+        for _ in range(SEARCH_ATTEMPTS):
+            version, _, matrix, live, filters = self._current_view()
+            if matrix is None:
+                return []
+            if vector is None:
+                vector = self._normalize(np.asarray(self._embed([query])[0], dtype=np.float32))
+                if vector.shape[0] != matrix.shape[1]:
+                    raise EmbeddingError(f'dimensão do embedding mudou ({vector.shape[0]} != {matrix.shape[1]})')
+            
+            # Linhas -> trechos lidos numa única transação de leitura, e só se o
+            # índice ainda estiver na versão da matriz (o embedding leva tempo e
+            # uma compactação renumera as linhas)
+            conn = self._connect()
+            conn.execute('BEGIN')
+            try:
+                if self._meta('version', '0') != version:
+                    continue
+                return self._top_chunks(conn, vector, matrix, live, filters, k, document_ids, min_score)
+            finally:
+                conn.execute('COMMIT')
+        raise EmbeddingError('índice de documentos em atualização, tente novamente')
+
+    def _top_chunks(self, conn, vector, matrix, live, filters, k, document_ids, min_score):
+        if document_ids is None:
+            mask = live
+        else:
+            key = tuple(sorted(set(document_ids)))
+            mask = filters.get(key)
+            if mask is None:
+                if len(filters) >= MAX_CACHED_FILTERS:
+                    filters.clear()
+                mask = filters[key] = self._rows_for(key, matrix.shape[0])
+        
+        scores = np.asarray(matrix @ vector)
+        scores[~mask] = -np.inf
+        k = min(k, int(mask.sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = [int(row) for row in top if scores[row] >= min_score]
+        if not top:
+            return []
+        
+        placeholders = ','.join('?' * len(top))
+        rows = conn.execute(
+            f'SELECT v.row, c.document_id, d.name, c.position, c.text FROM vectors v '
+            f'JOIN chunks c ON c.hash = v.hash JOIN documents d ON d.id = c.document_id '
+            f'WHERE v.row IN ({placeholders})', top
+        ).fetchall()
+        by_row = {}
+        for row in rows:
+            by_row.setdefault(row['row'], row)  # O mesmo trecho pode estar em vários documentos
+        return [
+            {
+                'document_id': by_row[row]['document_id'],
+                'name': by_row[row]['name'],
+                'position': by_row[row]['position'],
+                'text': by_row[row]['text'],
+                'score': round(float(scores[row]), 4)
+            }
+            for row in top if row in by_row
+        ]
+
+    def stats(self):
+        conn = self._connect()
+        dimensions = int(self._meta('dimensions', 0))
+        return {
+            'embed_model': self.embed_model,
+            'documents': conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0],
+            'chunks': conn.execute('SELECT COUNT(*) FROM chunks').fetchone()[0],
+            'vectors': self._row_count(self._vectors_path(), dimensions) if dimensions else 0,
+            'dimensions': dimensions
+        }
+
+    # Vetores
+
+    def _chunk_hash(self, chunk):
+        return hashlib.sha256(f'{self.embed_model}\0{chunk}'.encode('utf-8')).hexdigest()
+
+    def _known_hashes(self, hashes):
+        known = set()
+        hashes = list(hashes)
+        conn = self._connect()
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            known.update(row['hash'] for row in conn.execute(
+                f'SELECT hash FROM vectors WHERE hash IN ({placeholders})', batch))
+        return known
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def _embed(self, texts):
+        try:
+            response = self.client.post('/api/embed', json={'model': self.embed_model, 'input': texts},
+                                        timeout=self.read_timeout)
+        except Exception as e:
+            raise EmbeddingError(f'Ollama inacessível: {e}')
+        if response.status_code != 200:
+            try:
+                error = response.json().get('error', f'HTTP {response.status_code}')
+            except ValueError:
+                error = f'HTTP {response.status_code}'
+            raise EmbeddingError(error)
+        embeddings = response.json().get('embeddings') or []
+        if len(embeddings) != len(texts):
+            raise EmbeddingError('resposta do /api/embed incompleta')
+        return embeddings
+
+    def _embed_and_store(self, items):
+        """Gera os embeddings em lotes e os acrescenta ao arquivo (chamar com a escrita reservada)"""
+        conn = self._connect()
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            vectors = self._normalize(np.asarray(self._embed([text for _, text in batch]), dtype=np.float32))
+            
+            dimensions = int(self._meta('dimensions', 0))
+            if not dimensions:
+                dimensions = vectors.shape[1]
+                with conn:
+                    conn.execute("INSERT INTO meta (key, value) VALUES ('dimensions', ?)", (str(dimensions),))
+            elif vectors.shape[1] != dimensions:
+                raise EmbeddingError(f'dimensão do embedding mudou ({vectors.shape[1]} != {dimensions})')
+            
+            # A linha vem do tamanho do arquivo: um processo que morreu depois de
+            # escrever e antes do commit deixa apenas linhas sem uso
+            path = self._vectors_path()
+            first_row = self._row_count(path, dimensions)
+            with open(path, 'ab') as f:
+                vectors.astype(np.float32).tofile(f)
+            with conn:
+                conn.executemany(
+                    'INSERT OR IGNORE INTO vectors (hash, row) VALUES (?, ?)',
+                    [(chunk_hash, first_row + offset) for offset, (chunk_hash, _) in enumerate(batch)]
+                )
+
+    @staticmethod
+    def _row_count(path, dimensions):
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (dimensions * 4)
+
+    def _bump_version(self, conn):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', '1') "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def _current_view(self):
+        """(versão, arquivo, matriz mapeada, máscara de linhas ativas, máscaras por filtro), refeitos quando o índice muda"""
+        version = self._meta('version', '0')
+        view = self._view
+        if view and view[0] == version:
+            return view
+        with self._view_lock:
+            if self._view and self._view[0] == version:
+                return self._view
+            for _ in range(SEARCH_ATTEMPTS):
+                try:
+                    self._view = self._load_view()
+                    return self._view
+                except FileNotFoundError:
+                    continue  # Arquivo trocado por uma compactação entre a leitura do meta e a abertura
+            raise EmbeddingError('índice de documentos em atualização, tente novamente')
+
+    def _load_view(self):
+        """Versão, arquivo e linhas ativas lidos numa única transação de leitura"""
+        conn = self._connect()
+        conn.execute('BEGIN')
+        try:
+            version = self._meta('version', '0')
+            path = self._vectors_path()
+            dimensions = int(self._meta('dimensions', 0))
+            rows = self._row_count(path, dimensions) if dimensions else 0
+            if not rows:
+                return (version, path, None, None, {})
+            matrix = np.memmap(path, dtype=np.float32, mode='r', shape=(rows, dimensions))
+            live = np.zeros(rows, dtype=bool)
+            active = [row[0] for row in conn.execute(
+                'SELECT DISTINCT v.row FROM vectors v JOIN chunks c ON c.hash = v.hash')]
+            live[[row for row in active if row < rows]] = True
+            return (version, path, matrix, live, {})
+        finally:
+            conn.execute('COMMIT')
+
+    def _rows_for(self, document_ids, rows):
+        mask = np.zeros(rows, dtype=bool)
+        placeholders = ','.join('?' * len(document_ids))
+        selected = [row[0] for row in self._connect().execute(
+            f'SELECT DISTINCT v.row FROM vectors v JOIN chunks c ON c.hash = v.hash '
+            f'WHERE c.document_id IN ({placeholders})', list(document_ids))]
+        mask[[row for row in selected if row < rows]] = True
+        return mask
+
+    def _compact_if_needed(self):
+        """Reescreve o arquivo só com as linhas ativas quando as órfãs passam das ativas.
+
+        O arquivo compactado ganha um nome novo, gravado em `meta` na mesma
+        transação que renumera as linhas: um processo que morre no meio deixa
+        o índice anterior intacto, e buscas em andamento percebem a troca
+        pela versão.
+        """
+        conn = self._connect()
+        dimensions = int(self._meta('dimensions', 0))
+        current_path = self._vectors_path()
+        total = self._row_count(current_path, dimensions) if dimensions else 0
+        active = conn.execute(
+            'SELECT v.hash, v.row FROM vectors v WHERE EXISTS (SELECT 1 FROM chunks c WHERE c.hash = v.hash) '
+            'ORDER BY v.row'
+        ).fetchall()
+        orphans = total - len(active)
+        if orphans < COMPACT_MIN_ORPHANS or orphans < len(active):
+            return
+        
+        version = int(self._meta('version', 0)) + 1
+        file_name = f'vectors.{version}.f32'
+        source = np.memmap(current_path, dtype=np.float32, mode='r', shape=(total, dimensions))
+        with open(os.path.join(self.directory, file_name), 'wb') as f:
+            for start in range(0, len(active), 4096):
+                rows = [row['row'] for row in active[start:start + 4096]]
+                np.asarray(source[rows], dtype=np.float32).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        del source
+        with conn:
+            conn.execute('DELETE FROM vectors')
+            conn.executemany('INSERT INTO vectors (hash, row) VALUES (?, ?)',
+                             [(row['hash'], index) for index, row in enumerate(active)])
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('vectors_file', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (file_name,)
+            )
+            self._bump_version(conn)
+        
+        # Arquivo anterior e sobras de compactações interrompidas; memmaps já
+        # abertos em outros processos continuam válidos até serem refeitos
+        for name in os.listdir(self.directory):
+            if name.startswith('vectors') and name.endswith('.f32') and name != file_name:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+        logger.info("🗜️  Índice de documentos compactado: %d linhas órfãs removidas", orphans)
+
+    def _writing(self):
+        return _WriteReservation(self)
+
+class _WriteReservation:
+    """Lock local + concessão entre workers para alterar o índice"""
+
+    def __init__(self, index):
+        self.index = index
+        self.lease = f'documents:{index.embed_model}'
+
+    def __enter__(self):
+        self.index._write_lock.acquire()
+        deadline = time.time() + WRITE_LEASE_TTL
+        while not self.index.state.acquire_lease(self.lease, self.index.owner(), WRITE_LEASE_TTL):
+            if time.time() > deadline:
+                self.index._write_lock.release()
+                raise EmbeddingError('índice ocupado por outro processo')
+            time.sleep(0.2)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.index.state.release_lease(self.lease, self.index.owner())
+        self.index._write_lock.release()
+        return False
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Gerenciador de downloads de modelos via /api/pull do Ollama"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+ACTIVE_STATUSES = ('queued', 'downloading')
+PROGRESS_INTERVAL = 0.5   # intervalo mínimo entre gravações de progresso (s)
+LEASE_RENEW_INTERVAL = 30 # renovação da concessão durante downloads longos (s)
+RATE_SMOOTHING = 0.3      # peso da amostra nova na média móvel da vazão
+
+logger = logging.getLogger(__name__)
+
+class DownloadManager:
+    """Fila FIFO de downloads com um pool limitado de workers.
+
+    Cada download lê o NDJSON de /api/pull, que informa `completed`/`total`
+    em bytes por camada, e publica progresso real, vazão e ETA no estado
+    compartilhado (namespace 'downloads'). Pedidos simultâneos do mesmo modelo
+    são unificados num único job, inclusive entre workers (concessão
+    'download:<modelo>').
+    """
+
+    def __init__(self, client, state, owner, max_workers=2, translate=None, on_complete=None,
+                 read_timeout=600, publish=None):
+        self.client = client
+        self.state = state
+        self.owner = owner                # função que identifica este processo
+        self.max_workers = max_workers
+        self.translate = translate or (lambda key, language: key)
+        self.on_complete = on_complete    # chamado com o nome do modelo após sucesso
+        self.read_timeout = read_timeout
+        self.publish = publish            # publica ('download', job) a cada mudança
+        self._queue = deque()
+        self._cancelled = set()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._workers_pid = None
+        self.bytes_downloaded = 0         # total baixado por este processo (métricas)
+
+    # API pública
+
+    def submit(self, model_name, language='pt', backend=None):
+        """Enfileira um download; retorna (job, criado).
+
+        `backend` direciona o pull para um servidor específico (BackendPool).
+        """
+        # Verificação, concessão e enfileiramento sob o mesmo lock: a concessão
+        # só separa workers, dentro do processo o dono é sempre o mesmo
+        with self._condition:
+            current = self.get(model_name)
+            if model_name in self._queue:
+                return current or {'model': model_name, 'status': 'queued'}, False
+            # Um job sem atualização há mais que o timeout de leitura pertencia a um worker que morreu
+            if (current and current['status'] in ACTIVE_STATUSES
+                    and time.time() - current['updated_at'] < self.read_timeout):
+                return current, False
+            if not self.state.acquire_lease(self._lease(model_name), self.owner(), self.read_timeout):
+                return self.get(model_name) or {'model': model_name, 'status': 'queued'}, False
+            
+            job = {
+                'model': model_name,
+                'language': language,
+                'status': 'queued',
+                'progress': 0,
+                'message': self.translate('download_queued', language),
+                'completed': 0,
+                'total': 0,
+                'rate': 0,
+                'eta': None,
+                'position': 0,
+                'backend': backend,
+                'owner': self.owner(),
+                'created_at': time.time(),
+                'updated_at': time.time()
+            }
+            
+            self._cancelled.discard(model_name)
+            self.state.delete('download_cancel', model_name)
+            self._queue.append(model_name)
+            job['position'] = len(self._queue)
+            self._save(job)
+            self._ensure_workers()
+            self._condition.notify()
+        return job, True
+
+    def cancel(self, model_name):
+        """Cancela um download na fila ou em andamento (em qualquer worker)"""
+        job = self.get(model_name)
+        if not job or job['status'] not in ACTIVE_STATUSES:
+            return False
+        
+        self.state.set('download_cancel', model_name, time.time())
+        with self._condition:
+            self._cancelled.add(model_name)
+            if model_name in self._queue:
+                self._queue.remove(model_name)
+                self._finish(job, 'cancelled', self.translate('download_cancelled', job['language']))
+                self._update_positions()
+        return True
+
+    def fail_interrupted(self):
+        """Marca como erro os downloads ativos de uma execução anterior do servidor"""
+        for job in self.jobs().values():
+            if job['status'] in ACTIVE_STATUSES:
+                self._finish(job, 'error', f"{self.translate('download_error', job['language'])}: "
+                                           f"{self.translate('download_interrupted', job['language'])}")
+
+    def get(self, model_name):
+        return self.state.get('downloads', model_name)
+
+    def jobs(self):
+        return self.state.items('downloads')
+
+    # Workers
+
+    def _lease(self, model_name):
+        return f'download:{model_name}'
+
+    def _ensure_workers(self):
+        """Cria o pool de workers (chamar com o lock); refeito após fork"""
+        if self._workers_pid != os.getpid():
+            self._workers = []
+            self._workers_pid = os.getpid()
+        while len(self._workers) < self.max_workers:
+            thread = threading.Thread(target=self._worker_loop, name=f'download-{len(self._workers)}')
+            thread.daemon = True
+            self._workers.append(thread)
+            thread.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                model_name = self._queue.popleft()
+                self._update_positions()
+            self._pull(model_name)
+
+    def _update_positions(self):
+        """Atualiza a posição na fila dos jobs aguardando (chamar com o lock)"""
+        for position, model_name in enumerate(self._queue, start=1):
+            job = self.get(model_name)
+            if job and job['status'] == 'queued':
+                job['position'] = position
+                self._save(job)
+
+    def _save(self, job):
+        self.state.set('downloads', job['model'], job)
+        if self.publish:
+            self.publish('download', job)
+
+    def _count_bytes(self, amount):
+        if amount > 0:
+            with self._condition:
+                self.bytes_downloaded += amount
+
+    def _is_cancelled(self, model_name):
+        with self._condition:
+            if model_name in self._cancelled:
+                return True
+        return self.state.get('download_cancel', model_name) is not None
+
+    def _finish(self, job, status, message):
+        job.update({
+            'status': status,
+            'message': message,
+            'rate': 0,
+            'eta': None,
+            'position': 0,
+            'updated_at': time.time()
+        })
+        if status == 'completed':
+            job['progress'] = 100
+        self._save(job)
+        self.state.delete('download_cancel', job['model'])
+        self.state.release_lease(self._lease(job['model']), self.owner())
+
+    def _pull(self, model_name):
+        job = self.get(model_name)
+        if job is None:
+            return
+        language = job['language']
+        
+        if self._is_cancelled(model_name):
+            self._finish(job, 'cancelled', self.translate('download_cancelled', language))
+            return
+        
+        logger.info("📥 Iniciando download do modelo: %s", model_name, extra={'model': model_name})
+        job.update({
+            'status': 'downloading',
+            'position': 0,
+            'message': self.translate('download_started', language),
+            'started_at': time.time()
+        })
+        self._save(job)
+        
+        layers = {}
+        last_write = 0
+        last_renew = time.time()
+        last_sample = (time.time(), 0)
+        rate = 0.0
+        
+        target = {'backend': job['backend']} if job.get('backend') else {}
+        try:
+            response = self.client.post(
+                '/api/pull',
+                json={'model': model_name, 'stream': True},
+                stream=True,
+                timeout=self.read_timeout,
+                **target
+            )
+            with response:
+                if response.status_code != 200:
+                    raise RuntimeError(f'HTTP {response.status_code}')
+                
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if 'error' in event:
+                        raise RuntimeError(event['error'])
+                    
+                    # Progresso real: soma de bytes de todas as camadas
+                    digest = event.get('digest')
+                    if digest and event.get('total'):
+                        layers[digest] = (event.get('completed', 0), event['total'])
+                    if event.get('status') == 'success':
+                        break
+                    
+                    now = time.time()
+                    if now - last_write < PROGRESS_INTERVAL:
+                        continue
+                    
+                    # Cancelamento: fechar a conexão faz o Ollama interromper o pull
+                    if self._is_cancelled(model_name):
+                        self._finish(job, 'cancelled', self.translate('download_cancelled', language))
+                        logger.info("🛑 Download cancelado: %s", model_name, extra={'model': model_name})
+                        return
+                    
+                    completed = sum(done for done, _ in layers.values())
+                    total = sum(size for _, size in layers.values())
+                    self._count_bytes(completed - last_sample[1])
+                    elapsed = now - last_sample[0]
+                    if elapsed > 0 and completed >= last_sample[1]:
+                        sample = (completed - last_sample[1]) / elapsed
+                        rate = sample if rate == 0 else RATE_SMOOTHING * sample + (1 - RATE_SMOOTHING) * rate
+                    last_sample = (now, completed)
+                    
+                    job.update({
+                        'completed': completed,
+                        'total': total,
+                        'progress': int(completed * 100 / total) if total else 0,
+                        'rate': int(rate),
+                        'eta': int((total - completed) / rate) if rate > 0 and total else None,
+                        'message': event.get('status', job['message']),
+                        'updated_at': now
+                    })
+                    self._save(job)
+                    last_write = now
+                    
+                    if now - last_renew > LEASE_RENEW_INTERVAL:
+                        self.state.acquire_lease(self._lease(model_name), self.owner(), self.read_timeout)
+                        last_renew = now
+                else:
+                    raise RuntimeError('stream encerrado antes da conclusão')
+            
+            job['completed'] = job['total'] = sum(size for _, size in layers.values())
+            self._count_bytes(job['completed'] - last_sample[1])
+            self._finish(job, 'completed', self.translate('download_complete', language))
+            logger.info("✅ Download completo: %s", model_name, extra={'model': model_name})
+            if self.on_complete:
+                self.on_complete(model_name)
+        
+        except (requests.exceptions.RequestException, RuntimeError, ValueError) as e:
+            self._finish(job, 'error', f"{self.translate('download_error', language)}: {e}")
+            logger.error("❌ Erro no download de %s: %s", model_name, e, extra={'model': model_name})
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Canal de eventos em tempo real (downloads, conexão, lista de modelos).
+
+Os eventos são entregues a todos os assinantes do processo. Quando o estado
+compartilhado é multi-processo (SQLite), os eventos passam por um log no
+banco e uma thread de retransmissão os entrega aos assinantes de cada worker.
+"""
+
+import itertools
+import logging
+import os
+import queue
+import threading
+
+RELAY_INTERVAL = 0.5      # intervalo de leitura do log compartilhado (s)
+SUBSCRIBER_BUFFER = 256   # eventos pendentes por assinante antes de desconectá-lo
+
+logger = logging.getLogger(__name__)
+
+class Subscription:
+    """Assinatura baseada em fila, para servidores com uma thread por conexão"""
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.closed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # Cliente lento: encerra para que ele reconecte e receba um novo snapshot
+            self.closed = True
+            self.bus.unsubscribe(self.deliver)
+
+    def get(self, timeout):
+        """Próximo evento ou None após `timeout` segundos"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.closed = True
+        self.bus.unsubscribe(self.deliver)
+
+class EventBus:
+    """Publica eventos {'id', 'type', 'data'} para assinantes locais e de outros workers"""
+
+    def __init__(self, state):
+        self.state = state
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._relay_pid = None
+
+    @property
+    def shared(self):
+        return getattr(self.state, 'shared', False)
+
+    def publish(self, event_type, data):
+        if self.shared:
+            self._ensure_relay()
+            self.state.append_event(event_type, data)
+        else:
+            self._fanout({'id': next(self._ids), 'type': event_type, 'data': data})
+
+    def subscribe(self, deliver=None):
+        """Registra um assinante.
+
+        Sem argumentos, retorna uma `Subscription` com fila; com `deliver`,
+        registra a função (ex.: para o event loop do modo asyncio).
+        """
+        subscription = None
+        if deliver is None:
+            subscription = Subscription(self)
+            deliver = subscription.deliver
+        with self._lock:
+            self._subscribers.append(deliver)
+        if self.shared:
+            self._ensure_relay()
+        return subscription or deliver
+
+    def unsubscribe(self, deliver):
+        with self._lock:
+            if deliver in self._subscribers:
+                self._subscribers.remove(deliver)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def _fanout(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for deliver in subscribers:
+            deliver(event)
+
+    def _ensure_relay(self):
+        """Inicia a thread que lê o log compartilhado (uma por processo)"""
+        with self._lock:
+            if self._relay_pid == os.getpid():
+                return
+            self._relay_pid = os.getpid()
+        # Posição lida antes de iniciar a thread para não perder eventos recém-publicados
+        last_id = self.state.last_event_id()
+        thread = threading.Thread(target=self._relay_loop, args=(last_id,), name='event-relay')
+        thread.daemon = True
+        thread.start()
+
+    def _relay_loop(self, last_id):
+        stop = threading.Event()
+        while not stop.wait(RELAY_INTERVAL):
+            try:
+                for event in self.state.events_since(last_id):
+                    last_id = event['id']
+                    self._fanout(event)
+            except Exception as e:
+                logger.error("❌ Erro no relay de eventos: %s", e)
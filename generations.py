@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Gerações de chat em andamento, canceláveis pelo id.
+
+Cada pedido de chat recebe um id (cabeçalho X-Generation-Id). O botão de parar
+da interface chama POST /api/chat/<id>/cancel; quem transmite a resposta
+confere o cancelamento a cada linha do Ollama e fecha a conexão com ele, o
+que interrompe a geração. Com vários workers o pedido de cancelamento pode
+cair em outro processo: ele grava um marcador no estado compartilhado
+(namespace 'chat_cancel') que uma thread de cada processo consulta a cada
+CHECK_INTERVAL.
+"""
+
+import os
+import threading
+import time
+import uuid
+
+CHECK_INTERVAL = 0.25  # consulta dos cancelamentos vindos de outros workers (s)
+
+def new_generation_id():
+    return uuid.uuid4().hex[:16]
+
+class Generation:
+    """Uma geração em andamento; `reason` fica 'user' quando cancelada pelo id"""
+
+    def __init__(self, generation_id, model):
+        self.id = generation_id
+        self.model = model
+        self.reason = None
+        self.started_at = time.time()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+class GenerationRegistry:
+    """Gerações em andamento neste processo (e, com estado compartilhado, em todos)"""
+
+    def __init__(self, state, owner):
+        self.state = state
+        self.owner = owner                # função que identifica este processo
+        self._active = {}
+        self._lock = threading.Lock()
+        self._poller_pid = None
+
+    def begin(self, generation_id, model):
+        generation = Generation(generation_id, model)
+        with self._lock:
+            self._active[generation_id] = generation
+        if self.state.shared:
+            self.state.set('generations', generation_id,
+                           {'model': model, 'owner': self.owner(), 'started_at': generation.started_at})
+            self._start_poller()
+        return generation
+
+    def finish(self, generation):
+        with self._lock:
+            if self._active.pop(generation.id, None) is None:
+                return
+        if self.state.shared:
+            self.state.delete('generations', generation.id)
+            self.state.delete('chat_cancel', generation.id)
+
+    def cancel(self, generation_id):
+        """Pede o cancelamento; False se a geração não existe (ou já terminou)"""
+        with self._lock:
+            generation = self._active.get(generation_id)
+            if generation:
+                generation.reason = 'user'
+                return True
+        if self.state.shared and self.state.get('generations', generation_id) is not None:
+            self.state.set('chat_cancel', generation_id, time.time())
+            return True
+        return False
+
+    def active(self):
+        with self._lock:
+            return len(self._active)
+
+    def models_in_use(self):
+        """Modelos com geração em andamento neste processo ou, com estado compartilhado, em qualquer worker"""
+        with self._lock:
+            models = {generation.model for generation in self._active.values()}
+        if self.state.shared:
+            models.update(entry['model'] for entry in self.state.items('generations').values())
+        # Gerações de comparação registram os modelos separados por vírgula
+        return {name for entry in models for name in entry.split(',')}
+
+    def _start_poller(self):
+        """Thread que aplica os cancelamentos gravados por outros workers (uma por processo)"""
+        if self._poller_pid == os.getpid():
+            return
+        with self._lock:
+            if self._poller_pid == os.getpid():
+                return
+            self._poller_pid = os.getpid()
+        thread = threading.Thread(target=self._poll_loop, name='generation-cancel')
+        thread.daemon = True
+        thread.start()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            with self._lock:
+                if not self._active:
+                    continue
+            try:
+                requested = self.state.items('chat_cancel')
+            except Exception:
+                continue  # Tenta de novo no próximo ciclo
+            with self._lock:
+                for generation_id in requested:
+                    generation = self._active.get(generation_id)
+                    if generation and not generation.cancelled:
+                        generation.reason = 'user'
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Respostas JSON com ETag forte, 304 e compressão negociada.
+
+Usado pelas rotas de leitura do Flask e do modo asyncio: o corpo é
+serializado de forma determinística, o ETag é o hash do conteúdo e a versão
+comprimida (br ou gzip) fica guardada por ETag, então repetir uma resposta
+idêntica não comprime de novo.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # Opcional: sem o pacote, apenas gzip
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024   # corpos menores não compensam a compressão
+COMPRESSED_CACHE_SIZE = 128
+
+_compressed = OrderedDict()  # (etag, codificação) -> bytes
+_compressed_lock = threading.Lock()
+
+# Acertos e falhas por cache, lidos pelo /metrics
+_stats = {'not_modified': 0, 'full': 0, 'compress_hits': 0, 'compress_misses': 0}
+
+def stats():
+    with _compressed_lock:
+        return dict(_stats)
+
+def _count(name):
+    with _compressed_lock:
+        _stats[name] += 1
+
+def accepted_encodings(accept_encoding):
+    """Codificações aceitas (q > 0) num cabeçalho Accept-Encoding"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0
+        if name:
+            accepted[name.lower()] = quality
+    
+    wildcard = accepted.get('*', 0) > 0
+    return {name for name in ('br', 'gzip') if accepted.get(name, 1 if wildcard else 0) > 0}
+
+def choose_encoding(accept_encoding):
+    """Melhor codificação aceita pelo cliente: 'br', 'gzip' ou None"""
+    accepted = accepted_encodings(accept_encoding)
+    if 'br' in accepted and brotli is not None:
+        return 'br'
+    return 'gzip' if 'gzip' in accepted else None
+
+def compress(body, encoding, etag):
+    key = (etag, encoding)
+    with _compressed_lock:
+        if key in _compressed:
+            _compressed.move_to_end(key)
+            _stats['compress_hits'] += 1
+            return _compressed[key]
+        _stats['compress_misses'] += 1
+    
+    if encoding == 'br':
+        data = brotli.compress(body, quality=5)
+    else:
+        data = gzip.compress(body, compresslevel=6)
+    
+    with _compressed_lock:
+        _compressed[key] = data
+        while len(_compressed) > COMPRESSED_CACHE_SIZE:
+            _compressed.popitem(last=False)
+    return data
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(','))
+
+def response_parts(body, content_type, accept_encoding=None, if_none_match=None, max_age=0):
+    """Retorna (status, cabeçalhos, corpo) para um corpo já serializado.
+
+    O ETag identifica a representação: cada codificação tem o seu, como
+    exige um validador forte.
+    """
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    encoding = choose_encoding(accept_encoding) if len(body) >= MIN_COMPRESS_SIZE else None
+    etag = f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+    
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f'max-age={max_age}, must-revalidate' if max_age else 'no-cache',
+        'Vary': 'Accept-Encoding'
+    }
+    if etag_matches(if_none_match, etag):
+        _count('not_modified')
+        return 304, headers, b''
+    _count('full')
+    
+    headers['Content-Type'] = content_type
+    if encoding:
+        body = compress(body, encoding, etag)
+        headers['Content-Encoding'] = encoding
+    return 200, headers, body
+
+def json_response_parts(payload, accept_encoding=None, if_none_match=None, max_age=0):
+    """Como response_parts, para um payload JSON (serialização determinística)"""
+    body = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return response_parts(body, 'application/json', accept_encoding, if_none_match, max_age)
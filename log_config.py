@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Logging estruturado com nível configurável.
+
+OLLAMAGUI_LOG_LEVEL (DEBUG, INFO, WARNING...) controla o que é registrado e
+OLLAMAGUI_LOG_FORMAT escolhe entre texto legível ('text') e uma linha JSON
+por registro ('json'). Campos passados em `extra=` viram chaves do JSON (ou
+pares chave=valor no texto). A escrita no terminal acontece numa thread
+separada, então as rotas não esperam pelo stdout.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+# Loggers de acesso (uma linha por requisição) só aparecem no nível DEBUG
+ACCESS_LOGGERS = ('werkzeug', 'aiohttp.access')
+
+# Atributos padrão de um LogRecord; o resto veio de `extra=`
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+def record_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in STANDARD_ATTRIBUTES}
+
+class TextFormatter(logging.Formatter):
+    """`HH:MM:SS NÍVEL mensagem chave=valor`"""
+
+    def format(self, record):
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname:<7} {record.getMessage()}"
+        # Os loggers de acesso repetem na mensagem os campos que passam em `extra`
+        fields = record_fields(record) if record.name not in ACCESS_LOGGERS else None
+        if fields:
+            line += '  ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """Um objeto JSON por linha, para coletores de log"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process
+        }
+        entry.update(record_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """Enfileira os registros e os escreve numa thread (refeita após o fork dos workers)"""
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A thread do processo pai não existe no filho: nova fila e nova thread
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def close(self):
+        if self._listener and self._pid == os.getpid():
+            self._listener.stop()
+        super().close()
+
+def configure_logging(level=None, fmt=None):
+    """Configura o logger raiz; pode ser chamada de novo para trocar nível ou formato"""
+    level = (level or os.environ.get('OLLAMAGUI_LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('OLLAMAGUI_LOG_FORMAT', 'text')
+    
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, BackgroundHandler):
+            root.removeHandler(handler)
+            handler.close()
+    root.addHandler(BackgroundHandler(stream))
+    root.setLevel(level)
+    
+    for name in ACCESS_LOGGERS:
+        logging.getLogger(name).setLevel(logging.DEBUG if level == 'DEBUG' else logging.WARNING)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Métricas no formato de texto do Prometheus (GET /metrics).
+
+Contadores, gauges e histogramas com rótulos, sem dependências externas.
+Cada processo acumula os próprios valores; com vários workers (estado
+compartilhado em SQLite) cada um grava um retrato periódico no namespace
+'metrics' e /metrics soma os retratos de todos, então qualquer worker que
+atender a requisição devolve o total.
+"""
+
+import os
+import threading
+import time
+
+FLUSH_INTERVAL = 5    # gravação do retrato deste processo no estado compartilhado (s)
+GAUGE_STALE = 60      # gauges de workers sem retrato recente são ignorados (s)
+
+# Buckets padrão: latências do Ollama vão de milissegundos (cache) a minutos
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Operações locais (busca no índice de documentos), em milissegundos
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+RATE_BUCKETS = (1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=(), collect=None, merge='sum'):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.collect = collect    # função que devolve {valores dos rótulos: valor} na hora da leitura
+        self.merge = merge        # 'sum' (valor por processo) ou 'max' (valor global repetido)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def samples(self):
+        if self.collect:
+            return {tuple(str(value) for value in key): value for key, value in self.collect().items()}
+        with self._lock:
+            return dict(self._values)
+
+    def describe(self):
+        return {'type': self.kind, 'help': self.help, 'labels': list(self.labels), 'merge': self.merge}
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            # Último índice = acima do maior bucket (+Inf)
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            entry['counts'][index] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    def samples(self):
+        with self._lock:
+            return {key: {'counts': list(entry['counts']), 'sum': entry['sum'], 'count': entry['count']}
+                    for key, entry in self._values.items()}
+
+    def describe(self):
+        return dict(super().describe(), buckets=list(self.buckets))
+
+class MetricsRegistry:
+    """Conjunto de métricas de um processo, agregável entre workers"""
+
+    def __init__(self, state, owner):
+        self.state = state
+        self.owner = owner        # função que identifica este processo
+        self._metrics = {}
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=(), collect=None):
+        return self._register(Counter(name, help_text, labels, collect))
+
+    def gauge(self, name, help_text, labels=(), collect=None, merge='sum'):
+        return self._register(Gauge(name, help_text, labels, collect, merge))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    # --- Retratos e agregação ---
+
+    def snapshot(self):
+        """Valores atuais deste processo em formato serializável (JSON)"""
+        metrics = {}
+        for name, metric in self._metrics.items():
+            try:
+                samples = metric.samples()
+            except Exception:
+                continue  # Um coletor com erro não derruba o /metrics inteiro
+            metrics[name] = dict(metric.describe(), samples=[[list(key), value] for key, value in samples.items()])
+        return {'updated_at': time.time(), 'metrics': metrics}
+
+    def flush(self):
+        self.state.set('metrics', self.owner(), self.snapshot())
+
+    def start(self):
+        """Inicia a gravação periódica do retrato (uma vez por processo, só com estado compartilhado)"""
+        if not self.state.shared or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        thread = threading.Thread(target=self._flush_loop, name='metrics-flush')
+        thread.daemon = True
+        thread.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                pass  # Tenta de novo no próximo ciclo
+
+    def collect(self):
+        """Retratos de todos os processos (ou só deste, sem estado compartilhado)"""
+        if not self.state.shared:
+            return [self.snapshot()]
+        self.start()
+        self.flush()
+        return list(self.state.items('metrics').values())
+
+    def render(self):
+        """Texto no formato de exposição do Prometheus (versão 0.0.4)"""
+        now = time.time()
+        merged = {}
+        for snapshot in self.collect():
+            fresh = now - snapshot['updated_at'] < GAUGE_STALE
+            for name, metric in snapshot['metrics'].items():
+                # Contadores de workers que já saíram continuam valendo; gauges não
+                if metric['type'] == 'gauge' and not fresh:
+                    continue
+                target = merged.setdefault(name, dict(metric, samples={}))
+                for key, value in metric['samples']:
+                    key = tuple(key)
+                    target['samples'][key] = self._merge(metric, target['samples'].get(key), value)
+        
+        lines = []
+        for name in sorted(merged):
+            metric = merged[name]
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in sorted(metric['samples'].items()):
+                if metric['type'] == 'histogram':
+                    lines.extend(self._histogram_lines(name, metric, key, value))
+                else:
+                    lines.append(f"{name}{format_labels(metric['labels'], key)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _merge(metric, current, value):
+        if current is None:
+            return value
+        if metric['type'] == 'histogram':
+            return {
+                'counts': [a + b for a, b in zip(current['counts'], value['counts'])],
+                'sum': current['sum'] + value['sum'],
+                'count': current['count'] + value['count']
+            }
+        if metric.get('merge') == 'max':
+            return max(current, value)
+        return current + value
+
+    @staticmethod
+    def _histogram_lines(name, metric, key, value):
+        cumulative = 0
+        for bound, count in zip(list(metric['buckets']) + [float('inf')], value['counts']):
+            cumulative += count
+            le = f'le="{format_value(bound)}"'
+            yield f"{name}_bucket{format_labels(metric['labels'], key, le)} {cumulative}"
+        yield f"{name}_sum{format_labels(metric['labels'], key)} {format_value(value['sum'])}"
+        yield f"{name}_count{format_labels(metric['labels'], key)} {value['count']}"
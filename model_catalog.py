@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Catálogo de modelos do ollama.com, persistido em disco.
+
+Leituras nunca esperam a rede: devolvem o último catálogo salvo (mesmo vencido
+ou com o ollama.com fora do ar) e, se ele estiver vencido, disparam uma
+atualização em segundo plano (stale-while-revalidate). A atualização usa
+requisições condicionais (ETag / Last-Modified); com vários workers, só o
+dono da concessão 'catalog-refresh' consulta o ollama.com e os demais
+recarregam o arquivo quando ele muda.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+RETRY_DELAY = 60    # espera após uma falha antes de tentar de novo (s)
+LEASE_TTL = 120     # duração máxima de uma atualização (s)
+
+logger = logging.getLogger(__name__)
+
+class ModelCatalog:
+    """Cache em disco do /api/tags do ollama.com"""
+
+    def __init__(self, client, path, state, owner, ttl=3600, on_update=None):
+        self.client = client
+        self.path = path
+        self.state = state
+        self.owner = owner            # função que identifica este processo
+        self.ttl = ttl
+        self.on_update = on_update    # chamado com o catálogo após cada mudança
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._mtime = None
+        self._refreshing = False
+        self._last_attempt = 0
+
+    def models(self):
+        """Lista de modelos ordenada por popularidade (nunca bloqueia na rede)"""
+        catalog = self._load()
+        if self._is_stale(catalog):
+            self.refresh_async()
+        return catalog['models']
+
+    def info(self):
+        """Metadados do catálogo em cache (versão, idade, atualização em curso)"""
+        catalog = self._load()
+        return {
+            'version': catalog['version'],
+            'fetched_at': catalog['fetched_at'],
+            'count': len(catalog['models']),
+            'stale': self._is_stale(catalog),
+            'refreshing': self._refreshing
+        }
+
+    def version(self):
+        return self._load()['version']
+
+    def refresh_async(self):
+        """Agenda uma atualização em segundo plano (no máximo uma por processo)"""
+        with self._lock:
+            if self._refreshing or time.time() - self._last_attempt < RETRY_DELAY:
+                return
+            self._refreshing = True
+            self._last_attempt = time.time()
+        thread = threading.Thread(target=self._refresh, name='catalog-refresh')
+        thread.daemon = True
+        thread.start()
+
+    def _is_stale(self, catalog):
+        return time.time() - catalog['fetched_at'] >= self.ttl
+
+    def _load(self):
+        """Catálogo em memória, relido do disco quando outro processo o atualiza"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        
+        with self._lock:
+            if self._catalog is not None and mtime == self._mtime:
+                return self._catalog
+        
+        catalog = {'models': [], 'version': None, 'etag': None, 'last_modified': None, 'fetched_at': 0}
+        if mtime is not None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    catalog.update(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning("❌ Catálogo em disco ilegível: %s", e)
+        
+        with self._lock:
+            self._catalog = catalog
+            self._mtime = mtime
+        return catalog
+
+    def _save(self, catalog):
+        """Grava de forma atômica (arquivo temporário + rename)"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+    def _refresh(self):
+        try:
+            if not self.state.acquire_lease('catalog-refresh', self.owner(), LEASE_TTL):
+                return  # Outro worker está atualizando; o arquivo será relido ao mudar
+            try:
+                self._fetch()
+            finally:
+                self.state.release_lease('catalog-refresh', self.owner())
+        except Exception as e:
+            logger.error("❌ Erro ao atualizar catálogo da web: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _fetch(self):
+        catalog = dict(self._load())
+        if not self._is_stale(catalog):
+            return  # Atualizado por outro worker enquanto esperávamos
+        
+        headers = {}
+        if catalog['etag']:
+            headers['If-None-Match'] = catalog['etag']
+        if catalog['last_modified']:
+            headers['If-Modified-Since'] = catalog['last_modified']
+        
+        logger.info("🌐 Atualizando catálogo de modelos da web...")
+        response = self.client.get('/api/tags', headers=headers)
+        
+        if response.status_code == 304:
+            logger.info("📦 Catálogo da web inalterado")
+            catalog['fetched_at'] = time.time()
+            self._save(catalog)
+            return
+        if response.status_code != 200:
+            logger.error("❌ Erro na API web: %s", response.status_code)
+            return
+        
+        models = self._parse(response.json())
+        version = hashlib.sha256(json.dumps(models, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        changed = version != catalog['version']
+        catalog.update({
+            'models': models,
+            'version': version,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time()
+        })
+        self._save(catalog)
+        logger.info("✅ %d modelos encontrados na web", len(models))
+        
+        if changed and self.on_update:
+            self.on_update(catalog)
+
+    @staticmethod
+    def _parse(data):
+        models = []
+        for model_data in data.get('models', []):
+            model = model_data.get('model', '')
+            if model:
+                # Extrai informações do modelo
+                parts = model.split(':')
+                name = parts[0] if len(parts) > 0 else model
+                tag = parts[1] if len(parts) > 1 else 'latest'
+                
+                models.append({
+                    'name': model,
+                    'short_name': name,
+                    'tag': tag,
+                    'pulls': model_data.get('pulls', 0),
+                    'size': model_data.get('size', 0),
+                    'modified': model_data.get('modified_at', '')
+                })
+        
+        # Ordena por popularidade (pulls)
+        models.sort(key=lambda x: x['pulls'], reverse=True)
+        return models
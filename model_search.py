@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Índice de busca do catálogo de modelos.
+
+Construído uma vez por versão do catálogo: um índice invertido de tokens
+(nome, nome curto, tag e família) e um índice de trigramas sobre esse
+vocabulário, que encontra prefixos, trechos e nomes digitados com erro sem
+percorrer o catálogo inteiro a cada consulta.
+"""
+
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+(?:\.[0-9]+)*')
+
+# Pontuação de um termo da busca contra um token do índice
+EXACT_SCORE = 3.0
+PREFIX_SCORE = 2.0
+SUBSTRING_SCORE = 1.5
+FUZZY_SCORE = 1.2        # multiplicado pela similaridade de trigramas
+FUZZY_MIN_SIMILARITY = 0.35
+SHORT_TERM_LENGTH = 3    # termos menores não têm trigrama próprio: varredura do vocabulário
+POPULARITY_WEIGHT = 0.1  # por ordem de grandeza de pulls
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+def trigrams(token):
+    padded = f"${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def model_family(short_name):
+    """'llama3.1' -> 'llama', 'deepseek-coder' -> 'deepseek'"""
+    match = re.match(r'[a-z]+', short_name.lower())
+    return match.group(0) if match else ''
+
+def edit_distance(a, b, limit):
+    """Distância de Levenshtein entre `a` e `b`, ou limit + 1 se passar do limite"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+def max_edits(term):
+    """Erros de digitação tolerados: nenhum em termos curtos, dois a partir de 5 letras"""
+    if len(term) >= 5:
+        return 2
+    return 1 if len(term) >= 4 else 0
+
+class SearchIndex:
+    """Busca ranqueada (qualidade do casamento + popularidade) com tolerância a erros"""
+
+    def __init__(self, models):
+        self.models = models
+        self._postings = {}      # token -> {índice do modelo: peso do campo}
+        self._trigrams = {}      # trigrama -> tokens do vocabulário
+        self._gram_counts = {}   # token -> número de trigramas distintos
+        self._popularity = []
+        
+        for doc_id, model in enumerate(models):
+            self._popularity.append(POPULARITY_WEIGHT * math.log10((model.get('pulls') or 0) + 1))
+            fields = (
+                (model['name'], 1.0),
+                (model.get('short_name', ''), 1.0),
+                (model_family(model.get('short_name', '')), 0.8),
+                (model.get('tag', ''), 0.6)
+            )
+            for text, weight in fields:
+                for token in tokenize(text):
+                    postings = self._postings.setdefault(token, {})
+                    postings[doc_id] = max(postings.get(doc_id, 0), weight)
+        
+        for token in self._postings:
+            grams = trigrams(token)
+            self._gram_counts[token] = len(grams)
+            for gram in grams:
+                self._trigrams.setdefault(gram, set()).add(token)
+
+    def search(self, query, offset=0, limit=50):
+        """Retorna (página de modelos, total de resultados)"""
+        terms = tokenize(query)
+        if not terms:
+            return [], 0
+        
+        scores = None
+        for term in terms:
+            term_scores = self._match_term(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                # Todos os termos precisam casar
+                scores = {doc_id: scores[doc_id] + score
+                          for doc_id, score in term_scores.items() if doc_id in scores}
+            if not scores:
+                return [], 0
+        
+        ranked = sorted(scores, key=lambda doc_id: scores[doc_id] + self._popularity[doc_id], reverse=True)
+        return [self.models[doc_id] for doc_id in ranked[offset:offset + limit]], len(ranked)
+
+    def _match_term(self, term):
+        """Melhor pontuação de cada modelo para um termo da busca"""
+        term_grams = trigrams(term)
+        candidates = {}
+        if len(term) < SHORT_TERM_LENGTH:
+            # "$l$" só casaria com o token "l": prefixos e trechos exigem varrer o vocabulário
+            candidates = {token: 0 for token in self._postings if term in token}
+        else:
+            for gram in term_grams:
+                for token in self._trigrams.get(gram, ()):
+                    candidates[token] = candidates.get(token, 0) + 1
+        
+        scores = {}
+        for token, shared in candidates.items():
+            # Similaridade de Jaccard entre os trigramas do termo e do token
+            similarity = shared / (len(term_grams) + self._gram_counts[token] - shared)
+            score = self._token_score(term, token, similarity)
+            if not score:
+                continue
+            for doc_id, weight in self._postings[token].items():
+                if score * weight > scores.get(doc_id, 0):
+                    scores[doc_id] = score * weight
+        return scores
+
+    @staticmethod
+    def _token_score(term, token, similarity):
+        if token == term:
+            return EXACT_SCORE
+        if token.startswith(term):
+            return PREFIX_SCORE
+        if term in token:
+            return SUBSTRING_SCORE
+        if similarity >= FUZZY_MIN_SIMILARITY:
+            return FUZZY_SCORE * similarity
+        limit = max_edits(term)
+        if limit:
+            distance = edit_distance(term, token, limit)
+            if distance <= limit:
+                return FUZZY_SCORE * FUZZY_MIN_SIMILARITY / distance
+        return 0
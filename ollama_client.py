@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Cliente HTTP compartilhado com pool de conexões keep-alive"""
+
+from http.cookiejar import DefaultCookiePolicy
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Métodos seguros para repetir em caso de falha de leitura ou 502/503/504
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'DELETE'])
+
+class OllamaClient:
+    """Cliente thread-safe para um servidor Ollama (ou compatível).
+
+    Todas as requisições passam por uma única sessão com pool de conexões
+    keep-alive, evitando abrir uma conexão TCP nova a cada chamada.
+    """
+
+    def __init__(self, base_url, pool_size=32, connect_timeout=5, read_timeout=120, retries=2):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self._build_session()
+        
+        # Conexões do pool não podem ser compartilhadas entre processos (workers)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._build_session)
+
+    def _build_session(self):
+        # Falhas de conexão são repetidas para qualquer método (nada foi enviado);
+        # falhas de leitura e status 5xx só para métodos idempotentes
+        retries = self.retries
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=False,
+            max_retries=retry
+        )
+        
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # O Ollama não usa cookies; bloqueá-los evita escrita concorrente no cookie jar
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def request(self, method, path, timeout=None, **kwargs):
+        """Envia uma requisição; `timeout` aceita número (leitura) ou tupla (conexão, leitura)"""
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        elif not isinstance(timeout, tuple):
+            timeout = (self.connect_timeout, timeout)
+        return self.session.request(method, self.url(path), timeout=timeout, **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
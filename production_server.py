@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Modo de produção: vários workers (gunicorn) com estado compartilhado.
+
+Uso: python app.py --mode production --workers 4 [--worker-class aiohttp]
+
+Com mais de um worker, downloads, cache do catálogo e estado da conexão passam
+para o backend SQLite (data/state.db), visível a todos os processos. Os
+limites do agendador de chat são divididos entre os workers, com no mínimo
+um slot por worker: use no máximo OLLAMA_NUM_PARALLEL workers para que o
+limite por modelo valha no total.
+Disponível em Linux e macOS (o gunicorn não roda no Windows).
+"""
+
+import logging
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+
+WORKER_CLASSES = {
+    'gthread': 'gthread',                   # Flask, uma thread por requisição
+    'aiohttp': 'aiohttp.GunicornWebWorker'  # modo asyncio em cada worker
+}
+
+logger = logging.getLogger(__name__)
+
+class ProductionServer(BaseApplication):
+    """Servidor gunicorn embutido, configurado por código"""
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+def default_workers():
+    return max(2, multiprocessing.cpu_count())
+
+def run(gui, host='0.0.0.0', port=5000, workers=None, threads=32, worker_class='gthread'):
+    workers = workers or default_workers()
+    
+    if workers > 1 and isinstance(gui.shared_state, gui.state_backends.MemoryState):
+        gui.configure_shared_state('sqlite')
+        logger.info("🗄️  Estado compartilhado entre %d workers: %s", workers, gui.STATE_PATH)
+    
+    # Concessões e estado de conexão de uma execução anterior não valem mais
+    gui.reset_runtime_state()
+    
+    # Os limites de concorrência do agendador valem por processo
+    gui.configure_scheduler(workers)
+    
+    if worker_class == 'aiohttp':
+        import async_server
+        application = async_server.create_app(gui, threads)
+    else:
+        application = gui.app
+    
+    ProductionServer(application, {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'worker_class': WORKER_CLASSES[worker_class],
+        'threads': threads,
+        # Streams longos de chat não podem ser confundidos com worker travado
+        'timeout': 300,
+        'graceful_timeout': 30,
+        'keepalive': 5
+    }).run()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Residência de modelos na memória do Ollama.
+
+Mantém no estado compartilhado quais modelos estão carregados (/api/ps),
+pré-carrega o modelo escolhido na interface com um /api/generate vazio e
+`keep_alive`, e, com um orçamento de memória definido, descarrega os modelos
+usados há mais tempo (LRU) antes de carregar outro, seja por pré-carregamento
+ou pelo primeiro chat com um modelo frio. Com vários servidores o orçamento
+vale para cada um: só os modelos do servidor que vai receber o pedido contam.
+"""
+
+import logging
+import threading
+import time
+
+LOAD_TIMEOUT = 300    # tempo máximo para carregar os pesos de um modelo (s)
+
+logger = logging.getLogger(__name__)
+
+class ResidencyManager:
+    """Pré-carregamento, keep_alive e despejo LRU sob um orçamento de memória"""
+
+    def __init__(self, client, state, owner, memory_budget=0, keep_alive='30m', publish=None,
+                 is_busy=None):
+        self.client = client
+        self.state = state
+        self.owner = owner                  # função que identifica este processo
+        self.memory_budget = memory_budget  # bytes; 0 deixa o Ollama decidir
+        self.keep_alive = keep_alive
+        self.publish = publish              # publica ('residency', status) a cada mudança
+        self.is_busy = is_busy or (lambda model: False)
+        self._lock = threading.Lock()
+
+    def status(self):
+        """{'loaded': {modelo: info}, 'loading': [modelos]} do estado em cache"""
+        return {
+            'loaded': self.state.get('residency', 'loaded') or {},
+            'loading': sorted(self._loading())
+        }
+
+    def model_states(self, models):
+        """'warm', 'loading' ou 'cold' para cada modelo da lista"""
+        status = self.status()
+        return {
+            model: 'warm' if model in status['loaded'] else
+                   'loading' if model in status['loading'] else 'cold'
+            for model in models
+        }
+
+    def ensure_room(self, model):
+        """Libera memória antes de mandar um pedido a `model` (nada a fazer se ele já estiver carregado)"""
+        if not self.memory_budget or model in (self.state.get('residency', 'loaded') or {}):
+            return
+        with self._lock:
+            self._make_room(model)
+
+    def touch(self, model):
+        """Registra o uso do modelo (ordem do LRU)"""
+        self.state.set('residency_used', model, time.time())
+
+    def preload(self, model):
+        """Carrega o modelo em segundo plano; retorna o estado atual dele"""
+        self.touch(model)
+        current = self.model_states([model])[model]
+        if current != 'cold':
+            return current
+        if not self.state.claim('residency_loading', model, time.time()):
+            if model in self._loading():
+                return 'loading'  # Outro pedido (ou worker) já está carregando
+            # Marca deixada por um processo que morreu durante o carregamento
+            self.state.delete('residency_loading', model)
+            if not self.state.claim('residency_loading', model, time.time()):
+                return 'loading'
+        
+        self._publish()
+        thread = threading.Thread(target=self._load, args=(model,), name=f'preload-{model}')
+        thread.daemon = True
+        thread.start()
+        return 'loading'
+
+    def refresh(self):
+        """Atualiza a lista de modelos carregados a partir do /api/ps"""
+        response = self.client.get('/api/ps', timeout=5)
+        response.raise_for_status()
+        loaded = {
+            model['name']: {
+                'size': model.get('size', 0),
+                'size_vram': model.get('size_vram', 0),
+                'expires_at': model.get('expires_at'),
+                'backends': model.get('backends', [])
+            }
+            for model in response.json().get('models', [])
+        }
+        if loaded != (self.state.get('residency', 'loaded') or {}):
+            self.state.set('residency', 'loaded', loaded)
+            self._publish()
+        return loaded
+
+    def _load(self, model):
+        try:
+            with self._lock:
+                self._make_room(model)
+            logger.info("🔥 Pré-carregando %s...", model, extra={'model': model})
+            start_time = time.time()
+            response = self.client.post(
+                '/api/generate',
+                json={'model': model, 'keep_alive': self.keep_alive, 'stream': False},
+                timeout=(self.client.connect_timeout, LOAD_TIMEOUT)
+            )
+            elapsed = time.time() - start_time
+            if response.status_code == 200:
+                logger.info("✅ %s carregado em %.1fs", model, elapsed,
+                            extra={'model': model, 'load_seconds': round(elapsed, 3)})
+            else:
+                logger.error("❌ Falha ao carregar %s: %s", model, response.status_code, extra={'model': model})
+        except Exception as e:
+            logger.error("❌ Erro ao pré-carregar %s: %s", model, e, extra={'model': model})
+        finally:
+            self.state.delete('residency_loading', model)
+            try:
+                self.refresh()
+            except Exception:
+                self._publish()
+
+    def _make_room(self, model):
+        """Descarrega modelos ociosos do servidor de destino, do menos para o mais recente, até caber"""
+        if not self.memory_budget:
+            return
+        
+        loaded = self.refresh()
+        # O pool escolhe o servidor com o modelo (carregado, de preferência) e menos ocupado
+        backend = self.client.choose(model) if hasattr(self.client, 'choose') else None
+        on_backend = {name: info for name, info in loaded.items()
+                      if backend is None or not info['backends'] or backend in info['backends']}
+        if model in on_backend:
+            return
+        needed = self._model_size(model)
+        used = sum(info['size'] for info in on_backend.values())
+        last_used = self.state.items('residency_used')
+        
+        for name in sorted(on_backend, key=lambda name: last_used.get(name, 0)):
+            if used + needed <= self.memory_budget:
+                break
+            if self.is_busy(name):
+                continue
+            logger.info("🧊 Descarregando %s (orçamento de memória)", name, extra={'model': name, 'backend': backend})
+            unload = {'model': name, 'keep_alive': 0, 'stream': False}
+            if backend:
+                self.client.post('/api/generate', json=unload, backend=backend)
+            else:
+                self.client.post('/api/generate', json=unload)
+            used -= on_backend[name]['size']
+
+    def _model_size(self, model):
+        """Tamanho em disco do modelo, usado como estimativa da memória necessária"""
+        response = self.client.get('/api/tags', timeout=5)
+        for entry in response.json().get('models', []):
+            if entry['name'] == model:
+                return entry.get('size', 0)
+        return 0
+
+    def _loading(self):
+        """Modelos sendo carregados (ignora marcas mais antigas que LOAD_TIMEOUT)"""
+        now = time.time()
+        return [model for model, started_at in self.state.items('residency_loading').items()
+                if now - started_at < LOAD_TIMEOUT]
+
+    def _publish(self):
+        if self.publish:
+            self.publish('residency', self.status())
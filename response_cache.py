@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Cache de respostas determinísticas (LRU em memória + SQLite em disco)"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    """Guarda respostas completas de /api/chat para pedidos determinísticos.
+
+    A chave cobre o digest do modelo, a lista completa de mensagens (incluindo
+    o prompt de sistema) e as opções de amostragem. A camada em memória é um
+    LRU limitado em bytes; o SQLite mantém as entradas entre reinicializações.
+    """
+
+    def __init__(self, path, max_memory_bytes=32 * 1024 * 1024, max_disk_entries=10000):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Conexão temporária: conexões não podem atravessar o fork dos workers
+        conn = sqlite3.connect(path, timeout=10)
+        with conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, model TEXT, parts TEXT NOT NULL, stats TEXT NOT NULL, '
+                'created_at REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)')
+        conn.close()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def is_deterministic(options):
+        """Só pedidos com temperatura 0 ou seed fixa produzem sempre a mesma resposta"""
+        options = options or {}
+        return options.get('temperature') == 0 or options.get('seed') is not None
+
+    @staticmethod
+    def make_key(model, digest, messages, options):
+        material = json.dumps({
+            'model': model,
+            'digest': digest,
+            'messages': messages,
+            'options': options or {}
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Retorna {'parts': [...], 'stats': {...}} ou None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry
+        
+        conn = self._connect()
+        row = conn.execute('SELECT parts, stats FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with conn:
+            conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+        entry = {'parts': json.loads(row[0]), 'stats': json.loads(row[1])}
+        with self._lock:
+            self.hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, model, parts, stats):
+        entry = {'parts': list(parts), 'stats': dict(stats)}
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, model, parts, stats, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, json.dumps(entry['parts'], ensure_ascii=False),
+                 json.dumps(entry['stats']), now, now)
+            )
+        with self._lock:
+            self._remember(key, entry)
+            self._writes += 1
+            prune = self._writes % 100 == 0
+        if prune:
+            self._prune_disk()
+
+    def _remember(self, key, entry):
+        """Insere no LRU em memória respeitando o limite de bytes (chamar com o lock)"""
+        size = sum(len(part) for part in entry['parts']) * 4 + 256
+        if size > self.max_memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old['size']
+        entry['size'] = size
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted['size']
+
+    def _prune_disk(self):
+        """Remove as entradas menos acessadas acima do limite do disco"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+                (self.max_disk_entries,)
+            )
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes
+            }
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Agendador das requisições de chat enviadas ao Ollama.
+
+Cada modelo tem uma fila limitada, com sub-filas por usuário atendidas em
+rodízio (round-robin): quem manda dez mensagens não passa na frente de quem
+mandou uma. Há um limite de gerações simultâneas por modelo (os slots
+paralelos do Ollama) e um limite global; quando a fila de um modelo enche,
+o pedido é recusado na hora com uma estimativa de Retry-After.
+
+Pedidos em segundo plano (jobs em lote) têm prioridade menor: só ocupam slots
+ociosos, nunca enquanto houver chat esperando pelo mesmo modelo, e no máximo
+uma fração dos slots, para o próximo chat não esperar uma geração em lote.
+
+Funciona com threads (Flask/gunicorn) e com asyncio: o ticket expõe `wait()`
+bloqueante e `on_grant()` para acordar um event loop.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+class SchedulerFull(Exception):
+    """Fila do modelo cheia; `retry_after` em segundos"""
+
+    def __init__(self, model, retry_after):
+        super().__init__(f"Fila cheia para o modelo {model}")
+        self.model = model
+        self.retry_after = retry_after
+
+class Ticket:
+    """Lugar de uma requisição na fila (ou num slot, depois de liberada)"""
+
+    def __init__(self, model, user, background=False):
+        self.model = model
+        self.user = user
+        self.background = background
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.time()
+        self.started_at = None
+        self._event = threading.Event()
+        self._callbacks = []
+
+    def wait(self, timeout=None):
+        """Espera o slot; retorna True quando a geração pode começar"""
+        return self._event.wait(timeout)
+
+class ModelQueue:
+    def __init__(self):
+        self.active = 0
+        self.users = OrderedDict()   # usuário -> deque de tickets (ordem do rodízio)
+        self.queued = 0
+        self.avg_duration = None     # média móvel da duração de uma geração (s)
+        self.background = deque()   # tickets em segundo plano, em ordem de chegada
+        self.background_active = 0
+
+class ChatScheduler:
+    """Limites de concorrência por modelo e global, com rodízio entre usuários"""
+
+    def __init__(self, max_concurrent=8, per_model=4, max_queue=32, on_release=None, background_share=0.5):
+        self.max_concurrent = max_concurrent
+        self.per_model = per_model
+        self.max_queue = max_queue
+        self.on_release = on_release  # chamado com o ticket, fora do lock (métricas)
+        self.background_share = background_share  # fração máxima dos slots para o segundo plano
+        self.active = 0
+        self.background_active = 0
+        self._models = OrderedDict()  # rodízio entre modelos com fila
+        self._lock = threading.Lock()
+
+    def submit(self, model, user, background=False):
+        """Reserva um slot ou entra na fila; levanta SchedulerFull se não couber.
+
+        Tickets `background` não têm limite de fila (quem os cria já é um
+        pool limitado) e esperam até haver capacidade ociosa.
+        """
+        with self._lock:
+            queue = self._models.setdefault(model, ModelQueue())
+            ticket = Ticket(model, user, background)
+            
+            if background:
+                if not queue.background and self._background_slot(queue):
+                    self._grant(queue, ticket)
+                else:
+                    queue.background.append(ticket)
+                return ticket
+            
+            if not queue.queued and self._has_slot(queue):
+                self._grant(queue, ticket)
+                return ticket
+            if queue.queued >= self.max_queue:
+                raise SchedulerFull(model, self._retry_after(queue))
+            
+            queue.users.setdefault(user, deque()).append(ticket)
+            queue.queued += 1
+            return ticket
+
+    def release(self, ticket):
+        """Libera o slot (ou retira da fila); pode ser chamado mais de uma vez"""
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            queue = self._models[ticket.model]
+            
+            if not ticket.granted and ticket.background:
+                if ticket in queue.background:
+                    queue.background.remove(ticket)
+            elif not ticket.granted:
+                # Desistiu na fila (cliente desconectou ou tempo esgotado)
+                pending = queue.users.get(ticket.user)
+                if pending and ticket in pending:
+                    pending.remove(ticket)
+                    queue.queued -= 1
+                    if not pending:
+                        del queue.users[ticket.user]
+                    # Tickets em segundo plano podiam estar esperando só por este
+                    self._dispatch()
+            else:
+                queue.active -= 1
+                self.active -= 1
+                if ticket.background:
+                    queue.background_active -= 1
+                    self.background_active -= 1
+                duration = time.time() - ticket.started_at
+                queue.avg_duration = duration if queue.avg_duration is None else 0.8 * queue.avg_duration + 0.2 * duration
+                self._dispatch()
+        
+        if self.on_release:
+            self.on_release(ticket)
+
+    def on_grant(self, ticket, callback):
+        """Chama `callback()` (de qualquer thread) quando o ticket receber o slot"""
+        with self._lock:
+            if not ticket.granted:
+                ticket._callbacks.append(callback)
+                return
+        callback()
+
+    def position(self, ticket):
+        """Posição na fila do modelo (1 = próximo), seguindo a ordem do rodízio"""
+        with self._lock:
+            if ticket.granted or ticket.released:
+                return 0
+            queue = self._models[ticket.model]
+            pending = queue.users.get(ticket.user)
+            if not pending or ticket not in pending:
+                return 0
+            
+            # Rodadas anteriores à deste ticket contam todos os usuários; na
+            # rodada dele, só os que estão antes no rodízio
+            index = pending.index(ticket)
+            ahead = 0
+            before = True
+            for user, tickets in queue.users.items():
+                if user == ticket.user:
+                    before = False
+                    ahead += index
+                    continue
+                ahead += min(len(tickets), index)
+                if before and len(tickets) > index:
+                    ahead += 1
+            return ahead + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'max_concurrent': self.max_concurrent,
+                'background': self.background_active,
+                'models': {
+                    model: {
+                        'active': queue.active,
+                        'queued': queue.queued,
+                        'background_active': queue.background_active,
+                        'background_queued': len(queue.background)
+                    }
+                    for model, queue in self._models.items() if queue.active or queue.queued or queue.background
+                }
+            }
+
+    def _has_slot(self, queue):
+        return self.active < self.max_concurrent and queue.active < self.per_model
+
+    def _background_slot(self, queue):
+        """Slot ocioso para o segundo plano: sem chat esperando e dentro da fração reservada"""
+        if any(other.queued for other in self._models.values()):
+            return False
+        return (self._has_slot(queue)
+                and queue.background_active < max(1, int(self.per_model * self.background_share))
+                and self.background_active < max(1, int(self.max_concurrent * self.background_share)))
+
+    def _grant(self, queue, ticket):
+        queue.active += 1
+        self.active += 1
+        if ticket.background:
+            queue.background_active += 1
+            self.background_active += 1
+        ticket.granted = True
+        ticket.started_at = time.time()
+        ticket._event.set()
+        for callback in ticket._callbacks:
+            callback()
+        ticket._callbacks = []
+
+    def _dispatch(self):
+        """Entrega os slots livres, alternando entre modelos e entre usuários"""
+        progress = True
+        while progress and self.active < self.max_concurrent:
+            progress = False
+            for model in list(self._models):
+                queue = self._models[model]
+                if not queue.queued or not self._has_slot(queue):
+                    continue
+                
+                user, pending = next(iter(queue.users.items()))
+                ticket = pending.popleft()
+                queue.queued -= 1
+                if pending:
+                    queue.users.move_to_end(user)
+                else:
+                    del queue.users[user]
+                self._grant(queue, ticket)
+                
+                # O modelo atendido vai para o fim do rodízio
+                self._models.move_to_end(model)
+                progress = True
+                break
+        
+        # Sobrou capacidade: segundo plano, na ordem de chegada de cada modelo
+        for queue in list(self._models.values()):
+            while queue.background and self._background_slot(queue):
+                self._grant(queue, queue.background.popleft())
+
+    def _retry_after(self, queue):
+        average = queue.avg_duration or 10
+        return max(1, min(60, math.ceil(average * queue.queued / self.per_model)))
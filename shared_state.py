@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Estado compartilhado entre workers (downloads, catálogo, conexão).
+
+O backend em memória é o padrão para um único processo. Com vários workers,
+o backend SQLite guarda o mesmo estado num arquivo local, visível a todos.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class MemoryState:
+    """Dicionários em memória, protegidos por lock (um único processo)"""
+
+    shared = False
+
+    def __init__(self):
+        self._data = {}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            value = self._data.get(namespace, {}).get(key)
+        return json.loads(value) if value is not None else default
+
+    def set(self, namespace, key, value):
+        # Serializa para que quem lê nunca receba um objeto compartilhado
+        encoded = json.dumps(value)
+        with self._lock:
+            self._data.setdefault(namespace, {})[key] = encoded
+
+    def claim(self, namespace, key, value):
+        """Grava `value` só se a chave não existir; retorna True se gravou"""
+        encoded = json.dumps(value)
+        with self._lock:
+            entries = self._data.setdefault(namespace, {})
+            if key in entries:
+                return False
+            entries[key] = encoded
+            return True
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace):
+        with self._lock:
+            entries = dict(self._data.get(namespace, {}))
+        return {key: json.loads(value) for key, value in entries.items()}
+
+    def acquire_lease(self, name, owner, ttl):
+        """Obtém ou renova uma concessão exclusiva por `ttl` segundos"""
+        now = time.time()
+        with self._lock:
+            holder, expires_at = self._leases.get(name, (None, 0))
+            if holder not in (None, owner) and expires_at > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            if self._leases.get(name, (None, 0))[0] == owner:
+                del self._leases[name]
+
+    def clear_runtime(self, namespaces):
+        """Descarta todas as concessões e os namespaces indicados (início do servidor)"""
+        with self._lock:
+            self._leases.clear()
+            for namespace in namespaces:
+                self._data.pop(namespace, None)
+
+class SQLiteState:
+    """Mesmo contrato do MemoryState, persistido num arquivo SQLite (WAL)"""
+
+    shared = True           # visível a todos os processos
+    EVENT_RETENTION = 1000  # eventos mantidos no log compartilhado
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Conexão temporária: conexões não podem atravessar o fork dos workers
+        conn = sqlite3.connect(path, timeout=10)
+        with conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS state ('
+                'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (namespace, key))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS leases ('
+                'name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT NOT NULL, data TEXT NOT NULL, '
+                'created_at REAL NOT NULL)'
+            )
+        conn.close()
+        self._appended = 0
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, namespace, key, default=None):
+        row = self._connect().execute(
+            'SELECT value FROM state WHERE namespace = ? AND key = ?', (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value), time.time())
+        )
+
+    def claim(self, namespace, key, value):
+        cursor = self._connect().execute(
+            'INSERT OR IGNORE INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)',
+            (namespace, key, json.dumps(value), time.time())
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, namespace, key):
+        self._connect().execute(
+            'DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key)
+        )
+
+    def items(self, namespace):
+        rows = self._connect().execute(
+            'SELECT key, value FROM state WHERE namespace = ?', (namespace,)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def acquire_lease(self, name, owner, ttl):
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT owner, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                conn.execute('COMMIT')
+                return False
+            conn.execute(
+                'INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)',
+                (name, owner, now + ttl)
+            )
+            conn.execute('COMMIT')
+            return True
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def release_lease(self, name, owner):
+        self._connect().execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, owner))
+
+    def clear_runtime(self, namespaces):
+        """Descarta concessões e estado de processos de uma execução anterior.
+
+        Chamado uma vez, antes de iniciar os workers: concessões ainda válidas
+        de processos que já morreram bloqueariam o monitor de conexão e os
+        downloads até expirarem.
+        """
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM leases')
+            conn.executemany('DELETE FROM state WHERE namespace = ?', [(namespace,) for namespace in namespaces])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def append_event(self, event_type, data):
+        """Acrescenta um evento ao log lido por todos os workers"""
+        conn = self._connect()
+        cursor = conn.execute(
+            'INSERT INTO events (type, data, created_at) VALUES (?, ?, ?)',
+            (event_type, json.dumps(data), time.time())
+        )
+        self._appended += 1
+        if self._appended % 100 == 0:
+            conn.execute('DELETE FROM events WHERE id <= ?', (cursor.lastrowid - self.EVENT_RETENTION,))
+        return cursor.lastrowid
+
+    def last_event_id(self):
+        row = self._connect().execute('SELECT MAX(id) FROM events').fetchone()
+        return row[0] or 0
+
+    def events_since(self, last_id):
+        rows = self._connect().execute(
+            'SELECT id, type, data FROM events WHERE id > ? ORDER BY id', (last_id,)
+        ).fetchall()
+        return [{'id': row[0], 'type': row[1], 'data': json.loads(row[2])} for row in rows]
+
+def create_backend(kind, path=None):
+    """Cria o backend: 'memory' (padrão) ou 'sqlite'"""
+    if kind == 'sqlite':
+        return SQLiteState(path)
+    if kind == 'memory':
+        return MemoryState()
+    raise ValueError(f"Backend de estado desconhecido: {kind}")
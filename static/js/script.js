@@ -1,404 +1,1031 @@
-// Configurações e estado da aplicação
-class OllamaChatApp {
+// Mensagens mantidas no DOM ao mesmo tempo; as demais ficam guardadas fora dele
+const CHAT_WINDOW_SIZE = 120;
+const CHAT_WINDOW_STEP = 40;       // mensagens recolocadas de cada vez ao rolar
+const MESSAGES_PAGE_SIZE = 50;     // mensagens por página do histórico no servidor
+const SCROLL_LOAD_MARGIN = 300;    // distância (px) da borda que dispara o carregamento
+const SCROLL_STICK_MARGIN = 40;    // abaixo disso a lista acompanha o fim da conversa
+
+// Leitor de Server-Sent Events sobre fetch: um evento pode chegar partido em
+// qualquer ponto (inclusive no meio de um caractere UTF-8) ou junto com outros
+class SSEParser {
+    constructor(onEvent) {
+        this.onEvent = onEvent;   // recebe { type, data, id }
+        this.decoder = new TextDecoder();
+        this.buffer = '';
+        this.skipLineFeed = false;
+        this.type = '';
+        this.data = [];
+        this.lastEventId = null;
+    }
+
+    push(chunk) {
+        let text = typeof chunk === 'string' ? chunk : this.decoder.decode(chunk, { stream: true });
+        // Um '\r' no fim do pedaço anterior já encerrou a linha: o '\n' seguinte é o resto do '\r\n'
+        if (this.skipLineFeed && text) {
+            if (text.startsWith('\n')) text = text.slice(1);
+            this.skipLineFeed = false;
+        }
+        this.buffer += text;
+
+        const lineEnd = /\r\n|\r|\n/g;
+        let start = 0;
+        let match;
+        while ((match = lineEnd.exec(this.buffer)) !== null) {
+            this.processLine(this.buffer.slice(start, match.index));
+            start = lineEnd.lastIndex;
+            this.skipLineFeed = match[0] === '\r' && start === this.buffer.length;
+        }
+        this.buffer = this.buffer.slice(start);
+    }
+
+    processLine(line) {
+        if (line === '') {
+            this.dispatch();
+            return;
+        }
+        if (line.startsWith(':')) return; // Comentário (keep-alive)
+
+        const colon = line.indexOf(':');
+        const field = colon === -1 ? line : line.slice(0, colon);
+        let value = colon === -1 ? '' : line.slice(colon + 1);
+        if (value.startsWith(' ')) value = value.slice(1);
+
+        if (field === 'data') this.data.push(value);
+        else if (field === 'event') this.type = value;
+        else if (field === 'id') this.lastEventId = value;
+    }
+
+    dispatch() {
+        if (this.data.length) {
+            this.onEvent({ type: this.type || 'message', data: this.data.join('\n'), id: this.lastEventId });
+        }
+        this.type = '';
+        this.data = [];
+    }
+}
+
+// Texto de uma resposta em streaming: os tokens se acumulam e entram no DOM
+// uma vez por quadro, acrescentados ao mesmo nó de texto (sem reescrever a
+// resposta inteira a cada token)
+class StreamingText {
+    constructor(element, onFlush) {
+        this.element = element;
+        this.onFlush = onFlush;   // chamado após cada escrita (ex.: acompanhar o fim da lista)
+        this.node = null;
+        this.text = '';
+        this.pending = '';
+        this.frame = null;
+    }
+
+    append(text) {
+        if (!text) return;
+        this.text += text;
+        this.pending += text;
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => {
+                this.frame = null;
+                this.flush();
+            });
+        }
+    }
+
+    setStatus(status) {
+        // Aviso provisório (posição na fila), substituído pelo primeiro token
+        if (this.text) return;
+        this.element.textContent = status;
+        this.node = null;
+        if (this.onFlush) this.onFlush();
+    }
+
+    flush() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        if (!this.pending) return;
+        if (!this.node) {
+            this.node = document.createTextNode('');
+            this.element.textContent = '';
+            this.element.appendChild(this.node);
+        }
+        this.node.appendData(this.pending);
+        this.pending = '';
+        if (this.onFlush) this.onFlush();
+    }
+}
+
+// Lista de mensagens virtualizada: só uma janela de até CHAT_WINDOW_SIZE
+// mensagens fica no DOM. As que saem da janela são guardadas (com o estado
+// que tiverem) e voltam ao rolar; ao chegar na mais antiga conhecida,
+// `loadOlder` traz a página anterior do servidor.
+class ChatList {
+    constructor(container, loadOlder) {
+        this.container = container;
+        this.loadOlder = loadOlder; // async () => { elements, more }
+        this.items = [];            // elemento de cada mensagem, da mais antiga para a mais nova
+        this.first = 0;             // índice da primeira mensagem no DOM
+        this.last = 0;              // índice seguinte à última mensagem no DOM
+        this.hasOlder = false;      // o servidor tem mensagens anteriores a items[0]
+        this.loading = false;
+        this.stuck = true;          // acompanhando o fim da conversa
+        this.version = 0;           // muda a cada reset (descarta páginas de outra conversa)
+        this.checkFrame = null;
+        container.addEventListener('scroll', () => this.scheduleCheck(), { passive: true });
+    }
+
+    reset(hasOlder = false) {
+        this.items = [];
+        this.first = 0;
+        this.last = 0;
+        this.hasOlder = hasOlder;
+        this.loading = false;
+        this.stuck = true;
+        this.version++;
+        this.container.replaceChildren();
+    }
+
+    append(element) {
+        this.items.push(element);
+        // Fora da janela (usuário lendo mensagens antigas) ela entra ao rolar até o fim
+        if (this.last !== this.items.length - 1) return;
+        this.container.appendChild(element);
+        this.last++;
+        if (this.stuck) this.trimTop();
+    }
+
+    follow() {
+        // Uma única escrita de scrollTop (e um layout) por quadro de streaming
+        if (this.stuck) this.container.scrollTop = this.container.scrollHeight;
+    }
+
+    scrollToEnd() {
+        if (this.last < this.items.length) {
+            this.first = Math.max(0, this.items.length - CHAT_WINDOW_SIZE);
+            this.last = this.items.length;
+            this.container.replaceChildren(...this.items.slice(this.first, this.last).map(this.restored));
+        }
+        this.stuck = true;
+        this.container.scrollTop = this.container.scrollHeight;
+        this.scheduleCheck();
+    }
+
+    scheduleCheck() {
+        if (this.checkFrame !== null) return;
+        this.checkFrame = requestAnimationFrame(() => {
+            this.checkFrame = null;
+            this.check();
+        });
+    }
+
+    check() {
+        const { scrollTop, scrollHeight, clientHeight } = this.container;
+        if (!clientHeight) return; // Lista oculta (loja de modelos)
+        const bottomGap = scrollHeight - scrollTop - clientHeight;
+        this.stuck = bottomGap < SCROLL_STICK_MARGIN;
+
+        if (scrollTop < SCROLL_LOAD_MARGIN) {
+            this.showOlder();
+        } else if (bottomGap < SCROLL_LOAD_MARGIN && this.last < this.items.length) {
+            this.showNewer();
+        } else if (this.stuck) {
+            this.trimTop();
+        }
+    }
+
+    async showOlder() {
+        if (this.first === 0) {
+            if (!this.hasOlder || this.loading || !this.loadOlder) return;
+            const version = this.version;
+            this.loading = true;
+            let page;
+            try {
+                page = await this.loadOlder();
+            } catch (error) {
+                console.error('❌ Erro ao carregar mensagens antigas:', error);
+            }
+            if (version !== this.version) return;
+            this.loading = false;
+            if (!page) return;
+            this.hasOlder = page.more;
+            if (!page.elements.length) return;
+            this.items.unshift(...page.elements);
+            this.first += page.elements.length;
+            this.last += page.elements.length;
+        }
+
+        const start = Math.max(0, this.first - CHAT_WINDOW_STEP);
+        const elements = this.items.slice(start, this.first).map(this.restored);
+        this.keepPosition(() => this.container.prepend(...elements));
+        this.first = start;
+        this.trimBottom();
+        this.scheduleCheck();
+    }
+
+    showNewer() {
+        const end = Math.min(this.items.length, this.last + CHAT_WINDOW_STEP);
+        this.container.append(...this.items.slice(this.last, end).map(this.restored));
+        this.last = end;
+        this.trimTop();
+        this.scheduleCheck();
+    }
+
+    trimTop() {
+        if (this.last - this.first <= CHAT_WINDOW_SIZE) return;
+        this.keepPosition(() => {
+            while (this.last - this.first > CHAT_WINDOW_SIZE) {
+                this.items[this.first].remove();
+                this.first++;
+            }
+        });
+    }
+
+    trimBottom() {
+        while (this.last - this.first > CHAT_WINDOW_SIZE) {
+            this.last--;
+            this.items[this.last].remove();
+        }
+    }
+
+    keepPosition(change) {
+        // Mantém a distância até o fim: o conteúdo visível não pula quando
+        // mensagens entram ou saem acima dele
+        const container = this.container;
+        const fromBottom = container.scrollHeight - container.scrollTop;
+        change();
+        container.scrollTop = container.scrollHeight - fromBottom;
+    }
+
+    restored(element) {
+        // Sem a animação de entrada ao voltar para a janela
+        element.classList.add('restored');
+        return element;
+    }
+}
+
+// Classe principal do OllamaGUI
+class OllamaGUI {
     constructor() {
-        this.currentModel = 'deepseek-coder:latest';
+        this.baseUrl = window.location.origin;
+        this.currentModel = '';
         this.currentLanguage = 'pt';
-        this.conversationHistory = [];
+        this.currentTheme = 'auto';
         this.isGenerating = false;
-        this.isLoadingModel = false;
-        this.baseUrl = window.location.origin;
+        this.generationId = null; // Id da geração em andamento (X-Generation-Id), para o botão de parar
+        this.chatAbort = null;
+        this.compareMode = false; // Envia o prompt a vários modelos (/api/compare)
+        this.compareModels = new Set();
+        this.useDocuments = false; // Respostas com trechos dos documentos enviados (RAG)
+        this.conversationHistory = [];
+        this.conversationId = null;
+        this.messagesCursor = null; // `before` da próxima página de mensagens antigas
+        this.conversations = [];
         this.translations = {};
-        
+        this.currentView = 'chat'; // 'chat' or 'store'
+        this.downloadingModels = new Set();
+        this.downloads = {}; // Último estado de cada download recebido por /api/events
+        this.installedModels = [];
+        this.events = null;
+        this.residency = {}; // modelo -> 'warm' | 'loading' | 'cold'
+
         this.initializeElements();
+        this.chatList = new ChatList(this.elements.chatContainer, () => this.loadOlderMessages());
         this.setupEventListeners();
         this.loadSettings();
-        this.checkConnection();
-        this.loadModels();
-        this.loadTranslations();
+        this.init();
     }
-    
+
     initializeElements() {
-        // Elementos DOM
         this.elements = {
-            chatContainer: document.getElementById('chatContainer'),
-            textInput: document.getElementById('textInput'),
-            sendBtn: document.getElementById('sendBtn'),
+            // Sidebar
+            appName: document.getElementById('appName'),
             newChatBtn: document.getElementById('newChatBtn'),
-            clearChatBtn: document.getElementById('clearChatBtn'),
-            themeToggle: document.getElementById('themeToggle'),
-            themeIcon: document.getElementById('themeIcon'),
-            typingIndicator: document.getElementById('typingIndicator'),
+            newChatText: document.getElementById('newChatText'),
+            modelStoreBtn: document.getElementById('modelStoreBtn'),
+            downloadModelText: document.getElementById('downloadModelText'),
+            conversationHistory: document.getElementById('conversationHistory'),
+            statusDot: document.getElementById('statusDot'),
+            connectionStatus: document.getElementById('connectionStatus'),
             mobileMenuBtn: document.getElementById('mobileMenuBtn'),
-            modelSelect: document.getElementById('modelSelect'),
+
+            // Top Bar
             languageSelect: document.getElementById('languageSelect'),
-            currentModelBadge: document.getElementById('currentModelBadge'),
-            connectionStatus: document.getElementById('connectionStatus'),
-            connectionMessage: document.getElementById('connectionMessage'),
-            settingsModal: document.getElementById('settingsModal'),
+            modelSelect: document.getElementById('modelSelect'),
+            themeSelect: document.getElementById('themeSelect'),
+            exportBtn: document.getElementById('exportBtn'),
             settingsBtn: document.getElementById('settingsBtn'),
-            closeSettings: document.getElementById('closeSettings'),
+
+            // Chat
+            chatContainer: document.getElementById('chatContainer'),
+            welcomeTitle: document.getElementById('welcomeTitle'),
+            welcomeText: document.getElementById('welcomeText'),
+            welcomeStatusDot: document.getElementById('welcomeStatusDot'),
+            welcomeStatus: document.getElementById('welcomeStatus'),
+
+            // Input
+            textInput: document.getElementById('textInput'),
+            sendBtn: document.getElementById('sendBtn'),
+            clearBtn: document.getElementById('clearBtn'),
+            clearText: document.getElementById('clearText'),
+            historyBtn: document.getElementById('historyBtn'),
+            compareBtn: document.getElementById('compareBtn'),
+            comparePicker: document.getElementById('comparePicker'),
+            attachBtn: document.getElementById('attachBtn'),
+            documentInput: document.getElementById('documentInput'),
+            documentsBtn: document.getElementById('documentsBtn'),
+            typingIndicator: document.getElementById('typingIndicator'),
+            typingText: document.getElementById('typingText'),
+
+            // Model Store
+            modelStore: document.getElementById('modelStore'),
+            storeTitle: document.getElementById('storeTitle'),
+            modelSearch: document.getElementById('modelSearch'),
+            searchBtn: document.getElementById('searchBtn'),
+            modelsContent: document.getElementById('modelsContent'),
+
+            // Progress
+            progressModal: document.getElementById('progressModal'),
             progressBar: document.getElementById('progressBar'),
             progressText: document.getElementById('progressText'),
-            progressModal: document.getElementById('progressModal')
+            progressTitle: document.getElementById('progressTitle')
         };
-        
-        console.log('Elementos inicializados:', this.elements);
     }
-    
+
     setupEventListeners() {
-        // Eventos de input
-        this.elements.textInput.addEventListener('input', this.handleInput.bind(this));
-        this.elements.textInput.addEventListener('keydown', this.handleKeydown.bind(this));
-        
-        // Eventos de botões
-        this.elements.sendBtn.addEventListener('click', this.sendMessage.bind(this));
-        this.elements.newChatBtn.addEventListener('click', this.newConversation.bind(this));
-        this.elements.clearChatBtn.addEventListener('click', this.clearConversation.bind(this));
-        this.elements.themeToggle.addEventListener('click', this.toggleTheme.bind(this));
-        this.elements.mobileMenuBtn.addEventListener('click', this.toggleMobileMenu.bind(this));
-        
-        // Eventos do modal
-        this.elements.settingsBtn.addEventListener('click', () => this.toggleModal(true));
-        this.elements.closeSettings.addEventListener('click', () => this.toggleModal(false));
-        
-        // Evento de seleção de modelo
-        this.elements.modelSelect.addEventListener('change', this.changeModel.bind(this));
-        this.elements.languageSelect.addEventListener('change', this.changeLanguage.bind(this));
-        
-        // Fechar modal ao clicar fora
-        this.elements.settingsModal.addEventListener('click', (e) => {
-            if (e.target === this.elements.settingsModal) {
-                this.toggleModal(false);
-            }
+        // Eventos do input
+        this.elements.textInput.addEventListener('input', () => this.handleInput());
+        this.elements.textInput.addEventListener('keydown', (e) => this.handleKeydown(e));
+
+        // Eventos dos botões
+        this.elements.sendBtn.addEventListener('click', () => {
+            // Durante a geração o botão de enviar vira o de parar
+            if (this.isGenerating) this.stopGeneration();
+            else this.sendMessage();
         });
-        
-        this.elements.progressModal.addEventListener('click', (e) => {
-            if (e.target === this.elements.progressModal) {
-                this.toggleProgressModal(false);
-            }
+        this.elements.newChatBtn.addEventListener('click', () => this.newConversation());
+        this.elements.clearBtn.addEventListener('click', () => this.clearConversation());
+        this.elements.compareBtn.addEventListener('click', () => this.toggleCompareMode());
+        this.elements.attachBtn.addEventListener('click', () => this.elements.documentInput.click());
+        this.elements.documentInput.addEventListener('change', () => this.uploadDocument());
+        this.elements.documentsBtn.addEventListener('click', () => this.setUseDocuments(!this.useDocuments));
+        this.elements.exportBtn.addEventListener('click', () => this.exportConversation());
+        this.elements.mobileMenuBtn.addEventListener('click', () => this.toggleMobileMenu());
+        this.elements.modelStoreBtn.addEventListener('click', () => this.showModelStore());
+        this.elements.searchBtn.addEventListener('click', () => this.searchModels());
+        this.elements.modelSearch.addEventListener('input', () => {
+            // Busca enquanto digita, sem disparar uma requisição por tecla
+            clearTimeout(this.searchTimer);
+            this.searchTimer = setTimeout(() => this.searchModels(), 200);
         });
+        this.elements.modelSearch.addEventListener('keydown', (e) => {
+            if (e.key === 'Enter') this.searchModels();
+        });
+
+        // Eventos dos selects
+        this.elements.languageSelect.addEventListener('change', () => this.changeLanguage());
+        this.elements.modelSelect.addEventListener('change', () => this.changeModel());
+        this.elements.themeSelect.addEventListener('change', () => this.changeTheme());
+
+        // Eventos das categorias
+        document.querySelectorAll('.category-tab').forEach(tab => {
+            tab.addEventListener('click', (e) => {
+                document.querySelectorAll('.category-tab').forEach(t => t.classList.remove('active'));
+                e.target.classList.add('active');
+                this.filterModelsByCategory(e.target.dataset.category);
+            });
+        });
+    }
+
+    async init() {
+        console.log('🚀 Iniciando OllamaGUI...');
+        await this.loadTranslations();
+        await this.checkConnection();
+        await this.loadModels();
+        this.subscribeEvents();
+        this.preloadModel(this.currentModel);
+        this.loadConversations();
+        this.applyTheme();
+        this.updateStatus('✅ Pronto para conversar', true);
     }
-    
+
     async loadTranslations() {
         try {
-            console.log('Carregando traduções para:', this.currentLanguage);
             const response = await fetch(`${this.baseUrl}/api/translations/${this.currentLanguage}`);
-            
             if (response.ok) {
                 const data = await response.json();
                 this.translations = data.translations;
-                console.log('Traduções carregadas:', this.translations);
-                this.updateUITexts();
-            } else {
-                console.error('Erro ao carregar traduções:', response.status);
+                this.updateInterfaceTexts();
             }
         } catch (error) {
-            console.error('Erro ao carregar traduções:', error);
+            console.error('❌ Erro ao carregar traduções:', error);
         }
     }
-    
-    updateUITexts() {
-        console.log('Atualizando textos da interface...');
-        
-        // Atualiza textos da interface
-        if (this.elements.newChatBtn) {
-            this.elements.newChatBtn.innerHTML = `<span>+</span> ${this.translations.new_chat || 'Nova conversa'}`;
-        }
-        
-        if (this.elements.textInput) {
-            this.elements.textInput.placeholder = this.translations.placeholder || 'Digite sua mensagem...';
-        }
-        
-        if (this.elements.clearChatBtn) {
-            this.elements.clearChatBtn.textContent = this.translations.clear_chat || '🗑️ Limpar Chat';
-        }
-        
-        if (this.elements.typingIndicator) {
-            const span = this.elements.typingIndicator.querySelector('span');
-            if (span) {
-                span.textContent = this.translations.typing || 'DeepSeek está digitando';
+
+    updateInterfaceTexts() {
+        const t = this.translations;
+
+        // Atualiza todos os textos
+        document.querySelectorAll('[id]').forEach(element => {
+            const key = element.id.replace(/([A-Z])/g, '_$1').toLowerCase();
+            if (t[key] && element.textContent !== undefined) {
+                element.textContent = t[key];
             }
+        });
+
+        // Placeholders
+        if (this.elements.textInput) {
+            this.elements.textInput.placeholder = t.type_message || 'Digite sua mensagem...';
         }
-        
-        // Atualiza mensagem de boas-vindas
-        const welcomeMessage = this.elements.chatContainer.querySelector('.welcome-message');
-        if (welcomeMessage) {
-            const title = welcomeMessage.querySelector('h2');
-            const message = welcomeMessage.querySelector('p:first-of-type');
-            
-            if (title) title.textContent = this.translations.welcome_title || 'Bem-vindo ao DeepSeek Ollama';
-            if (message) message.textContent = this.translations.welcome_message || 'Comece uma conversa digitando uma mensagem abaixo.';
-        }
-        
-        // Atualiza select de modelos
-        if (this.elements.modelSelect.querySelector('option[value=""]')) {
-            this.elements.modelSelect.querySelector('option[value=""]').textContent = 
-                this.translations.select_model || 'Selecionar modelo';
-        }
-    }
-    
-    async changeLanguage() {
-        const newLanguage = this.elements.languageSelect.value;
-        
-        if (newLanguage && newLanguage !== this.currentLanguage) {
-            console.log('Alterando idioma para:', newLanguage);
-            
-            try {
-                const response = await fetch(`${this.baseUrl}/api/language`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ language: newLanguage })
-                });
-                
-                const data = await response.json();
-                
-                if (response.ok) {
-                    this.currentLanguage = newLanguage;
-                    this.translations = data.translations;
-                    localStorage.setItem('language', newLanguage);
-                    this.updateUITexts();
-                    this.addSystemMessage(`🌐 Idioma alterado para: ${this.getLanguageName(newLanguage)}`);
-                    console.log('Idioma alterado com sucesso');
-                } else {
-                    throw new Error(data.error || 'Erro desconhecido');
-                }
-            } catch (error) {
-                console.error('Erro ao alterar idioma:', error);
-                this.addSystemMessage(`❌ Erro ao alterar idioma: ${error.message}`);
-                this.elements.languageSelect.value = this.currentLanguage;
-            }
+        if (this.elements.modelSearch) {
+            this.elements.modelSearch.placeholder = t.search_models || 'Buscar modelos...';
         }
     }
-    
-    getLanguageName(code) {
-        const names = {
-            'pt': 'Português',
-            'en': 'English',
-            'es': 'Español', 
-            'fr': 'Français',
-            'de': 'Deutsch'
-        };
-        return names[code] || code;
-    }
-    
+
     async checkConnection() {
         try {
-            console.log('Verificando conexão...');
             const response = await fetch(`${this.baseUrl}/api/health`);
             const data = await response.json();
-            
-            if (data.ollama === 'connected') {
-                this.updateConnectionStatus(true, this.translations.connected || 'Conectado');
-                if (this.elements.connectionMessage) {
-                    this.elements.connectionMessage.textContent = '✅ ' + (this.translations.connected || 'Conectado');
-                    this.elements.connectionMessage.style.color = '#10b981';
-                }
-                console.log('✅ Conectado ao Ollama');
-            } else {
-                this.updateConnectionStatus(false, this.translations.disconnected || 'Desconectado');
-                if (this.elements.connectionMessage) {
-                    this.elements.connectionMessage.textContent = '❌ ' + (this.translations.disconnected || 'Desconectado');
-                    this.elements.connectionMessage.style.color = '#ef4444';
-                }
-                console.log('❌ Ollama desconectado');
-            }
+
+            const isConnected = data.ollama === 'connected';
+            this.updateStatus(isConnected ? 
+                this.translations.connected || 'Conectado' : 
+                this.translations.disconnected || 'Desconectado', 
+                isConnected
+            );
+
+            return isConnected;
         } catch (error) {
-            this.updateConnectionStatus(false, 'Erro de conexão');
-            if (this.elements.connectionMessage) {
-                this.elements.connectionMessage.textContent = '❌ Erro ao conectar com o servidor.';
-                this.elements.connectionMessage.style.color = '#ef4444';
+            this.updateStatus('Erro de conexão', false);
+            return false;
+        }
+    }
+
+    subscribeEvents() {
+        // Um único canal por aba; o EventSource reconecta sozinho e o
+        // servidor reenvia o estado atual a cada conexão
+        this.events = new EventSource(`${this.baseUrl}/api/events`);
+
+        this.events.addEventListener('connection', (event) => {
+            const data = JSON.parse(event.data);
+            const isConnected = data.ollama === 'connected';
+            this.updateStatus(isConnected ? 
+                this.translations.connected || 'Conectado' : 
+                this.translations.disconnected || 'Desconectado', 
+                isConnected
+            );
+        });
+
+        this.events.addEventListener('models', (event) => {
+            this.applyModelList(JSON.parse(event.data));
+        });
+
+        this.events.addEventListener('download', (event) => {
+            this.applyDownloadUpdate(JSON.parse(event.data));
+        });
+
+        this.events.addEventListener('residency', (event) => {
+            const data = JSON.parse(event.data);
+            this.residency = {};
+            Object.keys(data.loaded).forEach(model => this.residency[model] = 'warm');
+            data.loading.forEach(model => this.residency[model] = 'loading');
+            this.updateModelResidency();
+        });
+
+        this.events.addEventListener('catalog', () => {
+            // Catálogo da web atualizado em segundo plano
+            if (this.currentView === 'store' && !this.elements.modelSearch.value.trim()) {
+                this.loadWebModels();
             }
-            console.error('Erro de conexão:', error);
+        });
+    }
+
+    applyModelList(data) {
+        const selected = this.elements.modelSelect.value;
+        this.installedModels = data.models;
+
+        if (data.added.length || data.removed.length) {
+            console.log('📦 Modelos alterados:', data);
+            this.populateModelSelect(data.models);
+            if (data.models.includes(selected)) {
+                this.elements.modelSelect.value = selected;
+                this.currentModel = selected;
+            }
+            this.refreshStoreView();
+        }
+    }
+
+    applyDownloadUpdate(job) {
+        this.downloads[job.model] = job;
+        const active = ['queued', 'downloading'].includes(job.status);
+        const known = this.downloadingModels.has(job.model);
+
+        if (active) {
+            this.downloadingModels.add(job.model);
+        } else {
+            this.downloadingModels.delete(job.model);
+        }
+
+        const progressElement = document.getElementById(`progress-${job.model}`);
+        if (progressElement && active) {
+            progressElement.textContent = this.formatDownloadProgress(job);
+        } else if (active !== known) {
+            // Download iniciado em outra aba ou finalizado: atualiza os botões
+            this.refreshStoreView();
         }
     }
-    
-    updateConnectionStatus(connected, message) {
-        const statusDot = this.elements.connectionStatus.querySelector('.status-dot');
-        const statusText = this.elements.connectionStatus.querySelector('span:last-child');
-        
-        if (connected) {
-            statusDot.classList.add('connected');
-            statusText.textContent = message;
+
+    refreshStoreView() {
+        if (this.currentView !== 'store' || !this.storeCategories) return;
+        if (this.elements.modelSearch.value.trim()) {
+            this.searchModels();
         } else {
-            statusDot.classList.remove('connected');
-            statusText.textContent = message;
+            this.renderModelStore();
         }
     }
-    
+
+    progressText(modelName) {
+        const job = this.downloads[modelName];
+        return job ? this.formatDownloadProgress(job) : '0%';
+    }
+
+    updateStatus(message, connected) {
+        const dots = document.querySelectorAll('.status-dot');
+        const statusTexts = document.querySelectorAll('#connectionStatus, #welcomeStatus');
+
+        dots.forEach(dot => {
+            dot.classList.toggle('connected', connected);
+        });
+
+        statusTexts.forEach(element => {
+            if (element) element.textContent = message;
+        });
+    }
+
     async loadModels() {
         try {
-            console.log('Carregando modelos...');
-            this.elements.modelSelect.innerHTML = `<option value="">${this.translations.models_loading || 'Carregando modelos...'}</option>`;
-            
+            console.log('🔄 Carregando modelos...');
+            this.elements.modelSelect.innerHTML = `<option value="">${this.translations.loading_models || 'Carregando modelos...'}</option>`;
+
             const response = await fetch(`${this.baseUrl}/api/models`);
-            
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
-            }
-            
             const data = await response.json();
-            console.log('Modelos recebidos:', data);
-            
+
+            console.log('📦 Dados recebidos:', data);
+
             if (data.models && data.models.length > 0) {
+                this.residency = data.residency || {};
                 this.populateModelSelect(data.models);
                 this.currentModel = data.models[0];
-                this.updateModelBadge();
-                
-                if (this.elements.connectionMessage) {
-                    this.elements.connectionMessage.innerHTML = 
-                        `✅ ${this.translations.connected || 'Conectado'}! <strong>${data.models.length}</strong> modelo(s) disponível(is)`;
-                }
-                
                 console.log(`✅ ${data.models.length} modelos carregados`);
-            } else {
-                console.warn('Nenhum modelo encontrado no Ollama');
-                if (this.elements.connectionMessage) {
-                    this.elements.connectionMessage.textContent = '⚠️ Nenhum modelo encontrado. Execute: ollama pull deepseek-coder';
+
+                // Atualiza status com info dos modelos
+                if (data.connected) {
+                    this.updateStatus(`${this.translations.connected || 'Conectado'} - ${data.models.length} modelos`, true);
                 }
+            } else {
+                console.error('❌ Nenhum modelo recebido');
+                this.elements.modelSelect.innerHTML = `<option value="">${this.translations.error_loading || 'Erro ao carregar'}</option>`;
+                this.updateStatus('Erro ao carregar modelos', false);
             }
         } catch (error) {
-            console.error('Erro ao carregar modelos:', error);
-            if (this.elements.connectionMessage) {
-                this.elements.connectionMessage.textContent = '❌ Erro ao carregar modelos do Ollama';
-            }
+            console.error('❌ Erro ao carregar modelos:', error);
+            this.elements.modelSelect.innerHTML = `<option value="">${this.translations.error_loading || 'Erro ao carregar'}</option>`;
+            this.updateStatus('Erro de conexão', false);
         }
     }
-    
+
     populateModelSelect(models) {
-        const modelSelect = this.elements.modelSelect;
-        modelSelect.innerHTML = '';
-        
-        const defaultOption = document.createElement('option');
-        defaultOption.value = '';
-        defaultOption.textContent = this.translations.select_model || 'Selecionar modelo';
-        modelSelect.appendChild(defaultOption);
-        
+        console.log('📝 Populando select com modelos:', models);
+        this.elements.modelSelect.innerHTML = '';
+
         models.forEach(model => {
             const option = document.createElement('option');
             option.value = model;
-            option.textContent = model;
-            modelSelect.appendChild(option);
+            option.textContent = this.modelLabel(model);
+            this.elements.modelSelect.appendChild(option);
         });
-        
+
         if (models.length > 0) {
-            modelSelect.value = this.currentModel;
-        }
-        
-        console.log('Select de modelos populado com', models.length, 'modelos');
-    }
-    
-    async changeModel() {
-        const newModel = this.elements.modelSelect.value;
-        
-        if (newModel && newModel !== this.currentModel && !this.isLoadingModel) {
-            this.isLoadingModel = true;
-            console.log('Alterando modelo para:', newModel);
-            
-            // Mostra modal de progresso
-            this.showProgressModal(true);
-            this.updateProgress(10, this.translations.loading_model || 'Carregando modelo...');
-            
-            try {
-                // Simula progresso
-                for (let i = 20; i <= 80; i += 20) {
-                    this.updateProgress(i, `${this.translations.loading_model || 'Carregando modelo'}... ${i}%`);
-                    await new Promise(resolve => setTimeout(resolve, 300));
-                }
-                
-                const response = await fetch(`${this.baseUrl}/api/model`, {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ 
-                        model: newModel,
-                        language: this.currentLanguage
-                    })
-                });
-                
+            this.currentModel = models[0];
+            this.elements.modelSelect.value = models[0];
+            console.log('✅ Modelo selecionado:', this.currentModel);
+        }
+        if (this.compareMode) this.renderComparePicker();
+    }
+
+    async showModelStore() {
+        this.currentView = 'store';
+        this.elements.chatContainer.style.display = 'none';
+        this.elements.modelStore.style.display = 'block';
+        this.elements.modelStoreBtn.style.background = 'var(--primary-color)';
+        this.elements.newChatBtn.style.background = 'var(--secondary-color)';
+
+        await this.loadWebModels();
+    }
+
+    async showChat() {
+        this.currentView = 'chat';
+        this.elements.chatContainer.style.display = 'flex';
+        this.elements.modelStore.style.display = 'none';
+        this.elements.modelStoreBtn.style.background = 'var(--secondary-color)';
+        this.elements.newChatBtn.style.background = 'var(--primary-color)';
+        this.chatList.scheduleCheck();
+    }
+
+    async loadWebModels() {
+        try {
+            this.elements.modelsContent.innerHTML = `
+                <div class="no-models">
+                    <i class="fas fa-spinner fa-spin"></i>
+                    <p>${this.translations.loading_models || 'Carregando modelos...'}</p>
+                </div>
+            `;
+
+            const response = await fetch(`${this.baseUrl}/api/web-models`);
+            const data = await response.json();
+
+            if (data.categories) {
+                this.renderModelStore(data.categories, data.installed_models);
+            } else {
+                throw new Error('Dados inválidos');
+            }
+        } catch (error) {
+            console.error('❌ Erro ao carregar modelos da web:', error);
+            this.elements.modelsContent.innerHTML = `
+                <div class="no-models">
+                    <i class="fas fa-exclamation-triangle"></i>
+                    <p>Erro ao carregar modelos: ${error.message}</p>
+                </div>
+            `;
+        }
+    }
+
+    renderModelStore(categories = this.storeCategories, installedModels = this.installedModels) {
+        this.storeCategories = categories || {};
+        this.installedModels = installedModels || [];
+        categories = this.storeCategories;
+        installedModels = this.installedModels;
+        let html = '';
+
+        // Renderiza cada categoria
+        for (const [categoryName, models] of Object.entries(categories)) {
+            if (models.length === 0) continue;
+
+            const categoryTitle = this.translations[`${categoryName}_models`] || 
+                                categoryName.charAt(0).toUpperCase() + categoryName.slice(1);
+
+            html += `
+                <div class="category-section" data-category="${categoryName}">
+                    <h2 class="category-title">${categoryTitle}</h2>
+                    <div class="models-grid">
+            `;
+
+            models.forEach(model => {
+                const isInstalled = installedModels.includes(model.name);
+                const isDownloading = this.downloadingModels.has(model.name);
+                const size = this.formatFileSize(model.size);
+
+                html += `
+                    <div class="model-card">
+                        <div class="model-header">
+                            <div class="model-name">${model.short_name}</div>
+                            <div class="model-tag">${model.tag}</div>
+                        </div>
+                        <div class="model-stats">
+                            <div class="model-stat">
+                                <i class="fas fa-download"></i>
+                                ${model.pulls?.toLocaleString() || '0'}
+                            </div>
+                            <div class="model-stat">
+                                <i class="fas fa-hdd"></i>
+                                ${size}
+                            </div>
+                        </div>
+                        <button class="install-btn ${isInstalled ? 'installed' : ''} ${isDownloading ? 'installing' : ''}" 
+                                onclick="app.installModel('${model.name}')"
+                                ${isInstalled ? 'disabled' : ''}
+                                ${isDownloading ? 'disabled' : ''}>
+                            ${isInstalled ? (this.translations.installed || 'Instalado') : 
+                              isDownloading ? (this.translations.installing || 'Instalando...') : 
+                              (this.translations.install || 'Instalar')}
+                        </button>
+                        ${isDownloading ? `
+                            <div class="progress-container">
+                                <div class="progress-text" id="progress-${model.name}">${this.progressText(model.name)}</div>
+                                <button class="secondary-btn" onclick="app.cancelDownload('${model.name}')">
+                                    <i class="fas fa-times"></i> ${this.translations.cancel || 'Cancelar'}
+                                </button>
+                            </div>
+                        ` : ''}
+                    </div>
+                `;
+            });
+
+            html += `
+                    </div>
+                </div>
+            `;
+        }
+
+        this.elements.modelsContent.innerHTML = html;
+    }
+
+    async installModel(modelName) {
+        if (this.downloadingModels.has(modelName)) return;
+
+        try {
+            this.downloadingModels.add(modelName);
+            this.renderModelStore(); // Re-render para atualizar botões
+
+            const response = await fetch(`${this.baseUrl}/api/download-model`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    model: modelName,
+                    language: this.currentLanguage
+                })
+            });
+
+            const data = await response.json();
+
+            if (!response.ok) {
+                throw new Error(data.error);
+            }
+
+            console.log(`✅ Download iniciado: ${modelName}`);
+
+        } catch (error) {
+            console.error('❌ Erro ao iniciar download:', error);
+            this.downloadingModels.delete(modelName);
+            this.renderModelStore();
+            alert(`Erro: ${error.message}`);
+        }
+    }
+
+    formatDownloadProgress(progress) {
+        if (progress.status === 'queued') {
+            return `${progress.message} (#${progress.position || 1})`;
+        }
+
+        let text = `${progress.progress}% - ${progress.message}`;
+        if (progress.total) {
+            text += ` - ${this.formatFileSize(progress.completed)} / ${this.formatFileSize(progress.total)}`;
+        }
+        if (progress.rate) {
+            text += ` - ${this.formatFileSize(progress.rate)}/s`;
+        }
+        if (progress.eta !== null && progress.eta !== undefined) {
+            const minutes = Math.floor(progress.eta / 60);
+            text += ` - ${minutes > 0 ? `${minutes}min ` : ''}${progress.eta % 60}s`;
+        }
+        return text;
+    }
+
+    async cancelDownload(modelName) {
+        try {
+            const response = await fetch(`${this.baseUrl}/api/download-cancel/${encodeURIComponent(modelName)}`, {
+                method: 'POST'
+            });
+            if (!response.ok) {
                 const data = await response.json();
-                
-                if (response.ok) {
-                    this.currentModel = newModel;
-                    this.updateModelBadge();
-                    this.updateProgress(100, data.message);
-                    
-                    // Espera um pouco para mostrar 100% e depois fecha
-                    setTimeout(() => {
-                        this.showProgressModal(false);
-                        this.addSystemMessage(`✅ ${data.message}: ${newModel}`);
-                    }, 800);
-                    
-                } else {
-                    throw new Error(data.error || 'Erro desconhecido');
-                }
-            } catch (error) {
-                console.error('Erro ao alterar modelo:', error);
-                this.updateProgress(0, this.translations.error_loading_model || 'Erro ao carregar modelo');
-                
-                setTimeout(() => {
-                    this.showProgressModal(false);
-                    this.addSystemMessage(`❌ ${error.message}`);
-                    this.elements.modelSelect.value = this.currentModel;
-                }, 1500);
-            } finally {
-                this.isLoadingModel = false;
+                throw new Error(data.error);
             }
+            console.log(`🛑 Download cancelado: ${modelName}`);
+        } catch (error) {
+            console.error('❌ Erro ao cancelar download:', error);
+        }
+    }
+
+    formatFileSize(bytes) {
+        if (bytes === 0) return "0 B";
+
+        const sizes = ["B", "KB", "MB", "GB", "TB"];
+        let i = 0;
+        while (bytes >= 1024 && i < sizes.length - 1) {
+            bytes /= 1024;
+            i++;
+        }
+
+        return `${bytes.toFixed(1)} ${sizes[i]}`;
+    }
+
+    async searchModels(offset = 0) {
+        clearTimeout(this.searchTimer);
+        const query = this.elements.modelSearch.value.trim();
+        const searchId = this.searchId = (this.searchId || 0) + 1;
+        if (!query) {
+            await this.loadWebModels();
+            return;
+        }
+
+        try {
+            const response = await fetch(`${this.baseUrl}/api/search-models?q=${encodeURIComponent(query)}&offset=${offset}`);
+            const data = await response.json();
+
+            // Ignora respostas de buscas já substituídas por outra
+            if (searchId !== this.searchId) return;
+
+            if (data.results) {
+                this.searchResults = offset > 0 ? this.searchResults.concat(data.results) : data.results;
+                this.renderSearchResults(this.searchResults, data.installed_models, data.count, data.next_offset);
+            }
+        } catch (error) {
+            console.error('❌ Erro na busca:', error);
         }
     }
-    
-    showProgressModal(show) {
-        if (this.elements.progressModal) {
-            this.elements.progressModal.style.display = show ? 'flex' : 'none';
+
+    renderSearchResults(models, installedModels, total = models.length, nextOffset = null) {
+        if (models.length === 0) {
+            this.elements.modelsContent.innerHTML = `
+                <div class="no-models">
+                    <i class="fas fa-search"></i>
+                    <p>Nenhum modelo encontrado para sua busca.</p>
+                </div>
+            `;
+            return;
         }
+
+        let html = `
+            <div class="category-section">
+                <h2 class="category-title">Resultados da Busca (${total})</h2>
+                <div class="models-grid">
+        `;
+
+        models.forEach(model => {
+            const isInstalled = installedModels.includes(model.name);
+            const isDownloading = this.downloadingModels.has(model.name);
+            const size = this.formatFileSize(model.size);
+
+            html += `
+                <div class="model-card">
+                    <div class="model-header">
+                        <div class="model-name">${model.short_name}</div>
+                        <div class="model-tag">${model.tag}</div>
+                    </div>
+                    <div class="model-stats">
+                        <div class="model-stat">
+                            <i class="fas fa-download"></i>
+                            ${model.pulls?.toLocaleString() || '0'}
+                        </div>
+                        <div class="model-stat">
+                            <i class="fas fa-hdd"></i>
+                            ${size}
+                        </div>
+                    </div>
+                    <button class="install-btn ${isInstalled ? 'installed' : ''} ${isDownloading ? 'installing' : ''}" 
+                            onclick="app.installModel('${model.name}')"
+                            ${isInstalled ? 'disabled' : ''}
+                            ${isDownloading ? 'disabled' : ''}>
+                        ${isInstalled ? (this.translations.installed || 'Instalado') : 
+                          isDownloading ? (this.translations.installing || 'Instalando...') : 
+                          (this.translations.install || 'Instalar')}
+                    </button>
+                    ${isDownloading ? `
+                        <div class="progress-container">
+                            <div class="progress-text" id="progress-${model.name}">${this.progressText(model.name)}</div>
+                            <button class="secondary-btn" onclick="app.cancelDownload('${model.name}')">
+                                <i class="fas fa-times"></i> ${this.translations.cancel || 'Cancelar'}
+                            </button>
+                        </div>
+                    ` : ''}
+                </div>
+            `;
+        });
+
+        html += `
+                </div>
+                ${nextOffset !== null ? `
+                    <button class="secondary-btn" onclick="app.searchModels(${nextOffset})">
+                        <i class="fas fa-chevron-down"></i> Carregar mais
+                    </button>
+                ` : ''}
+            </div>
+        `;
+
+        this.elements.modelsContent.innerHTML = html;
+    }
+
+    filterModelsByCategory(category) {
+        const sections = document.querySelectorAll('.category-section');
+
+        sections.forEach(section => {
+            if (category === 'all' || section.dataset.category === category) {
+                section.style.display = 'block';
+            } else {
+                section.style.display = 'none';
+            }
+        });
+    }
+
+    // ... (mantenha os outros métodos: changeLanguage, changeModel, changeTheme, handleInput, handleKeydown, sendMessage, etc.)
+
+    changeLanguage() {
+        this.currentLanguage = this.elements.languageSelect.value;
+        localStorage.setItem('language', this.currentLanguage);
+        this.loadTranslations();
     }
-    
-    updateProgress(percent, text) {
-        if (this.elements.progressBar) {
-            this.elements.progressBar.style.width = percent + '%';
+
+    changeModel() {
+        this.currentModel = this.elements.modelSelect.value;
+        localStorage.setItem('model', this.currentModel);
+        console.log('🔀 Modelo alterado para:', this.currentModel);
+        this.preloadModel(this.currentModel);
+    }
+
+    async preloadModel(model) {
+        // Carrega os pesos antes da primeira mensagem; o estado chega por /api/events
+        if (!model || this.residency?.[model] === 'warm') return;
+        try {
+            const response = await fetch(`${this.baseUrl}/api/model`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    model: model,
+                    language: this.currentLanguage
+                })
+            });
+            const data = await response.json();
+            if (response.ok) {
+                this.residency = { ...this.residency, [model]: data.status };
+                this.updateModelResidency();
+            }
+        } catch (error) {
+            console.error('❌ Erro ao pré-carregar modelo:', error);
         }
-        if (this.elements.progressText) {
-            this.elements.progressText.textContent = text;
+    }
+
+    modelLabel(model) {
+        // ● na memória, ◐ carregando, ○ frio (a primeira mensagem carrega os pesos)
+        const state = this.residency?.[model] || 'cold';
+        const icon = { warm: '●', loading: '◐', cold: '○' }[state];
+        return `${icon} ${model}`;
+    }
+
+    updateModelResidency() {
+        Array.from(this.elements.modelSelect.options).forEach(option => {
+            if (option.value) option.textContent = this.modelLabel(option.value);
+        });
+
+        if (this.residency?.[this.currentModel] === 'loading') {
+            this.updateStatus(this.translations.model_loading || 'Carregando modelo na memória...', true);
+        } else if (this.residency?.[this.currentModel] === 'warm') {
+            this.updateStatus(`${this.translations.model_warm || 'Modelo pronto'} - ${this.currentModel}`, true);
         }
     }
-    
-    updateModelBadge() {
-        const badge = this.elements.currentModelBadge;
-        badge.innerHTML = `<span>🤖</span><span>${this.currentModel}</span>`;
+
+    changeTheme() {
+        this.currentTheme = this.elements.themeSelect.value;
+        localStorage.setItem('theme', this.currentTheme);
+        this.applyTheme();
+    }
+
+    applyTheme() {
+        const theme = this.currentTheme === 'auto' ? 
+            (window.matchMedia('(prefers-color-scheme: dark)').matches ? 'dark' : 'light') : 
+            this.currentTheme;
+
+        document.body.setAttribute('data-theme', theme);
     }
-    
+
     handleInput() {
+        const message = this.elements.textInput.value.trim();
+        this.elements.sendBtn.disabled = message === '' && !this.isGenerating;
+
+        // Auto-resize
         this.elements.textInput.style.height = 'auto';
-        this.elements.textInput.style.height = Math.min(this.elements.textInput.scrollHeight, 200) + 'px';
-        this.elements.sendBtn.disabled = this.elements.textInput.value.trim() === '' || this.isGenerating;
+        this.elements.textInput.style.height = Math.min(this.elements.textInput.scrollHeight, 120) + 'px';
     }
-    
+
     handleKeydown(e) {
         if (e.key === 'Enter' && !e.shiftKey) {
             e.preventDefault();
-            if (!this.elements.sendBtn.disabled) {
-                this.sendMessage();
-            }
+            this.sendMessage();
         }
     }
-    
+
     async sendMessage() {
         const message = this.elements.textInput.value.trim();
-        if (message === '' || this.isGenerating) return;
+        if (!message || this.isGenerating) return;
+        if (this.compareMode) return this.sendCompare(message);
 
         this.isGenerating = true;
-        this.elements.sendBtn.disabled = true;
-        
+        this.generationId = null;
+        this.chatAbort = new AbortController();
+        this.setStopMode(true);
+
+        // Adiciona mensagem do usuário
         this.addMessage('user', message);
-        
         this.elements.textInput.value = '';
-        this.elements.textInput.style.height = 'auto';
-        
-        this.showTypingIndicator(true);
-        
+        this.handleInput();
+
+        // Mostra indicador de digitação
+        this.showTyping(true);
+
+        let writer = null;
         try {
+            console.log('📤 Enviando mensagem para:', this.currentModel);
             const response = await fetch(`${this.baseUrl}/api/chat`, {
                 method: 'POST',
                 headers: {
@@ -407,124 +1034,518 @@ class OllamaChatApp {
                 body: JSON.stringify({
                     message: message,
                     model: this.currentModel,
-                    history: this.conversationHistory,
-                    language: this.currentLanguage
-                })
+                    language: this.currentLanguage,
+                    conversation_id: this.conversationId,
+                    documents: this.useDocuments
+                }),
+                signal: this.chatAbort.signal
             });
-            
+
             if (!response.ok) {
-                throw new Error(`Erro HTTP: ${response.status}`);
+                const error = await response.json();
+                console.error('❌ Erro na resposta:', error);
+                this.addMessage('assistant', `❌ Erro: ${error.error}`);
+                return;
+            }
+
+            this.generationId = response.headers.get('X-Generation-Id');
+            const conversationId = response.headers.get('X-Conversation-Id');
+            if (conversationId && conversationId !== this.conversationId) {
+                this.conversationId = conversationId;
+                this.loadConversations();
             }
-            
+
+            // Lê o stream SSE; os tokens entram na bolha uma vez por quadro
+            const bubble = this.addMessage('assistant', '', false);
+            writer = new StreamingText(bubble, () => this.chatList.follow());
             const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-            let assistantMessage = '';
-            
-            const messageElement = this.createMessageElement('assistant', '');
-            this.elements.chatContainer.appendChild(messageElement);
-            this.scrollToBottom();
-            
-            while (true) {
+            let finished = false;
+            const parser = new SSEParser(event => {
+                if (finished) return;
+                let parsed;
+                try {
+                    parsed = JSON.parse(event.data);
+                } catch (e) {
+                    console.warn('⚠️ Evento inválido:', e);
+                    return;
+                }
+
+                if (parsed.queued) {
+                    // Aguardando um slot do modelo no servidor
+                    writer.setStatus(`⏳ ${this.translations.queued || 'Na fila'} (#${parsed.position})`);
+                    return;
+                }
+
+                if (parsed.error) {
+                    writer.append(`\n❌ Erro: ${parsed.error}`);
+                } else if (parsed.content) {
+                    writer.append(parsed.content);
+                }
+
+                if (parsed.done) {
+                    writer.flush();
+                    if (parsed.sources && parsed.sources.length) this.addSources(bubble, parsed.sources);
+                    if (parsed.cancelled) {
+                        console.log(`🛑 ${this.translations.generation_stopped || 'Geração interrompida'} (${parsed.eval_count} tokens)`);
+                    } else if (parsed.eval_count && parsed.eval_duration) {
+                        const tokensPerSecond = parsed.eval_count / (parsed.eval_duration / 1e9);
+                        console.log(`✅ Resposta recebida (${parsed.eval_count} tokens, ${tokensPerSecond.toFixed(1)} tokens/s)`);
+                    }
+                    finished = true;
+                }
+            });
+
+            while (!finished) {
                 const { value, done } = await reader.read();
                 if (done) break;
-                
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
-                
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        const data = line.slice(6);
-                        if (data && data !== '[DONE]') {
-                            try {
-                                const parsed = JSON.parse(data);
-                                if (parsed.content) {
-                                    assistantMessage += parsed.content;
-                                    messageElement.querySelector('.bubble').textContent = assistantMessage;
-                                    this.scrollToBottom();
-                                }
-                                if (parsed.done) {
-                                    this.conversationHistory.push({
-                                        role: 'assistant',
-                                        content: assistantMessage
-                                    });
-                                    break;
-                                }
-                            } catch (e) {
-                                console.warn('Erro ao parsear chunk:', e);
-                            }
-                        }
-                    }
+                parser.push(value);
+            }
+
+            writer.flush();
+            this.conversationHistory.push({ role: 'assistant', content: writer.text });
+        } catch (error) {
+            if (error.name === 'AbortError') {
+                console.log('🛑 Pedido interrompido antes da resposta');
+            } else {
+                console.error('❌ Erro de conexão:', error);
+                this.addMessage('assistant', `❌ Erro de conexão: ${error.message}`);
+            }
+        } finally {
+            if (writer) writer.flush();
+            this.isGenerating = false;
+            this.generationId = null;
+            this.chatAbort = null;
+            this.showTyping(false);
+            this.setStopMode(false);
+            this.elements.textInput.focus();
+        }
+    }
+
+    setUseDocuments(enabled) {
+        this.useDocuments = enabled;
+        this.elements.documentsBtn.classList.toggle('active', enabled);
+    }
+
+    async uploadDocument() {
+        const file = this.elements.documentInput.files[0];
+        this.elements.documentInput.value = '';
+        if (!file) return;
+
+        const form = new FormData();
+        form.append('file', file);
+        this.elements.attachBtn.disabled = true;
+        try {
+            const response = await fetch(`${this.baseUrl}/api/documents`, { method: 'POST', body: form });
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error);
+
+            console.log(`📚 ${file.name}: ${data.stats.chunks} trechos (${data.stats.embedded} novos)`);
+            this.updateStatus(`${this.translations.document_indexed || 'Documento indexado'} - ${file.name}`, true);
+            this.setUseDocuments(true);
+        } catch (error) {
+            console.error('❌ Erro ao indexar documento:', error);
+            alert(`${this.translations.document_error || 'Erro ao indexar documento'}: ${error.message}`);
+        } finally {
+            this.elements.attachBtn.disabled = false;
+        }
+    }
+
+    addSources(bubble, sources) {
+        // Documentos usados na resposta, sem repetir o mesmo documento
+        const names = [...new Set(sources.map(source => source.name))];
+        const footer = document.createElement('div');
+        footer.className = 'message-sources';
+        footer.textContent = `📚 ${this.translations.sources || 'Fontes'}: ${names.join(', ')}`;
+        bubble.appendChild(footer);
+        this.chatList.follow();
+    }
+
+    toggleCompareMode() {
+        this.compareMode = !this.compareMode;
+        this.elements.compareBtn.classList.toggle('active', this.compareMode);
+        this.elements.comparePicker.style.display = this.compareMode ? 'flex' : 'none';
+        if (this.compareMode) this.renderComparePicker();
+    }
+
+    renderComparePicker() {
+        const models = Array.from(this.elements.modelSelect.options).map(option => option.value).filter(Boolean);
+        this.compareModels = new Set([...this.compareModels].filter(model => models.includes(model)));
+        if (!this.compareModels.size && this.currentModel) this.compareModels.add(this.currentModel);
+
+        this.elements.comparePicker.innerHTML = '';
+        models.forEach(model => {
+            const label = document.createElement('label');
+            label.className = 'compare-option';
+            const checkbox = document.createElement('input');
+            checkbox.type = 'checkbox';
+            checkbox.checked = this.compareModels.has(model);
+            checkbox.addEventListener('change', () => {
+                if (checkbox.checked) this.compareModels.add(model);
+                else this.compareModels.delete(model);
+            });
+            label.append(checkbox, document.createTextNode(model));
+            this.elements.comparePicker.appendChild(label);
+        });
+    }
+
+    async sendCompare(message) {
+        const models = [...this.compareModels];
+        if (models.length < 2) {
+            alert(this.translations.compare_pick || 'Escolha ao menos dois modelos para comparar');
+            return;
+        }
+
+        this.isGenerating = true;
+        this.generationId = null;
+        this.chatAbort = new AbortController();
+        this.setStopMode(true);
+        this.addMessage('user', message);
+        this.elements.textInput.value = '';
+        this.handleInput();
+        this.showTyping(true);
+
+        let columns = null;
+        try {
+            console.log('⚖️ Comparando modelos:', models);
+            const response = await fetch(`${this.baseUrl}/api/compare`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ message, models, language: this.currentLanguage }),
+                signal: this.chatAbort.signal
+            });
+
+            if (!response.ok) {
+                const error = await response.json();
+                this.addMessage('assistant', `❌ Erro: ${error.error}`, false);
+                return;
+            }
+
+            this.generationId = response.headers.get('X-Generation-Id');
+            columns = this.addCompareMessage(models);
+            const reader = response.body.getReader();
+            // Eventos nomeados (event: + data:), um tipo por etapa de cada modelo
+            const parser = new SSEParser(event => {
+                try {
+                    this.applyCompareEvent(columns, event.type, JSON.parse(event.data));
+                } catch (e) {
+                    console.warn('⚠️ Evento inválido:', e);
                 }
+            });
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                parser.push(value);
             }
-            
         } catch (error) {
-            console.error('Erro ao enviar mensagem:', error);
-            this.addSystemMessage(`❌ Erro: ${error.message}`);
+            if (error.name !== 'AbortError') {
+                console.error('❌ Erro de conexão:', error);
+                this.addMessage('assistant', `❌ Erro de conexão: ${error.message}`, false);
+            }
         } finally {
-            this.showTypingIndicator(false);
+            if (columns) Object.values(columns).forEach(target => target.writer.flush());
             this.isGenerating = false;
-            this.elements.sendBtn.disabled = this.elements.textInput.value.trim() === '';
+            this.generationId = null;
+            this.chatAbort = null;
+            this.showTyping(false);
+            this.setStopMode(false);
+            this.elements.textInput.focus();
         }
     }
-    
-    createMessageElement(sender, content) {
-        const messageDiv = document.createElement('div');
-        messageDiv.className = `message ${sender}-msg`;
-        
-        const avatarDiv = document.createElement('div');
-        avatarDiv.className = 'avatar';
-        avatarDiv.textContent = sender === 'user' ? 'U' : 'AI';
-        
-        const contentDiv = document.createElement('div');
-        contentDiv.className = 'message-content';
-        
-        const bubbleDiv = document.createElement('div');
-        bubbleDiv.className = 'bubble';
-        bubbleDiv.textContent = content;
-        
-        const actionsDiv = document.createElement('div');
-        actionsDiv.className = 'message-actions';
-        actionsDiv.innerHTML = `
-            <button class="action-btn" onclick="app.copyMessage(this)">Copiar</button>
-            <button class="action-btn" onclick="app.rateMessage(this, 'up')">👍</button>
-            <button class="action-btn" onclick="app.rateMessage(this, 'down')">👎</button>
-        `;
-        
-        contentDiv.appendChild(bubbleDiv);
-        contentDiv.appendChild(actionsDiv);
-        messageDiv.appendChild(avatarDiv);
-        messageDiv.appendChild(contentDiv);
-        
-        return messageDiv;
+
+    addCompareMessage(models) {
+        // Uma coluna por modelo, na mesma mensagem
+        const bubble = this.addMessage('assistant', '', false);
+        const messageDiv = bubble.parentElement;
+        messageDiv.classList.add('compare');
+        const grid = document.createElement('div');
+        grid.className = 'compare-grid';
+        messageDiv.replaceChild(grid, bubble);
+
+        const columns = {};
+        models.forEach(model => {
+            const column = document.createElement('div');
+            column.className = 'compare-column';
+            const header = document.createElement('div');
+            header.className = 'compare-header';
+            header.textContent = model;
+            const body = document.createElement('div');
+            body.className = 'bubble';
+            const stats = document.createElement('div');
+            stats.className = 'compare-stats';
+            column.append(header, body, stats);
+            grid.appendChild(column);
+            columns[model] = { column, body, stats, writer: new StreamingText(body, () => this.chatList.follow()) };
+        });
+        return columns;
+    }
+
+    applyCompareEvent(columns, type, data) {
+        if (type === 'summary') {
+            Object.values(columns).forEach(target => target.writer.flush());
+            // Destaca o modelo que terminou primeiro entre os que concluíram
+            const completed = Object.entries(data.models).filter(([, entry]) => entry.status === 'completed');
+            completed.sort((a, b) => a[1].total_time - b[1].total_time);
+            Object.entries(data.models).forEach(([model, entry]) => {
+                const target = columns[model];
+                if (!target) return;
+                target.stats.textContent = this.compareStatsText(entry);
+                if (completed.length > 1 && completed[0][0] === model) {
+                    target.column.classList.add('fastest');
+                    target.stats.textContent += ` · 🏁 ${this.translations.fastest || 'mais rápido'}`;
+                }
+            });
+            return;
+        }
+
+        const target = columns[data.model];
+        if (!target) return;
+        if (type === 'queued') {
+            target.writer.setStatus(`⏳ ${this.translations.queued || 'Na fila'} (#${data.position})`);
+        } else if (type === 'token') {
+            target.writer.append(data.content);
+        } else if (type === 'error') {
+            target.writer.append(`\n❌ Erro: ${data.error}`);
+        }
+    }
+
+    compareStatsText(entry) {
+        if (entry.status === 'cancelled') return `🛑 ${this.translations.generation_stopped || 'Geração interrompida'}`;
+        if (entry.status !== 'completed') return `❌ ${entry.status}`;
+        const parts = [];
+        if (entry.ttft !== null) parts.push(`TTFT ${entry.ttft.toFixed(2)}s`);
+        if (entry.tokens_per_second !== null) parts.push(`${entry.tokens_per_second.toFixed(1)} tokens/s`);
+        parts.push(`${entry.total_time.toFixed(2)}s`);
+        return parts.join(' · ');
+    }
+
+    async stopGeneration() {
+        // Sem o id (resposta ainda não chegou) basta abortar: o servidor vê a desconexão
+        if (!this.generationId) {
+            this.chatAbort?.abort();
+            return;
+        }
+        try {
+            const response = await fetch(`${this.baseUrl}/api/chat/${this.generationId}/cancel`, { method: 'POST' });
+            if (!response.ok) this.chatAbort?.abort();
+        } catch (error) {
+            this.chatAbort?.abort();
+        }
+    }
+
+    setStopMode(generating) {
+        const button = this.elements.sendBtn;
+        button.classList.toggle('stop', generating);
+        button.title = generating ? (this.translations.stop_generation || 'Parar geração') : '';
+        button.innerHTML = generating ? '<i class="fas fa-stop"></i>' : '<i class="fas fa-paper-plane"></i>';
+        button.disabled = !generating && this.elements.textInput.value.trim() === '';
     }
-    
-    addMessage(sender, content) {
-        const messageElement = this.createMessageElement(sender, content);
-        this.elements.chatContainer.appendChild(messageElement);
-        
+
+    addMessage(role, content, saveToHistory = true) {
+        const messageDiv = this.createMessage(role, content);
+
+        // Remove mensagem de boas-vindas se for a primeira mensagem
         const welcomeMessage = this.elements.chatContainer.querySelector('.welcome-message');
         if (welcomeMessage) {
             welcomeMessage.remove();
         }
-        
-        if (sender === 'user') {
-            this.conversationHistory.push({ role: 'user', content: content });
-        }
-        
+
+        this.chatList.append(messageDiv);
         this.scrollToBottom();
-        return messageElement;
+
+        // Salva no histórico
+        if (saveToHistory) {
+            this.conversationHistory.push({ role, content });
+        }
+
+        return messageDiv.querySelector('.bubble');
     }
-    
-    addSystemMessage(content) {
+
+    createMessage(role, content) {
         const messageDiv = document.createElement('div');
-        messageDiv.className = 'message system-msg';
-        messageDiv.innerHTML = `
-            <div class="avatar">!</div>
-            <div class="message-content">
-                <div class="bubble">${content}</div>
+        messageDiv.className = `message ${role}`;
+
+        const avatar = document.createElement('div');
+        avatar.className = 'avatar';
+        avatar.innerHTML = role === 'user' ? 
+            '<i class="fas fa-user"></i>' : 
+            '<i class="fas fa-robot"></i>';
+
+        const bubble = document.createElement('div');
+        bubble.className = 'bubble';
+        bubble.textContent = content;
+
+        messageDiv.appendChild(avatar);
+        messageDiv.appendChild(bubble);
+        return messageDiv;
+    }
+
+    showTyping(show) {
+        this.elements.typingIndicator.style.display = show ? 'flex' : 'none';
+        if (show) {
+            this.scrollToBottom();
+        }
+    }
+
+    scrollToBottom() {
+        this.chatList.scrollToEnd();
+    }
+
+    newConversation() {
+        this.conversationHistory = [];
+        this.conversationId = null;
+        this.messagesCursor = null;
+        this.chatList.reset();
+        this.elements.chatContainer.innerHTML = `
+            <div class="welcome-message">
+                <div class="welcome-icon">
+                    <i class="fas fa-robot"></i>
+                </div>
+                <h2 id="welcomeTitle">${this.translations.welcome || 'Bem-vindo'}</h2>
+                <p id="welcomeText">${this.translations.welcome_message || 'Converse com modelos de IA localmente'}</p>
             </div>
         `;
-        this.elements.chatContainer.appendChild(messageDiv);
-        this.scrollToBottom();
+        console.log('🆕 Nova conversa iniciada');
+        this.renderConversationList();
+        this.showChat();
+    }
+
+    clearConversation() {
+        if (confirm('Tem certeza que deseja limpar a conversa?')) {
+            this.newConversation();
+        }
+    }
+
+    async loadConversations() {
+        try {
+            const response = await fetch(`${this.baseUrl}/api/conversations?limit=30`);
+            const data = await response.json();
+            this.conversations = data.conversations || [];
+            this.renderConversationList();
+        } catch (error) {
+            console.error('❌ Erro ao carregar conversas:', error);
+        }
     }
-    
\ No newline at end of file
+
+    renderConversationList() {
+        const container = this.elements.conversationHistory;
+        container.innerHTML = '';
+
+        if (this.conversations.length === 0) {
+            container.innerHTML = `
+                <div class="conversation-item active">
+                    <i class="fas fa-comment"></i>
+                    <span>Conversa Atual</span>
+                </div>
+            `;
+            return;
+        }
+
+        this.conversations.forEach(conversation => {
+            const item = document.createElement('div');
+            item.className = 'conversation-item';
+            item.classList.toggle('active', conversation.id === this.conversationId);
+
+            const icon = document.createElement('i');
+            icon.className = 'fas fa-comment';
+            const title = document.createElement('span');
+            title.textContent = conversation.title || 'Conversa';
+
+            item.appendChild(icon);
+            item.appendChild(title);
+            item.addEventListener('click', () => this.openConversation(conversation.id));
+            container.appendChild(item);
+        });
+    }
+
+    async openConversation(conversationId) {
+        if (this.isGenerating) return;
+
+        try {
+            const response = await fetch(`${this.baseUrl}/api/conversations/${conversationId}/messages?limit=${MESSAGES_PAGE_SIZE}`);
+            const data = await response.json();
+
+            if (!response.ok) {
+                throw new Error(data.error);
+            }
+
+            // Só a última página; as anteriores chegam ao rolar para cima
+            this.conversationId = conversationId;
+            this.conversationHistory = data.messages.map(message => ({ role: message.role, content: message.content }));
+            this.messagesCursor = data.next_cursor;
+            this.showChat();
+            this.chatList.reset(Boolean(data.next_cursor));
+            data.messages.forEach(message => this.chatList.append(this.createMessage(message.role, message.content)));
+            this.chatList.scrollToEnd();
+
+            this.renderConversationList();
+        } catch (error) {
+            console.error('❌ Erro ao abrir conversa:', error);
+        }
+    }
+
+    async loadOlderMessages() {
+        const conversationId = this.conversationId;
+        if (!conversationId || !this.messagesCursor) return { elements: [], more: false };
+
+        const response = await fetch(
+            `${this.baseUrl}/api/conversations/${conversationId}/messages?limit=${MESSAGES_PAGE_SIZE}&before=${this.messagesCursor}`
+        );
+        const data = await response.json();
+        if (!response.ok) throw new Error(data.error);
+        if (conversationId !== this.conversationId) return null;
+
+        this.messagesCursor = data.next_cursor;
+        this.conversationHistory.unshift(...data.messages.map(message => ({ role: message.role, content: message.content })));
+        return {
+            elements: data.messages.map(message => this.createMessage(message.role, message.content)),
+            more: Boolean(data.next_cursor)
+        };
+    }
+
+    exportConversation() {
+        if (!this.conversationId) {
+            alert('Nenhuma conversa para exportar');
+            return;
+        }
+
+        // O servidor gera o arquivo em streaming direto do histórico salvo
+        const a = document.createElement('a');
+        a.href = `${this.baseUrl}/api/conversations/${this.conversationId}/export?format=txt&language=${this.currentLanguage}`;
+        a.download = '';
+        document.body.appendChild(a);
+        a.click();
+        document.body.removeChild(a);
+    }
+
+    toggleMobileMenu() {
+        const sidebar = document.querySelector('.sidebar');
+        sidebar.classList.toggle('open');
+    }
+
+    loadSettings() {
+        // Carrega configurações salvas
+        const savedLanguage = localStorage.getItem('language');
+        const savedModel = localStorage.getItem('model');
+        const savedTheme = localStorage.getItem('theme');
+
+        if (savedLanguage) {
+            this.currentLanguage = savedLanguage;
+            this.elements.languageSelect.value = savedLanguage;
+        }
+
+        if (savedModel) {
+            this.currentModel = savedModel;
+        }
+
+        if (savedTheme) {
+            this.currentTheme = savedTheme;
+            this.elements.themeSelect.value = savedTheme;
+        }
+    }
+}
+
+// Inicializa a aplicação quando o DOM estiver carregado
+document.addEventListener('DOMContentLoaded', () => {
+    window.app = new OllamaGUI();
+});
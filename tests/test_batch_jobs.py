@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes dos jobs em lote"""
+
+import threading
+import time
+
+import shared_state
+from batch_jobs import BatchManager
+from scheduler import ChatScheduler
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return {'message': {'content': 'ok'}, 'eval_count': 1}
+
+
+class BlockingClient:
+    """Cliente do Ollama que segura cada /api/chat até `release` ser sinalizado"""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def post(self, path, json=None, timeout=None):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(5)
+        return FakeResponse()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_job_deleted_while_running_stays_deleted(tmp_path):
+    state = shared_state.create_backend('memory')
+    client = BlockingClient()
+    events = []
+    manager = BatchManager(client, ChatScheduler(), state, str(tmp_path), owner=lambda: 'worker',
+                           concurrency=1, publish=lambda kind, job: events.append(dict(job)))
+    lines = [f'{{"id": "{index}", "prompt": "oi"}}\n' for index in range(10)]
+    job = manager.create(lines, {'model': 'llama3'})
+    
+    assert client.started.wait(5)
+    assert manager.delete(job['id'])
+    published = len(events)
+    client.release.set()
+    
+    # A execução termina quando a concessão é liberada
+    assert wait_for(lambda: state.acquire_lease(f"batch:{job['id']}", 'other', 30))
+    assert manager.get(job['id']) is None
+    assert not (tmp_path / job['id']).exists()
+    assert client.calls == 1
+    assert all(event['status'] != 'completed' for event in events[published:])
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes da admissão de pedidos de chat pelo agendador"""
+
+import pytest
+
+import app
+from scheduler import ChatScheduler
+
+
+def conversation_ids():
+    return {conversation['id'] for conversation in app.conversation_store.list_conversations(limit=1000)[0]}
+
+
+@pytest.fixture
+def full_scheduler(monkeypatch):
+    info = dict(app.PENDING_CONNECTION_STATE, connected=True, method='api', message='ok',
+                models=['llama3'], digests={})
+    monkeypatch.setattr(app, 'get_connection_info', lambda wait=5: info)
+    scheduler = ChatScheduler(max_concurrent=1, per_model=1, max_queue=0)
+    monkeypatch.setattr(app, 'chat_scheduler', scheduler)
+    retrievals = []
+    monkeypatch.setattr(app, 'retrieve_documents', lambda *args, **kwargs: retrievals.append(args) or [])
+    running = scheduler.submit('llama3', 'someone')
+    yield retrievals
+    scheduler.release(running)
+
+
+def test_rejected_chat_has_no_side_effects(full_scheduler):
+    before = conversation_ids()
+    response = app.app.test_client().post('/api/chat', json={'message': 'oi', 'model': 'llama3',
+                                                              'documents': True})
+    
+    assert response.status_code == 429
+    assert response.headers['Retry-After']
+    assert conversation_ids() == before
+    assert full_scheduler == []
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes do gerenciador de contexto"""
+
+import threading
+
+from context_manager import ContextManager
+from scheduler import ChatScheduler
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, contexts):
+        self.contexts = contexts
+        self.chats = []
+
+    def post(self, path, json=None, timeout=None):
+        if path == '/api/show':
+            return FakeResponse({'model_info': {'llama.context_length': self.contexts[json['model']]}})
+        self.chats.append(json)
+        return FakeResponse({'message': {'content': ' resumo '}})
+
+
+def test_summary_waits_for_idle_slot():
+    scheduler = ChatScheduler(max_concurrent=4, per_model=1)
+    client = FakeClient({'llama3': 8192})
+    manager = ContextManager(None, client, default_num_ctx=8192, scheduler=scheduler)
+    chat = scheduler.submit('llama3', 'alice')
+    
+    result = []
+    thread = threading.Thread(target=lambda: result.append(
+        manager._summarize('llama3', 'resuma', '', [{'role': 'user', 'content': 'oi'}])))
+    thread.start()
+    thread.join(0.3)
+    assert not client.chats  # O chat ocupa o único slot do modelo
+    
+    scheduler.release(chat)
+    thread.join(5)
+    assert result == ['resumo']
+    assert scheduler.stats()['models'] == {}
+
+
+def test_summary_model_context():
+    client = FakeClient({'llama3': 8192, 'tiny': 2048})
+    manager = ContextManager(None, client, default_num_ctx=8192, summary_model='tiny',
+                             scheduler=ChatScheduler())
+    manager._summarize('llama3', 'resuma', '', [{'role': 'user', 'content': 'oi'}])
+    assert client.chats[0]['model'] == 'tiny'
+    assert client.chats[0]['options']['num_ctx'] == 2048
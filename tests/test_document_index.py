@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes do índice de documentos"""
+
+import hashlib
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+
+import document_index
+import shared_state
+from document_index import DocumentIndex
+
+DIMENSIONS = 64
+
+
+def embed(text):
+    """Embedding determinístico: contagem de palavras espalhadas por hash"""
+    vector = [0.0] * DIMENSIONS
+    for word in text.split():
+        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIMENSIONS] += 1
+    return vector
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+class EmbedClient:
+    def __init__(self):
+        self.on_query = None
+
+    def post(self, path, json=None, timeout=None):
+        if len(json['input']) == 1 and self.on_query:
+            hook, self.on_query = self.on_query, None
+            hook()
+        return FakeResponse({'embeddings': [embed(text) for text in json['input']]})
+
+
+def document(prefix, count):
+    # ~900 caracteres por parágrafo: um trecho cada, sem sobreposição
+    return '\n\n'.join(' '.join([f'{prefix}{index:02d}'] * 130) for index in range(count))
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_index, 'COMPACT_MIN_ORPHANS', 1)
+    return DocumentIndex(str(tmp_path), EmbedClient(), 'embed', shared_state.create_backend('memory'),
+                         owner=lambda: 'worker')
+
+
+def test_search_finds_chunk(index):
+    index.add('keep.txt', document('keep', 5))
+    results = index.search('keep03', k=1)
+    assert results[0]['text'].startswith('keep03 ')
+    assert results[0]['score'] == pytest.approx(1.0)
+
+
+def test_compaction_during_search(index):
+    junk, _ = index.add('junk.txt', document('junk', 30))
+    index.add('keep.txt', document('keep', 5))
+    index.search('keep00', k=1)  # Monta a visão com as linhas antes da compactação
+    
+    # Apagar o documento maior compacta o arquivo enquanto a consulta espera o embedding
+    index.client.on_query = lambda: index.delete(junk['id'])
+    results = index.search('keep03', k=1)
+    
+    assert results[0]['text'].startswith('keep03 ')
+    assert results[0]['score'] == pytest.approx(1.0)
+    assert index.stats()['vectors'] == 5
+    files = [name for name in os.listdir(index.directory) if name.endswith('.f32')]
+    assert files == [index._meta('vectors_file')]
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes da validação das rotas de documentos"""
+
+import pytest
+
+import app
+
+pytestmark = pytest.mark.skipif(app.document_index is None, reason='numpy ausente')
+
+
+@pytest.fixture
+def search(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, 'retrieve_documents', lambda query, documents, k: calls.append(k) or [])
+    client = app.app.test_client()
+    
+    def post(payload):
+        return client.post('/api/documents/search', json=payload)
+    post.calls = calls
+    return post
+
+
+@pytest.mark.parametrize('k', ['abc', None, 0, -3, [], {}])
+def test_invalid_k(search, k):
+    response = search({'query': 'ollama', 'k': k})
+    assert response.status_code == 400
+    assert not search.calls
+
+
+def test_k_is_clamped(search):
+    assert search({'query': 'ollama', 'k': 10000}).status_code == 200
+    assert search({'query': 'ollama', 'k': '3'}).status_code == 200
+    assert search({'query': 'ollama'}).status_code == 200
+    assert search.calls == [app.MAX_DOCUMENTS_TOP_K, 3, app.DOCUMENTS_TOP_K]
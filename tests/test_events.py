@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes do snapshot enviado por /api/events"""
+
+import json
+import time
+
+import pytest
+
+import app
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    info = dict(app.PENDING_CONNECTION_STATE, connected=True, method='api', message='ok',
+                models=['llama3:8b'])
+    monkeypatch.setattr(app, 'get_connection_info', lambda wait=5: info)
+    return info
+
+
+def save_download(model_name, status):
+    app.download_manager.state.set('downloads', model_name, {
+        'model': model_name,
+        'language': 'en',
+        'status': status,
+        'progress': 50,
+        'message': status,
+        'position': 0,
+        'updated_at': time.time()
+    })
+
+
+def download_events(snapshot):
+    events = []
+    for event in snapshot:
+        lines = dict(line.split(': ', 1) for line in event.strip().splitlines())
+        if lines['event'] == 'download':
+            events.append(json.loads(lines['data']))
+    return events
+
+
+def test_snapshot_with_download_records(connection):
+    save_download('finished:1b', 'completed')
+    save_download('pulling:1b', 'downloading')
+    try:
+        events = download_events(app.events_snapshot())
+    finally:
+        app.download_manager.state.delete('downloads', 'finished:1b')
+        app.download_manager.state.delete('downloads', 'pulling:1b')
+    
+    assert [event['model'] for event in events] == ['pulling:1b']
+
+
+def test_events_route_with_finished_download(connection):
+    save_download('finished:1b', 'completed')
+    try:
+        response = app.app.test_client().get('/api/events', buffered=False)
+        assert response.status_code == 200
+        response.close()
+    finally:
+        app.download_manager.state.delete('downloads', 'finished:1b')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes do índice de busca do catálogo"""
+
+import pytest
+
+from model_search import SearchIndex, edit_distance
+
+CATALOG = ['llama3:8b', 'llama3.1:70b', 'codellama:7b', 'phi3:mini', 'gemma2:9b', 'mistral:7b', 'qwen2.5:3b']
+
+
+@pytest.fixture(scope='module')
+def index():
+    models = []
+    for pulls, name in enumerate(reversed(CATALOG)):
+        short_name, tag = name.split(':')
+        models.append({'name': name, 'short_name': short_name, 'tag': tag, 'pulls': pulls})
+    return SearchIndex(models)
+
+
+def names(index, query):
+    return {model['name'] for model in index.search(query)[0]}
+
+
+def test_one_character_terms(index):
+    assert names(index, 'l') == {'llama3:8b', 'llama3.1:70b', 'codellama:7b', 'mistral:7b'}
+    assert names(index, '3') == {'llama3:8b', 'llama3.1:70b', 'phi3:mini', 'qwen2.5:3b'}
+    assert names(index, 'q') == {'qwen2.5:3b'}
+
+
+def test_two_character_substring(index):
+    assert names(index, 'll') == {'llama3:8b', 'llama3.1:70b', 'codellama:7b'}
+
+
+def test_typos(index):
+    assert index.search('lamma')[0][0]['name'] == 'llama3:8b'
+    assert 'mistral:7b' in names(index, 'mistrl')
+    assert 'gemma2:9b' in names(index, 'gema')
+
+
+def test_exact_match_ranks_first(index):
+    assert index.search('phi3')[0][0]['name'] == 'phi3:mini'
+    assert index.search('zzzz') == ([], 0)
+
+
+def test_edit_distance_limit():
+    assert edit_distance('lamma', 'llama', 2) == 2
+    assert edit_distance('gemma', 'qwen', 2) == 3
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes do despejo LRU sob o orçamento de memória"""
+
+import json
+import time
+
+import pytest
+
+import app
+import shared_state
+from residency import ResidencyManager
+
+GB = 1024 ** 3
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200, lines=()):
+        self.data = data
+        self.status_code = status_code
+        self.lines = lines
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    """Dois servidores com /api/ps por servidor; registra os descarregamentos"""
+
+    def __init__(self, loaded, sizes, target='http://gpu1'):
+        self.loaded = loaded      # servidor -> modelos carregados
+        self.sizes = sizes
+        self.target = target
+        self.unloaded = []
+        self.chats = []
+
+    def choose(self, model=None, exclude=()):
+        return self.target
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def request(self, method, path, backend=None, **kwargs):
+        body = kwargs.get('json') or {}
+        if path == '/api/ps':
+            models = {}
+            for url, names in self.loaded.items():
+                for name in names:
+                    models.setdefault(name, {'name': name, 'size': self.sizes[name], 'backends': []})
+                    models[name]['backends'].append(url)
+            return FakeResponse({'models': list(models.values())})
+        if path == '/api/tags':
+            return FakeResponse({'models': [{'name': name, 'size': size} for name, size in self.sizes.items()]})
+        if path == '/api/generate' and body.get('keep_alive') == 0:
+            self.unloaded.append((backend, body['model']))
+            self.loaded[backend].remove(body['model'])
+            return FakeResponse({})
+        if path == '/api/show':
+            return FakeResponse({'model_info': {'llama.context_length': 4096}})
+        if path == '/api/chat':
+            self.chats.append(body['model'])
+            self.loaded[self.target].append(body['model'])
+            done = {'message': {'content': 'oi'}, 'done': True, 'eval_count': 1}
+            return FakeResponse({}, lines=[json.dumps(done).encode()])
+        raise AssertionError(f'{method} {path} inesperado')
+
+
+def manager(pool, budget_gb):
+    return ResidencyManager(pool, shared_state.create_backend('memory'), owner=lambda: 'worker',
+                            memory_budget=budget_gb * GB)
+
+
+def test_cold_model_evicts_least_recently_used():
+    pool = FakePool({'http://gpu1': ['old', 'recent'], 'http://gpu2': []},
+                    {'old': 4 * GB, 'recent': 4 * GB, 'cold': 4 * GB})
+    residency = manager(pool, 10)
+    residency.touch('old')
+    time.sleep(0.01)
+    residency.touch('recent')
+    residency.refresh()
+    
+    residency.ensure_room('cold')
+    assert pool.unloaded == [('http://gpu1', 'old')]
+
+
+def test_budget_is_per_backend():
+    # Somados os dois servidores passam do orçamento, mas o de destino tem espaço
+    pool = FakePool({'http://gpu1': ['a'], 'http://gpu2': ['b', 'c']},
+                    {'a': 4 * GB, 'b': 4 * GB, 'c': 4 * GB, 'cold': 4 * GB})
+    residency = manager(pool, 10)
+    residency.ensure_room('cold')
+    assert pool.unloaded == []
+    
+    pool.target = 'http://gpu2'
+    residency.ensure_room('cold')
+    assert [backend for backend, _ in pool.unloaded] == ['http://gpu2']
+
+
+def test_busy_and_resident_models_stay():
+    pool = FakePool({'http://gpu1': ['busy', 'warm'], 'http://gpu2': []},
+                    {'busy': 8 * GB, 'warm': 4 * GB, 'cold': 4 * GB})
+    residency = manager(pool, 10)
+    residency.is_busy = lambda model: model == 'busy'
+    residency.refresh()
+    residency.ensure_room('warm')
+    assert pool.unloaded == []
+    
+    residency.ensure_room('cold')
+    assert pool.unloaded == [('http://gpu1', 'warm')]
+
+
+@pytest.fixture
+def chat_app(monkeypatch):
+    pool = FakePool({'http://gpu1': ['old', 'recent']},
+                    {'old': 4 * GB, 'recent': 4 * GB, 'cold': 4 * GB})
+    info = dict(app.PENDING_CONNECTION_STATE, connected=True, method='api', message='ok',
+                models=list(pool.sizes), digests={})
+    monkeypatch.setattr(app, 'get_connection_info', lambda wait=5: info)
+    monkeypatch.setattr(app.residency, 'client', pool)
+    monkeypatch.setattr(app.residency, 'memory_budget', 10 * GB)
+    monkeypatch.setattr(app.context_manager, 'client', pool)
+    monkeypatch.setattr(app, 'ollama', pool)
+    return pool
+
+
+def test_chat_to_cold_model_evicts_lru(chat_app):
+    app.residency.touch('old')
+    time.sleep(0.01)
+    app.residency.touch('recent')
+    app.residency.refresh()
+    
+    response = app.app.test_client().post('/api/chat', json={'message': 'oi', 'model': 'cold'})
+    assert response.status_code == 200
+    response.get_data()
+    
+    assert chat_app.unloaded == [('http://gpu1', 'old')]
+    assert chat_app.chats == ['cold']
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Copyright (C) 2024 Djalma Valois Filho
+# 
+# This file is part of Ollama_gui.
+# 
+# Ollama_Gui is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# 
+# Ollama_gui is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+# 
+# You should have received a copy of the GNU General Public License
+# along with GitHub Deploy Assistant.  If not, see <https://www.gnu.org/licenses/>.
+
+
+"""Testes do agendador de chat"""
+
+from scheduler import ChatScheduler
+
+
+def test_background_waits_for_queued_chat():
+    scheduler = ChatScheduler(max_concurrent=2, per_model=1)
+    running = scheduler.submit('llama3', 'alice')
+    waiting = scheduler.submit('llama3', 'bob')
+    background = scheduler.submit('phi3', 'batch', background=True)
+    
+    assert running.granted and not waiting.granted
+    assert not background.granted
+    
+    scheduler.release(running)
+    assert waiting.granted and background.granted
+
+
+def test_abandoned_chat_unblocks_background():
+    scheduler = ChatScheduler(max_concurrent=2, per_model=1)
+    running = scheduler.submit('llama3', 'alice')
+    abandoned = scheduler.submit('llama3', 'bob')
+    background = scheduler.submit('phi3', 'batch', background=True)
+    assert not background.granted
+    
+    # Cliente desconectou antes de receber o slot
+    scheduler.release(abandoned)
+    
+    assert background.wait(1)
+    assert running.granted
+    assert scheduler.stats()['models']['llama3']['queued'] == 0
+
+
+def test_round_robin_between_users():
+    scheduler = ChatScheduler(max_concurrent=1, per_model=1)
+    running = scheduler.submit('llama3', 'alice')
+    alice = [scheduler.submit('llama3', 'alice') for _ in range(3)]
+    bob = scheduler.submit('llama3', 'bob')
+    
+    assert scheduler.position(bob) == 2
+    scheduler.release(running)
+    scheduler.release(alice[0])
+    assert bob.granted